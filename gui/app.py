@@ -1,8 +1,12 @@
 import os
 from utils import general_utils as gu
 from utils.weaviate_manager import WeaviateManager
-from utils.ai_utils import get_gemini_response, format_ai_response
-from utils.weaviate_utils import generate_prompt_for_llm
+from utils.ai_utils import GeminiClient
+from utils.course_sync import sync_course
+from utils.query_engine import QueryEngine
+from utils.model_registry import warm_up_embedding_model
+from utils.job_scheduler import JobScheduler, get_current_job, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+from utils.lazy_imports import preload_modules
 import threading 
 from dotenv import load_dotenv
 
@@ -18,6 +22,12 @@ from PyQt6.QtGui import QFont, QIcon
 SCRIPT_DIR_GUI = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT_GUI = os.path.dirname(SCRIPT_DIR_GUI)
 
+# Heavy libraries imported in the background once the first window is on screen
+BACKGROUND_PRELOAD_MODULES = [
+    "weaviate", "weaviate.classes.config", "weaviate.classes.query", "weaviate.classes.aggregate",
+    "google.genai", "nltk", "sentence_transformers"
+]
+
 
 class WelcomeScreen(QWidget):
     token_submitted = pyqtSignal(str)
@@ -325,6 +335,10 @@ class ChatMessageWidget(QWidget):
         self.message_label.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.MinimumExpanding)
         self.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.MinimumExpanding)
 
+    def set_message_text(self, message_text):
+        """Replaces the message content, e.g. while a response is streamed in."""
+        self.message_label.setText(message_text)
+
 
 class ChatScreenWidget(QWidget):
     def __init__(self, parent=None):
@@ -419,6 +433,10 @@ class ChatScreenWidget(QWidget):
             alignment_layout.addStretch(1)
         
         self.chat_layout.addWidget(alignment_container)
+        self.scroll_to_bottom()
+        return message_widget
+
+    def scroll_to_bottom(self):
         QTimer.singleShot(0, lambda: self.scroll_area.verticalScrollBar().setValue(
             self.scroll_area.verticalScrollBar().maximum()
         ))
@@ -434,6 +452,12 @@ class MainWindow(QMainWindow):
     
     # Signal for chat messages from threads
     chat_message_ready = pyqtSignal(str, str, bool) # sender_name, message_text, is_user
+    # Signals for AI responses streamed into a live chat message
+    chat_stream_started = pyqtSignal(int, str) # stream_id, sender_name
+    chat_stream_updated = pyqtSignal(int, str) # stream_id, formatted text so far
+    chat_stream_finished = pyqtSignal(int, str) # stream_id, final formatted text
+    # Signal for background job status changes from the scheduler's worker threads
+    job_status_changed = pyqtSignal(dict) # Job.snapshot()
     
     def __init__(self):
         super().__init__()
@@ -448,6 +472,7 @@ class MainWindow(QMainWindow):
             
         self.canvas_token = None # To store the token
         self.gemini_api_key = None # To store the Gemini API key
+        self.gemini_client = None # Long-lived Gemini client, created once the API key is loaded
         self.selected_course_data = None 
         self.base_url = None # Store base_url
 
@@ -456,6 +481,8 @@ class MainWindow(QMainWindow):
         
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
+        self.jobs_label = QLabel("") # Summary of running background jobs
+        self.status_bar.addPermanentWidget(self.jobs_label)
 
         self.welcome_screen = WelcomeScreen()
         self.course_selection_screen = CourseSelectionScreen(self)
@@ -469,15 +496,36 @@ class MainWindow(QMainWindow):
         self.course_selection_screen.course_selected.connect(self.handle_course_selection)
         self.chat_screen.back_to_courses_button.clicked.connect(self.show_course_selection_screen)
         
+        self._load_env_vars() # Load .env once (VECTOR_BACKEND selects the manager's backend)
         self.weaviate_manager = WeaviateManager(project_root=PROJECT_ROOT_GUI)
         self.weaviate_initialized_for_session = False # Flag to init only once per session
+        self._weaviate_init_lock = threading.Lock() # Init can be requested by several jobs at once
+
+        # Persistent IO/CPU worker pools for all background work
+        self.job_scheduler = JobScheduler()
+        self.job_scheduler.add_listener(self.job_status_changed.emit)
+        self.job_status_changed.connect(self._on_job_status_changed)
         
         self.weaviate_status_update.connect(self.update_status_bar)
         self.chat_message_ready.connect(self._add_message_to_chat_slot)
+        self.chat_stream_started.connect(self._start_streamed_message_slot)
+        self.chat_stream_updated.connect(self._update_streamed_message_slot)
+        self.chat_stream_finished.connect(self._finish_streamed_message_slot)
+        self._streamed_message_widgets = {} # stream_id -> ChatMessageWidget being streamed into
         self.course_processing_finished_signal.connect(self._on_course_processing_finished)
         
-        self._load_env_vars() # Load .env once
+        self.query_engine = QueryEngine(self.weaviate_manager, self.gemini_client, project_root=PROJECT_ROOT_GUI)
         self.check_existing_token_and_load() # Check for canvas token at startup
+        QTimer.singleShot(0, self._start_background_preload) # Runs once the event loop has painted the window
+
+    def _start_background_preload(self):
+        """Imports the heavy libraries and checks the NLTK data in the background so first use is fast."""
+        def preload_target():
+            job = get_current_job()
+            preload_modules(BACKGROUND_PRELOAD_MODULES, should_cancel=lambda: job is not None and job.cancelled)
+            gu.ensure_nltk_punkt()
+
+        self.job_scheduler.submit(preload_target, name="Preload libraries", pool="io", priority=PRIORITY_BACKGROUND)
         
     def _load_env_vars(self):
         """Loads BASE_URL from .env file."""
@@ -493,20 +541,35 @@ class MainWindow(QMainWindow):
             self.gemini_api_key = os.getenv("GEMINI_API_KEY")
             if not self.gemini_api_key:
                 print("[WARNING] GEMINI_API_KEY not found in .env file. AI responses will not be available.")
+            else:
+                # GEMINI_BASE_URL optionally points the client at another endpoint (e.g. a local test server)
+                self.gemini_client = GeminiClient(
+                    self.gemini_api_key,
+                    model_name="gemini-2.0-flash-lite",
+                    base_url=os.getenv("GEMINI_BASE_URL")
+                )
         else:
             print(f"Warning: .env file not found at {dotenv_path}.")
             
     def closeEvent(self, event):
         """Handle window close event."""
         print("MainWindow closing. Shutting down Weaviate service if managed...")
+        self.query_engine.shutdown()
+        self.job_scheduler.shutdown(timeout=2.0)
+        if self.gemini_client:
+            self.gemini_client.close()
         self.weaviate_manager.close_connection() # Close client connection first
         self.weaviate_manager.stop_service() # Stop docker-compose
         event.accept()
 
     def _initialize_weaviate_if_needed(self):
         """Starts Weaviate service, connects client, and ensures schema. Threaded."""
+        with self._weaviate_init_lock:
+            return self._initialize_weaviate_locked()
+
+    def _initialize_weaviate_locked(self):
         if self.weaviate_initialized_for_session:
-            if not self.weaviate_manager.client or not self.weaviate_manager.client.is_ready():
+            if not self.weaviate_manager.is_connected(probe=True):
                 # Attempt to reconnect if client lost connection
                 self.weaviate_status_update.emit("Reconnecting to Weaviate...")
                 if not self.weaviate_manager.connect_client():
@@ -519,7 +582,10 @@ class MainWindow(QMainWindow):
         if not self.weaviate_manager.start_service():
             self.weaviate_status_update.emit("Failed to start Weaviate Docker service.")
             return False
-        self.weaviate_status_update.emit("Weaviate service started. Connecting client...")
+        startup_stats = self.weaviate_manager.startup_stats or {}
+        self.weaviate_status_update.emit(
+            f"Weaviate service ready ({startup_stats.get('mode', 'cold')} start, {startup_stats.get('seconds', 0.0):.2f}s). Connecting client..."
+        )
 
         if not self.weaviate_manager.connect_client():
             self.weaviate_status_update.emit("Failed to connect Weaviate client.")
@@ -545,26 +611,8 @@ class MainWindow(QMainWindow):
         return True
 
     def _run_weaviate_init_threaded(self):
-        thread = threading.Thread(target=self._initialize_weaviate_if_needed, daemon=True)
-        thread.start()
-
-    def _ingest_course_data_threaded(self, course_id):
-        def ingest_task():
-            self.weaviate_status_update.emit(f"Starting data ingestion for course ID: {course_id}...")
-            if self.weaviate_manager.ingest_course_files_and_chunks(course_id):
-                self.weaviate_status_update.emit(f"Successfully ingested data for course ID: {course_id}.")
-            else:
-                self.weaviate_status_update.emit(f"Failed to ingest data for course ID: {course_id}.")
-        
-        # Ensure Weaviate is initialized before ingesting specific course data
-        if not self.weaviate_initialized_for_session:
-            if not self._initialize_weaviate_if_needed(): # This is blocking if called directly
-                 print("Cannot ingest course data: Weaviate initialization failed.")
-                 return
-        
-        thread = threading.Thread(target=ingest_task, daemon=True)
-        thread.start()
-        
+        self.job_scheduler.submit(self._initialize_weaviate_if_needed, name="Start Weaviate", pool="io", priority=PRIORITY_NORMAL)
+
     def check_existing_token_and_load(self):
         """Checks for an existing token and tries to load courses, skipping WelcomeScreen if successful."""
         saved_token_path = os.path.join(PROJECT_ROOT_GUI, "resources", "canvas_token.txt")
@@ -607,8 +655,10 @@ class MainWindow(QMainWindow):
         self.stacked_widget.setCurrentIndex(0)
 
     def show_course_selection_screen(self):
-        # Start Weaviate in a background thread
-        threading.Thread(target=self._initialize_weaviate_if_needed, daemon=True).start()
+        # Answers for the course being left are no longer wanted
+        self.query_engine.cancel_all()
+        # Start Weaviate in the background
+        self._run_weaviate_init_threaded()
     
         self.stacked_widget.setCurrentIndex(1)
             
@@ -635,13 +685,15 @@ class MainWindow(QMainWindow):
             self.show_welcome_screen() # Or some other appropriate action
             return
         
-        # Run the processing in a separate thread
-        thread = threading.Thread(
-            target=self._process_selected_course_thread_target,
-            args=(course_data, self.canvas_token, self.base_url),
-            daemon=True
+        # Only the most recently selected course keeps syncing; this also drops its queued "Sync ingest" page jobs
+        self.job_scheduler.cancel_all(name_prefix="Sync ")
+        self.job_scheduler.submit(
+            self._process_selected_course_thread_target,
+            course_data, self.canvas_token, self.base_url,
+            name=f"Sync {course_name}",
+            pool="io",
+            priority=PRIORITY_BACKGROUND
         )
-        thread.start()
     
     def handle_user_message(self): 
         user_text = self.chat_screen.user_input.text().strip()
@@ -652,60 +704,49 @@ class MainWindow(QMainWindow):
             self.chat_screen.add_message_to_chat("You", user_text, True)
             self.chat_screen.user_input.clear() # Clear input field 
             
-            # Perform search in a thread
-            def search_task():
-                self.weaviate_status_update.emit(f"Searching for: '{user_text}'...")
-                
-                search_limit = 5 # Number of primary results
-                search_context_window = 1 # Neighbors for each primary result
-                
-                results = self.weaviate_manager.search_chunks(
-                    user_text, 
-                    course_id=course_id, 
-                    limit=search_limit, 
-                    context_window=search_context_window
-                ) 
-
-                llm_max_chunks = search_limit * (1 + 2 * search_context_window) 
-                generated_prompt = generate_prompt_for_llm(user_text, results if results else [], max_context_chunks=llm_max_chunks)
-
-                # Check if gemini_api_key is set
-                if not self.gemini_api_key:
-                    self.weaviate_status_update.emit("AI response unavailable (API key missing). Prompt printed to console.")
-                    return 
-                
-                if not generated_prompt:
-                    self.weaviate_status_update.emit("Failed to generate prompt for AI.")
-                    return
-                
-                self.weaviate_status_update.emit("Getting AI response...")
-
-                try:
-                    ai_response_text = get_gemini_response(generated_prompt, self.gemini_api_key, model_name="gemini-2.0-flash-lite")
-                    # ai_response_text = get_dummy_ai_response()
-                    print(f"[AI_RESPONSE] {ai_response_text}") # Print AI response to console for debugging
-                    ai_response_text = format_ai_response(ai_response_text)
-                    
-                    # Display AI response in chat
-                    self.chat_message_ready.emit("Gemini AI", ai_response_text, False)
-                    self.weaviate_status_update.emit("AI response received.")
-                    
-                except Exception as e:
-                    # Fallback, get_gemini_response should return error strings
-                    error_msg = f"Error processing AI response: {e}"
-                    print(f"[GUI_ERROR] {error_msg}") # Or your app's error printing
-                    self.chat_message_ready.emit("System Error", error_msg, False)
-                    self.weaviate_status_update.emit("Error getting AI response.")
-
-
-            search_thread = threading.Thread(target=search_task, daemon=True)
-            search_thread.start()
+            # The query engine answers on its own event loop; a newer question supersedes an unfinished one
+            self.query_engine.submit(
+                user_text,
+                course_id,
+                status_callback=self.weaviate_status_update.emit,
+                stream_started=lambda query_id: self.chat_stream_started.emit(query_id, "Gemini AI"),
+                stream_updated=self.chat_stream_updated.emit,
+                stream_finished=self.chat_stream_finished.emit
+            )
             
     def _add_message_to_chat_slot(self, sender_name: str, message_text: str, is_user: bool):
         """This slot runs in the main GUI thread and safely updates the chat."""
         if self.chat_screen: # Ensure chat_screen exists
             self.chat_screen.add_message_to_chat(sender_name, message_text, is_user)
             
+    def _start_streamed_message_slot(self, stream_id: int, sender_name: str):
+        """Adds an empty bot message that a streamed response is written into."""
+        if self.chat_screen:
+            self._streamed_message_widgets[stream_id] = self.chat_screen.add_message_to_chat(sender_name, "...", False)
+
+    def _update_streamed_message_slot(self, stream_id: int, message_text: str):
+        message_widget = self._streamed_message_widgets.get(stream_id)
+        if message_widget and message_text:
+            message_widget.set_message_text(message_text)
+            self.chat_screen.scroll_to_bottom()
+
+    def _finish_streamed_message_slot(self, stream_id: int, message_text: str):
+        message_widget = self._streamed_message_widgets.pop(stream_id, None)
+        if message_widget:
+            message_widget.set_message_text(message_text or "[No response received]")
+            self.chat_screen.scroll_to_bottom()
+            
+    def _on_job_status_changed(self, job_snapshot: dict):
+        """Shows the running background jobs (and their progress) next to the status bar."""
+        running = [job for job in self.job_scheduler.snapshot() if job["state"] == "running"]
+        parts = []
+        for job in running:
+            progress = f" {job['progress']:.0%}" if job["progress"] is not None else ""
+            parts.append(f"{job['name']}{progress}")
+        self.jobs_label.setText(" | ".join(parts))
+        if job_snapshot["state"] == "failed":
+            self.update_status_bar(f"{job_snapshot['name']} failed: {job_snapshot['error']}")
+
     def update_status_bar(self, message: str):
         """Updates the QStatusBar with the given message."""
         if self.status_bar:
@@ -716,6 +757,8 @@ class MainWindow(QMainWindow):
         """
         This function runs in a worker thread to handle file listing, downloading,
         and triggering Weaviate ingestion for a selected course.
+        Only files that changed on Canvas since the last sync are downloaded and re-indexed,
+        and each page of the file list is ingested on the "cpu" pool while later pages are still being fetched.
         """
         course_id = course_data.get("id")
         course_name = course_data.get("name", "Unknown Course")
@@ -726,29 +769,46 @@ class MainWindow(QMainWindow):
             # Optionally emit a signal to re-enable UI or show error
             return
 
+        # Load the embedding model while files download, so the first question is answered without a cold start
+        self.job_scheduler.submit(warm_up_embedding_model, name="Warm up embedding model", pool="cpu", priority=PRIORITY_INTERACTIVE)
+        job = get_current_job()
+
         headers = {"Authorization": f"Bearer {canvas_token}"}
 
-        self.weaviate_status_update.emit(f"Fetching file list for {course_name}...")
-        print(f"Fetching file list for course ID: {course_id}...")
-        list_result = gu.listCourseMaterial(course_id, base_url, headers)
-
-        if list_result == "Successful":
-            self.weaviate_status_update.emit(f"Downloading materials for {course_name}...")
-            print(f"Successfully got file list for course {course_id}. Now downloading materials...")
-            gu.getCoursePPTXMaterial(course_id, headers)
-            gu.getCoursePDFMaterial(course_id, headers)
-            gu.getCourseDOCXMaterial(course_id, headers)
-            gu.getCourseTXTMaterial(course_id, headers)
+        def report_download_progress(progress: dict):
+            message = (
+                f"Downloading {course_name}: {progress['completed']}/{progress['total']} files "
+                f"({progress['bytes_per_second'] / 1024:.0f} KB/s)"
+            )
+            self.weaviate_status_update.emit(message)
+            if job:
+                job.report(progress["completed"] / max(progress["total"], 1), message)
+
+        def on_downloads_finished():
             self.weaviate_status_update.emit(f"Downloads complete for {course_name}.")
             print(f"Finished attempting to download materials for course {course_id}.")
+            # Ingestion keeps running in the background while the user starts chatting
+            self.course_processing_finished_signal.emit(course_data)
+
+        self.weaviate_status_update.emit(f"Syncing {course_name} with Canvas...")
+        summary = sync_course(
+            self.weaviate_manager,
+            course_id,
+            base_url,
+            headers,
+            download_progress_callback=report_download_progress,
+            on_downloads_finished=on_downloads_finished,
+            ensure_index_ready=self._initialize_weaviate_if_needed,
+            status_callback=self.weaviate_status_update.emit,
+            should_cancel=(lambda: job.cancelled) if job else None,
+            job_scheduler=self.job_scheduler
+        )
 
-            # Trigger Weaviate ingestion 
-            self._ingest_course_data_threaded(course_id)
-        else:
-            self.weaviate_status_update.emit(f"Failed to get file list for {course_name}. Skipping downloads & ingestion.")
-            print(f"Failed to get file list for course {course_id}. Skipping material download and Weaviate ops.")
-        
-        self.course_processing_finished_signal.emit(course_data)
+        if summary["cancelled"]:
+            return
+        if summary["list_result"] != "Successful":
+            self.weaviate_status_update.emit(f"Failed to get the full file list for {course_name}. Only fetched pages were synced.")
+            print(f"Failed to get the full file list for course {course_id}. Only files from fetched pages were synced.")
         
     def _on_course_processing_finished(self, course_data: dict):
         """
@@ -5,8 +5,18 @@ import os
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
-    
+
+# --- Optional startup profiling (python main.py --profile-startup) ---
+PROFILE_STARTUP = "--profile-startup" in sys.argv or os.environ.get("COURSE_COMPASS_PROFILE_STARTUP") == "1"
+if "--profile-startup" in sys.argv:
+    sys.argv.remove("--profile-startup")
+startup_profiler = None
+if PROFILE_STARTUP:
+    from utils.lazy_imports import ImportProfiler
+    startup_profiler = ImportProfiler().start()
+
 from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
 from gui.app import MainWindow
 
 
@@ -32,6 +42,13 @@ def run_application():
     main_window = MainWindow()
     main_window.show()
 
+    if startup_profiler:
+        # Fires once the event loop has painted the first window
+        def report_startup():
+            startup_profiler.stop()
+            startup_profiler.report(label="First window shown")
+        QTimer.singleShot(0, report_startup)
+
     sys.exit(app.exec())
 
 
@@ -0,0 +1,49 @@
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import general_utils
+from utils import model_registry
+
+FAKE_EMBEDDING_DIMENSIONS = 16
+
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for the SentenceTransformer: a hashed bag of words, so texts sharing words are close."""
+
+    device = "cpu"
+
+    def get_sentence_embedding_dimension(self):
+        return FAKE_EMBEDDING_DIMENSIONS
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(FAKE_EMBEDDING_DIMENSIONS, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector += np.random.default_rng(zlib.crc32(word.encode("utf-8"))).normal(size=FAKE_EMBEDDING_DIMENSIONS)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self._embed(texts)
+        return np.array([self._embed(text) for text in texts], dtype=np.float32).reshape(len(texts), FAKE_EMBEDDING_DIMENSIONS)
+
+    def tokenizer(self, sentences, add_special_tokens=False):
+        return {"input_ids": [sentence.split() for sentence in sentences]}
+
+
+@pytest.fixture(autouse=True)
+def fake_embedding_model(monkeypatch):
+    """Replaces the embedding model and NLTK sentence splitting so tests run offline."""
+    import nltk
+    monkeypatch.setitem(model_registry._models, (model_registry.DEFAULT_EMBEDDING_MODEL, None), FakeEmbeddingModel())
+    monkeypatch.setattr(general_utils, "ensure_nltk_punkt", lambda: True)
+    monkeypatch.setattr(nltk, "sent_tokenize", lambda text: [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s])
+    monkeypatch.delenv("VECTOR_QUANTIZATION", raising=False)
+    monkeypatch.delenv("VECTOR_BACKEND", raising=False)
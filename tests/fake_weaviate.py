@@ -0,0 +1,173 @@
+import re
+import types
+
+import numpy as np
+
+from utils import hybrid_fusion
+
+
+class FakeObject:
+    def __init__(self, uuid: str, properties: dict, vector=None, score: float = None):
+        self.uuid = uuid
+        self.properties = properties
+        self.vector = vector
+        self.metadata = types.SimpleNamespace(score=score)
+
+
+def matches(obj: FakeObject, filters) -> bool:
+    """Evaluates the weaviate.classes.query filters the app builds: all_of/& of equal and contains_any."""
+    if filters is None:
+        return True
+    if hasattr(filters, "filters"):
+        return all(matches(obj, sub_filter) for sub_filter in filters.filters)
+    value = obj.uuid if filters.target == "_id" else obj.properties.get(filters.target)
+    if filters.operator.name == "EQUAL":
+        return str(value) == str(filters.value) if filters.target == "_id" else value == filters.value
+    if filters.operator.name == "CONTAINS_ANY":
+        return str(value) in {str(item) for item in filters.value} if filters.target == "_id" else value in filters.value
+    raise NotImplementedError(f"Fake filter operator {filters.operator}")
+
+
+class FakeBatch:
+    """
+    Like the real client, objects the server rejects are counted live in number_errors but only
+    show up in the manager's failed_objects once the batch closes. Objects whose file_id is in
+    collection.reject_file_ids fail when added; those in collection.reject_on_close_file_ids are
+    stored but then rejected by the final flush when the batch closes.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.collection = manager.collection
+        self.failed_objects = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for uuid, obj in list(self.collection.objects.items()):
+            if obj.properties.get("file_id") in self.collection.reject_on_close_file_ids:
+                del self.collection.objects[uuid]
+                self.failed_objects.append(failed_object(obj.properties, uuid))
+        self.manager.failed_objects = self.failed_objects
+        return False
+
+    @property
+    def number_errors(self) -> int:
+        return len(self.failed_objects)
+
+    def add_object(self, properties, uuid=None, vector=None):
+        if properties.get("file_id") in self.collection.reject_file_ids:
+            self.failed_objects.append(failed_object(properties, uuid))
+            return
+        vector = None if vector is None else np.asarray(vector, dtype=np.float32)
+        self.collection.objects[str(uuid)] = FakeObject(str(uuid), dict(properties), vector)
+
+    def flush(self):
+        pass
+
+
+def failed_object(properties: dict, uuid) -> types.SimpleNamespace:
+    return types.SimpleNamespace(message="rejected", object_=types.SimpleNamespace(properties=dict(properties), uuid=uuid))
+
+
+class FakeBatchManager:
+    def __init__(self, collection):
+        self.collection = collection
+        self.failed_objects = [] # Failures of the last closed batch
+
+    def dynamic(self):
+        return FakeBatch(self)
+
+
+class FakeData:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def delete_many(self, where):
+        doomed = [uuid for uuid, obj in self.collection.objects.items() if matches(obj, where)]
+        for uuid in doomed:
+            del self.collection.objects[uuid]
+        return types.SimpleNamespace(successful=len(doomed))
+
+
+class FakeAggregate:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def over_all(self, filters=None, group_by=None, total_count=False):
+        counts = {}
+        for obj in self.collection.objects.values():
+            if matches(obj, filters):
+                group = obj.properties.get(group_by.prop)
+                counts[group] = counts.get(group, 0) + 1
+        return types.SimpleNamespace(groups=[
+            types.SimpleNamespace(grouped_by=types.SimpleNamespace(value=group), total_count=count)
+            for group, count in counts.items()
+        ])
+
+
+class FakeQuery:
+    """Hybrid search over the stored objects: cosine similarity fused with a term-overlap keyword score."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def fetch_objects(self, filters=None, limit=None):
+        objects = [obj for obj in self.collection.objects.values() if matches(obj, filters)]
+        return types.SimpleNamespace(objects=objects[:limit])
+
+    def hybrid(self, query, vector=None, alpha=0.5, fusion_type=None, limit=10, filters=None, return_metadata=None):
+        objects = [obj for obj in self.collection.objects.values() if matches(obj, filters)]
+        query_vector = np.asarray(vector, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        by_vector = sorted(objects, key=lambda obj: -float(obj.vector @ query_vector) / max(float(np.linalg.norm(obj.vector)), 1e-12))
+        terms = set(re.findall(r"\w+", query.lower()))
+        keyword_scores = {obj.uuid: len(terms & set(re.findall(r"\w+", obj.properties["chunk_text"].lower()))) for obj in objects}
+        by_keyword = sorted((obj for obj in objects if keyword_scores[obj.uuid]), key=lambda obj: -keyword_scores[obj.uuid])
+        result_lists = [
+            ([obj.uuid for obj in by_vector], [float(obj.vector @ query_vector) for obj in by_vector]),
+            ([obj.uuid for obj in by_keyword], [keyword_scores[obj.uuid] for obj in by_keyword]),
+        ]
+        fusion = hybrid_fusion.FUSION_RRF if getattr(fusion_type, "name", "") == "RANKED" else hybrid_fusion.FUSION_RELATIVE_SCORE
+        uuids, scores = hybrid_fusion.fuse_results(result_lists, [alpha, 1 - alpha], limit, fusion)
+        stored = self.collection.objects
+        return types.SimpleNamespace(objects=[
+            FakeObject(uuid, stored[uuid].properties, stored[uuid].vector, score) for uuid, score in zip(uuids, scores)
+        ])
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.objects = {} # uuid -> FakeObject
+        self.reject_file_ids = set()
+        self.reject_on_close_file_ids = set()
+        self.batch = FakeBatchManager(self)
+        self.data = FakeData(self)
+        self.aggregate = FakeAggregate(self)
+        self.query = FakeQuery(self)
+
+
+class FakeCollections:
+    def __init__(self):
+        self.collections = {}
+
+    def get(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection(name))
+
+    def exists(self, name: str) -> bool:
+        return name in self.collections
+
+
+class FakeWeaviateClient:
+    """In-memory stand-in for the parts of the Weaviate v4 client that the vector store uses."""
+
+    def __init__(self):
+        self.collections = FakeCollections()
+
+    def is_ready(self) -> bool:
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from utils.answer_cache import AnswerCache
+
+
+def test_hits_are_kept_in_memory_until_close(tmp_path):
+    cache = AnswerCache(str(tmp_path))
+    cache.store("What is osmosis?", np.array([1.0, 0.0]), "Diffusion of water.", "v1")
+    saved_at = os.stat(cache.path).st_mtime_ns
+    os.utime(cache.path, ns=(saved_at - 10**9, saved_at - 10**9))
+
+    for _ in range(3):
+        assert cache.lookup(np.array([1.0, 0.01]), "v1") == "Diffusion of water."
+    assert cache.lookup(np.array([0.0, 1.0]), "v1") is None
+    assert os.stat(cache.path).st_mtime_ns == saved_at - 10**9 # No disk write on the lookup path
+    assert AnswerCache(str(tmp_path)).entries[0]["hits"] == 0
+
+    cache.close()
+    reloaded = AnswerCache(str(tmp_path))
+    assert reloaded.entries[0]["hits"] == 3
+    assert reloaded.get_stats()["hits"] == 3 and reloaded.get_stats()["misses"] == 1
+
+
+def test_eviction_on_lookup_is_persisted(tmp_path):
+    cache = AnswerCache(str(tmp_path))
+    cache.store("What is osmosis?", np.array([1.0, 0.0]), "Diffusion of water.", "v1")
+    assert cache.lookup(np.array([1.0, 0.0]), "v2") is None # A new index version drops the entry
+    assert AnswerCache(str(tmp_path)).entries == []
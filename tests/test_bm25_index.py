@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from utils.bm25_index import BM25Index, tokenize
+
+
+def build_index() -> BM25Index:
+    index = BM25Index()
+    index.add(1, "Le Café naïve de Straße")
+    index.add(2, "東京大学 の 講義 ノート")
+    index.add(3, "Ωμέγα snake_case identifiers")
+    index.add(4, "plain ascii cafe notes")
+    return index
+
+
+def test_tokenize_keeps_unicode_words():
+    assert tokenize("Le Café naïve, STRASSE 東京大学 ΩΜΈΓΑ x2") == ["le", "café", "naïve", "strasse", "東京大学", "ωμέγα", "x2"]
+    assert tokenize("snake_case C++ e-mail") == ["snake", "case", "c", "e", "mail"]
+
+
+@pytest.mark.parametrize("query, doc_id", [
+    ("CAFÉ", 1), ("naïve", 1), ("straße", 1), ("東京大学", 2), ("講義", 2), ("ωμέγα", 3), ("snake", 3), ("cafe", 4),
+])
+def test_search_matches_non_ascii_terms(query, doc_id):
+    doc_ids, _ = build_index().search(query)
+    assert doc_ids.tolist() == [doc_id]
+
+
+def test_save_and_load_non_ascii_terms(tmp_path):
+    index = build_index()
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded is not None and len(loaded) == len(index)
+    for query in ("café", "東京大学", "ωμέγα"):
+        assert loaded.search(query)[0].tolist() == index.search(query)[0].tolist()
+
+
+def test_load_rejects_index_from_another_tokenizer(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    build_index().save(path)
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files if name != "tokenizer_version"}
+    np.savez(path, **arrays)
+    assert BM25Index.load(path) is None
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import types
+
+import pytest
+
+from utils import course_sync
+from utils import general_utils as gu
+from utils import weaviate_utils as wu
+from utils.job_scheduler import JobScheduler
+from utils.local_vector_store import LocalVectorStore
+
+COURSE_ID = 7
+
+
+def canvas_file(file_id: int, content: str) -> dict:
+    return {"id": file_id, "uuid": f"canvas-{file_id}", "display_name": f"notes{file_id}.txt", "mime_class": "text",
+            "filename": f"notes{file_id}.txt", "url": f"https://canvas.test/{file_id}", "size": len(content),
+            "created_at": "", "modified_at": content, "content": content}
+
+
+class FakeManager:
+    """Records index writes; ingestion reports every file fully indexed except the ones in failing_ids."""
+
+    def __init__(self, project_root: str):
+        self.project_root = project_root
+        self.failing_ids = set()
+        self.ingested = []
+        self.deleted = []
+
+    def ingest_course_files_and_chunks(self, course_id: int, files_metadata: list = None) -> set:
+        file_ids = {file_info["id"] for file_info in files_metadata}
+        self.ingested.append((sorted(file_ids), threading.current_thread().name))
+        return file_ids - self.failing_ids
+
+    def delete_file_chunks(self, course_id: int, file_ids: list) -> bool:
+        self.deleted.append(sorted(file_ids))
+        return True
+
+    def remove_course_files(self, course_id: int, file_ids: list) -> bool:
+        return True
+
+
+class StoreManager(FakeManager):
+    """Ingests through the real pipeline into a LocalVectorStore."""
+
+    def __init__(self, project_root: str):
+        super().__init__(project_root)
+        self.store = LocalVectorStore(project_root)
+        self.store.connect()
+
+    def ingest_course_files_and_chunks(self, course_id: int, files_metadata: list = None) -> set:
+        super().ingest_course_files_and_chunks(course_id, files_metadata)
+        return self.store.insert_files(wu.prepare_file_list_for_weaviate(files_metadata, course_id, self.project_root), course_id)
+
+
+@pytest.fixture
+def canvas(tmp_path, monkeypatch):
+    """Serves a one-page Canvas file list; "downloads" write the listed content, taking download_delay seconds each."""
+    listed = []
+    contents = {}
+    download_delay = [0.0]
+
+    def fake_download_course_file(filename, download_url, full_save_path, headers, session=None, overwrite=False):
+        if os.path.exists(full_save_path) and not overwrite:
+            return "File already exists"
+        time.sleep(download_delay[0])
+        with open(full_save_path, "w", encoding="utf-8") as file:
+            file.write(contents[download_url])
+        return "Successful"
+
+    def fake_list_course_material(course_id, base_url, headers, on_page=None, session=None):
+        contents.update((file_info["url"], file_info["content"]) for file_info in listed)
+        on_page(list(listed))
+        return "Successful"
+
+    monkeypatch.setattr(gu, "PROJECT_ROOT_FROM_UTILS", str(tmp_path))
+    monkeypatch.setattr(gu, "downloadCourseFile", fake_download_course_file)
+    monkeypatch.setattr(gu, "listCourseMaterial", fake_list_course_material)
+    return types.SimpleNamespace(files=listed, download_delay=download_delay)
+
+
+def sync(manager, **options):
+    return course_sync.sync_course(manager, COURSE_ID, "https://canvas.test", {}, project_root=manager.project_root, **options)
+
+
+def test_files_that_fail_to_ingest_are_retried(tmp_path, canvas):
+    manager = FakeManager(str(tmp_path))
+    canvas.files[:] = [canvas_file(1, "first"), canvas_file(2, "second")]
+    manager.failing_ids = {2}
+    summary = sync(manager)
+    assert summary["added"] == [1] and summary["failed"] == [2]
+    assert manager.deleted == [[2]] # Partly written chunks are dropped
+    manifest = course_sync.SyncManifest(os.path.join(str(tmp_path), "Courses", str(COURSE_ID)))
+    assert manifest.file_ids() == {1}
+
+    manager.failing_ids = set()
+    summary = sync(manager)
+    assert summary["unchanged"] == [1] and summary["added"] == [2] and summary["failed"] == []
+
+
+def test_modified_file_that_fails_stays_modified_until_indexed(tmp_path, canvas):
+    manager = FakeManager(str(tmp_path))
+    canvas.files[:] = [canvas_file(1, "first")]
+    sync(manager)
+
+    canvas.files[:] = [canvas_file(1, "first, edited")]
+    manager.failing_ids = {1}
+    summary = sync(manager)
+    assert summary["failed"] == [1] and summary["modified"] == []
+
+    manager.failing_ids = set()
+    summary = sync(manager)
+    assert summary["added"] == [1] and summary["failed"] == []
+
+
+def test_pages_are_ingested_on_the_cpu_pool(tmp_path, canvas):
+    manager = FakeManager(str(tmp_path))
+    canvas.files[:] = [canvas_file(1, "first"), canvas_file(2, "second")]
+    scheduler = JobScheduler(io_workers=1, cpu_workers=2)
+    jobs = []
+    scheduler.add_listener(lambda job: jobs.append((job["name"], job["pool"], job["state"])))
+    try:
+        summary = sync(manager, job_scheduler=scheduler)
+    finally:
+        scheduler.shutdown()
+    assert summary["added"] == [1, 2]
+    assert [thread_name.startswith("cpu-worker") for _, thread_name in manager.ingested] == [True]
+    assert (f"Sync ingest: course {COURSE_ID} page 1", "cpu", "done") in jobs
+
+
+def test_cancel_drops_pending_downloads(tmp_path, canvas):
+    manager = FakeManager(str(tmp_path))
+    canvas.files[:] = [canvas_file(file_id, f"content {file_id}") for file_id in range(1, 21)]
+    canvas.download_delay[0] = 0.5
+    started_at = time.monotonic()
+    summary = sync(manager, should_cancel=lambda: time.monotonic() - started_at > 0.3)
+    assert summary["cancelled"]
+    assert time.monotonic() - started_at < 1.5 # All 20 downloads on 4 threads would take 2.5 s
+    assert manager.ingested == []
+    downloaded = os.listdir(os.path.join(str(tmp_path), "Courses", str(COURSE_ID)))
+    assert 0 < len([name for name in downloaded if name.startswith("notes")]) < 20
+
+
+def test_file_without_text_is_indexed_once(tmp_path, canvas):
+    manager = StoreManager(str(tmp_path))
+    canvas.files[:] = [canvas_file(1, "Lecture one covers osmosis."), canvas_file(2, "")]
+    try:
+        summary = sync(manager)
+        assert summary["added"] == [1, 2] and summary["failed"] == []
+
+        summary = sync(manager)
+        assert summary["unchanged"] == [1, 2] and summary["failed"] == []
+        assert manager.deleted == []
+    finally:
+        manager.store.close()
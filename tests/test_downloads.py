@@ -0,0 +1,43 @@
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+from utils import general_utils as gu
+
+
+class StallingHandler(http.server.BaseHTTPRequestHandler):
+    """Sends half of a file and then stops sending without closing the connection."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2000")
+        self.end_headers()
+        self.wfile.write(b"x" * 1000)
+        self.wfile.flush()
+        self.server.release.wait(5)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stalling_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StallingHandler)
+    server.daemon_threads = True
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/file.pdf"
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_stalled_download_times_out_and_leaves_no_partial_file(tmp_path, stalling_server):
+    save_path = str(tmp_path / "file.pdf")
+    started_at = time.monotonic()
+    assert gu.downloadCourseFile("file.pdf", stalling_server, save_path, {}, timeout=(2, 0.5)) == "ERROR"
+    assert time.monotonic() - started_at < 3
+    assert os.listdir(str(tmp_path)) == []
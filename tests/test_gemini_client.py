@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.ai_utils import GeminiClient
+
+
+class FakeGeminiServer:
+    """
+    Local stand-in for the Gemini REST API. Each route pops its next (status, body) from a script
+    (200 with a canned reply once the script is empty) and every request is logged.
+    """
+
+    def __init__(self):
+        self.scripts = {"generate": [], "cache": []}
+        self.requests = [] # (route, request body)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                route = "cache" if "cachedContents" in self.path else "generate"
+                server.requests.append((route, body))
+                status, reply = server.scripts[route].pop(0) if server.scripts[route] else (200, None)
+                if status != 200:
+                    return self.send_json(status, {"error": {"code": status, "message": reply or "scripted error", "status": "ERROR"}})
+                if route == "cache":
+                    return self.send_json(200, {"name": "cachedContents/fake", "model": "models/fake"})
+                candidate = {"candidates": [{"content": {"parts": [{"text": "hello"}], "role": "model"}}]}
+                if "stream" in self.path:
+                    data = f"data: {json.dumps(candidate)}\r\n\r\n".encode("utf-8")
+                    return self.send_bytes(200, "text/event-stream", data)
+                self.send_json(200, candidate)
+
+            def do_DELETE(self):
+                server.requests.append(("delete", None))
+                self.send_json(200, {})
+
+            def send_json(self, status, payload):
+                self.send_bytes(status, "application/json", json.dumps(payload).encode("utf-8"))
+
+            def send_bytes(self, status, content_type, data):
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/"
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def routes(self) -> list:
+        return [route for route, _ in self.requests]
+
+    def generate_bodies(self) -> list:
+        return [body for route, body in self.requests if route == "generate"]
+
+
+@pytest.fixture
+def server():
+    fake_server = FakeGeminiServer()
+    yield fake_server
+    fake_server.httpd.shutdown()
+
+
+def make_client(server, **options) -> GeminiClient:
+    options = {"backoff_seconds": 0.01, "timeout_seconds": 5, "use_context_cache": False, **options}
+    return GeminiClient("test-key", model_name="fake", base_url=server.url, **options)
+
+
+@pytest.mark.parametrize("status", [408, 429, 503])
+def test_transient_errors_are_retried(server, status):
+    server.scripts["generate"] = [(status, None), (status, None)]
+    client = make_client(server)
+    assert client.generate("question") == "hello"
+    assert server.routes() == ["generate"] * 3
+    client.close()
+
+
+def test_retries_give_up_after_max_retries(server):
+    server.scripts["generate"] = [(503, None)] * 3
+    client = make_client(server, max_retries=2)
+    assert client.generate("question").startswith("Error communicating with Gemini API")
+    assert server.routes() == ["generate"] * 3
+    client.close()
+
+
+def test_client_errors_are_not_retried(server):
+    server.scripts["generate"] = [(400, "bad request")]
+    client = make_client(server)
+    assert client.generate("question").startswith("Error communicating with Gemini API")
+    assert server.routes() == ["generate"]
+    client.close()
+
+
+def test_cached_instruction_is_referenced(server):
+    client = make_client(server, use_context_cache=True)
+    assert client.generate("one") == "hello" and client.generate("two") == "hello"
+    assert server.routes() == ["cache", "generate", "generate"]
+    assert all(body.get("cachedContent") == "cachedContents/fake" and "systemInstruction" not in body for body in server.generate_bodies())
+    client.close()
+    assert server.routes()[-1] == "delete"
+
+
+def test_unsupported_cache_falls_back_to_inline_instruction(server):
+    server.scripts["cache"] = [(400, "Cached content is too small")]
+    client = make_client(server, use_context_cache=True)
+    assert client.generate("one") == "hello" and client.generate("two") == "hello"
+    assert not client.use_context_cache
+    assert server.routes() == ["cache", "generate", "generate"] # Never asks for a cache again
+    assert all("systemInstruction" in body and "cachedContent" not in body for body in server.generate_bodies())
+    client.close()
+
+
+def test_transient_cache_failure_keeps_caching_enabled(server):
+    server.scripts["cache"] = [(503, None)]
+    client = make_client(server, use_context_cache=True, cache_retry_seconds=0)
+    assert client.generate("one") == "hello"
+    assert client.use_context_cache
+    assert "systemInstruction" in server.generate_bodies()[0]
+    assert client.generate("two") == "hello"
+    assert server.routes() == ["cache", "generate", "cache", "generate"]
+    assert server.generate_bodies()[1].get("cachedContent") == "cachedContents/fake"
+    client.close()
+
+
+def test_close_closes_sync_and_async_connections(server):
+    client = make_client(server)
+    assert client.stream("question") == "hello"
+    assert asyncio.run(client.astream("question")) == "hello"
+    http_client, async_http_client = client._http_clients()
+    client.close()
+    assert http_client.is_closed and async_http_client.is_closed
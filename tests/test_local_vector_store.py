@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+import pytest
+
+from utils.local_vector_store import LocalVectorStore
+
+
+def make_items(course_id: int, file_id: int, num_chunks: int) -> list:
+    return [{
+        "uuid": f"{file_id}_{chunk_index}",
+        "properties": {
+            "chunk_text": f"file{file_id} chunk{chunk_index} topic{chunk_index % 7}",
+            "chunk_index": chunk_index,
+            "file_id": file_id,
+            "course_id": course_id,
+            "file_name": f"f{file_id}.txt",
+            "source_location": "",
+        },
+    } for chunk_index in range(num_chunks)]
+
+
+def write_files(store: LocalVectorStore, course_id: int, file_ids: list, num_chunks: int = 40):
+    rng = np.random.default_rng(0)
+    store.upsert_files([{"file_id": file_id, "filename": f"f{file_id}.txt"} for file_id in file_ids], course_id)
+    with store.chunk_writer() as write:
+        for file_id in file_ids:
+            vectors = rng.normal(size=(num_chunks, 16)).astype(np.float32)
+            assert write({"file_id": file_id, "filename": f"f{file_id}.txt"}, make_items(course_id, file_id, num_chunks), vectors) == 0
+
+
+@pytest.mark.parametrize("search_mode", ["exact", "ivf"])
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_search_after_reopen_with_dead_tail_rows(tmp_path, quantization, search_mode):
+    options = dict(quantization=quantization, quantize_min_rows=1, search_mode=search_mode, ivf_min_rows=1)
+    store = LocalVectorStore(str(tmp_path), **options)
+    store.connect()
+    write_files(store, 7, [1, 2])
+    store.train_indexes(7)
+    assert store.search("topic3", course_id=7, limit=5, alpha_hybrid=1.0, context_window=0)
+    store.delete_file_chunks(7, [2]) # The last rows of the vector file are now dead
+    store.close()
+
+    reopened = LocalVectorStore(str(tmp_path), **options)
+    reopened.connect()
+    results = reopened.search("topic3", course_id=7, limit=5, alpha_hybrid=1.0, context_window=0)
+    assert results and all(chunk.properties["file_id"] == 1 for chunk in results)
+    reopened.close()
+
+
+def test_train_indexes_trains_quantizer_and_ivf(tmp_path):
+    store = LocalVectorStore(str(tmp_path), quantization="int8", quantize_min_rows=1, search_mode="ivf")
+    store.connect()
+    write_files(store, 7, [1, 2])
+    assert store.train_indexes(7)
+    course_vectors = store._course_vectors(7)
+    assert course_vectors.quantizer is not None and course_vectors.centroids is not None
+    assert course_vectors.num_code_rows == course_vectors.num_rows == len(course_vectors.assignments)
+    assert not store.train_indexes(7) # Nothing left to train
+
+    write_files(store, 7, [3]) # Appended rows are encoded and assigned as they arrive
+    assert course_vectors.num_code_rows == course_vectors.num_rows == len(course_vectors.assignments)
+    store.close()
+
+
+def test_search_trains_in_background(tmp_path):
+    store = LocalVectorStore(str(tmp_path), quantization="int8", quantize_min_rows=1, search_mode="exact")
+    store.connect()
+    write_files(store, 7, [1, 2])
+    assert store.search("topic3", course_id=7, limit=5, alpha_hybrid=1.0, context_window=0)
+    course_vectors = store._course_vectors(7)
+    deadline = time.time() + 10
+    while course_vectors.quantizer is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert course_vectors.quantizer is not None
+    assert store.search("topic3", course_id=7, limit=5, alpha_hybrid=1.0, context_window=0)
+    store.close()
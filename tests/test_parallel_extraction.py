@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from utils import general_utils
+
+
+def fake_extract_text_segments(file_path: str) -> list:
+    """Kills its worker process for files named crash*, like a segfaulting PDF parser."""
+    if os.path.basename(file_path).startswith("crash"):
+        os._exit(1)
+    return [(f"text of {file_path}", "")]
+
+
+@pytest.fixture
+def fake_extractor(monkeypatch):
+    # Workers are forked, so they see the patched module attribute
+    monkeypatch.setattr(general_utils, "extract_text_segments", fake_extract_text_segments)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_worker_crash_does_not_drop_the_other_files(fake_extractor, max_workers):
+    names = ["a", "b", "crash1", "c", "d", "e", "crash2", "f", "g"]
+    results = dict(general_utils.iter_extract_text_parallel([(name, name) for name in names], max_workers=max_workers))
+    assert sorted(results) == sorted(names)
+    for name in names:
+        assert results[name] == (None if name.startswith("crash") else [(f"text of {name}", "")])
@@ -0,0 +1,172 @@
+import os
+
+import pytest
+
+from utils import weaviate_utils as wu
+from utils.chunk_store import get_chunk_store
+from utils.local_vector_store import LocalVectorStore
+from utils.vector_store import WeaviateVectorStore
+
+from fake_weaviate import FakeWeaviateClient
+
+COURSE_ID = 7
+TOPICS = ["photosynthesis", "mitochondria", "osmosis", "enzymes", "ribosomes", "chloroplasts", "glycolysis"]
+
+
+def file_text(file_id: int) -> str:
+    return " ".join(
+        f"Lecture{file_id} covers {TOPICS[(file_id + part) % len(TOPICS)]} with example{file_id}x{part}."
+        for part in range(12)
+    )
+
+
+def write_course_files(project_root: str, file_ids: list) -> list:
+    course_dir = wu.get_course_dir(COURSE_ID, project_root)
+    os.makedirs(course_dir, exist_ok=True)
+    files_raw = []
+    for file_id in file_ids:
+        filename = f"lecture{file_id}.txt"
+        with open(os.path.join(course_dir, filename), "w", encoding="utf-8") as file:
+            file.write(file_text(file_id))
+        files_raw.append({
+            "id": file_id, "uuid": f"canvas-{file_id}", "display_name": filename, "mime_class": "text", "url": "",
+            "size": 0, "created_at": "", "modified_at": "", "filename": filename,
+        })
+    return wu.prepare_file_list_for_weaviate(files_raw, COURSE_ID, project_root)
+
+
+class WeaviateBackend:
+    """Opens WeaviateVectorStores on one fake server, so "reopening" keeps the data like a real container."""
+
+    def __init__(self, project_root: str):
+        self.project_root = project_root
+        self.client = FakeWeaviateClient()
+
+    def open(self):
+        store = WeaviateVectorStore(lambda: self.client, self.project_root)
+        store.connect()
+        return store
+
+
+class LocalBackend:
+    def __init__(self, project_root: str):
+        self.project_root = project_root
+
+    def open(self):
+        store = LocalVectorStore(self.project_root)
+        store.connect()
+        return store
+
+
+@pytest.fixture
+def backends(tmp_path):
+    """Both backends, each with the same course files under its own project root."""
+    opened = {}
+    for name, backend_class in (("weaviate", WeaviateBackend), ("local", LocalBackend)):
+        backend = backend_class(str(tmp_path / name))
+        store = backend.open()
+        store.insert_files(write_course_files(backend.project_root, [1, 2, 3]), COURSE_ID)
+        opened[name] = (backend, store)
+    yield opened
+    for _, store in opened.values():
+        store.close()
+
+
+def search_uuids(store, query: str, **options) -> list:
+    return [str(chunk.uuid) for chunk in store.search(query, course_id=COURSE_ID, **options)]
+
+
+def assert_same_results(backends, query: str, ordered: bool, **options):
+    results = {name: search_uuids(store, query, **options) for name, (_, store) in backends.items()}
+    assert results["weaviate"], f"No results for '{query}'"
+    if ordered:
+        assert results["weaviate"] == results["local"]
+    else:
+        assert set(results["weaviate"]) == set(results["local"])
+    return results["weaviate"]
+
+
+def file_ids_of(store, query: str, **options) -> set:
+    return {chunk.properties["file_id"] for chunk in store.search(query, course_id=COURSE_ID, **options)}
+
+
+def test_insert_stores_the_same_chunks(backends):
+    weaviate_backend, _ = backends["weaviate"]
+    _, local_store = backends["local"]
+    chunk_counts = wu.get_chunk_counts_by_file(weaviate_backend.client, COURSE_ID)
+    assert sorted(chunk_counts) == [1, 2, 3] and min(chunk_counts.values()) > 1
+    assert local_store.get_chunk_counts(COURSE_ID, [1, 2, 3]) == chunk_counts
+    # A search for every chunk returns the same chunk UUIDs from both backends
+    assert_same_results(backends, "covers", ordered=False, limit=sum(chunk_counts.values()), alpha_hybrid=1.0, context_window=0)
+
+
+@pytest.mark.parametrize("query", ["mitochondria", "lecture2 covers osmosis"])
+def test_vector_search_matches(backends, query):
+    assert_same_results(backends, query, ordered=True, limit=5, alpha_hybrid=1.0, context_window=0)
+
+
+def test_keyword_search_matches(backends):
+    # example2x5 occurs in exactly one chunk, so both keyword rankings return just that chunk
+    uuids = assert_same_results(backends, "example2x5", ordered=False, limit=5, alpha_hybrid=0.0, context_window=0)
+    assert len(uuids) == 1
+
+
+def test_context_window_matches(backends):
+    assert_same_results(backends, "glycolysis example3x2", ordered=False, limit=2, alpha_hybrid=1.0, context_window=1)
+
+
+def test_delete_then_search_and_reopen(backends):
+    for name, (backend, store) in backends.items():
+        assert store.delete_file_chunks(COURSE_ID, [2]) > 0, name
+        assert 2 not in file_ids_of(store, "lecture2 covers osmosis", limit=10, alpha_hybrid=0.5, context_window=1), name
+        assert not store.search("example2x5", course_id=COURSE_ID, limit=5, alpha_hybrid=0.0, context_window=0), name
+    before = assert_same_results(backends, "enzymes", ordered=True, limit=5, alpha_hybrid=1.0, context_window=0)
+
+    for name, (backend, store) in list(backends.items()):
+        store.close()
+        backends[name] = (backend, backend.open())
+    after = assert_same_results(backends, "enzymes", ordered=True, limit=5, alpha_hybrid=1.0, context_window=0)
+    assert after == before
+    for name, (_, store) in backends.items():
+        assert 2 not in file_ids_of(store, "lecture2 covers osmosis", limit=10, alpha_hybrid=0.5, context_window=1), name
+
+
+def test_reinserting_a_file_replaces_its_chunks(backends):
+    for name, (backend, store) in backends.items():
+        store.delete_file_chunks(COURSE_ID, [3])
+        store.insert_files(write_course_files(backend.project_root, [3]), COURSE_ID)
+    assert_same_results(backends, "lecture3 covers photosynthesis", ordered=True, limit=5, alpha_hybrid=1.0, context_window=0)
+
+
+def test_insert_reports_fully_indexed_files(tmp_path):
+    class FlakyLocalVectorStore(LocalVectorStore):
+        def _write_file_chunks(self, file_props, file_items, file_vectors):
+            if file_props["file_id"] == 2:
+                return len(file_items)
+            return super()._write_file_chunks(file_props, file_items, file_vectors)
+
+    store = FlakyLocalVectorStore(str(tmp_path))
+    store.connect()
+    files = write_course_files(str(tmp_path), [1, 2, 3])
+    assert store.insert_files(files, COURSE_ID) == {1, 3}
+    assert store.insert_files(files, COURSE_ID) == {1, 3} # 1 and 3 are skipped as already indexed
+    store.close()
+
+
+@pytest.mark.parametrize("reject_on", ["add", "close"])
+def test_weaviate_insert_leaves_out_rejected_files(tmp_path, reject_on):
+    client = FakeWeaviateClient()
+    chunks = client.collections.get("Chunk")
+    (chunks.reject_file_ids if reject_on == "add" else chunks.reject_on_close_file_ids).add(2)
+    files = write_course_files(str(tmp_path), [1, 2, 3])
+    chunk_store = get_chunk_store(wu.get_course_dir(COURSE_ID, str(tmp_path)))
+
+    assert wu.insert_files_into_weaviate(client, files, COURSE_ID) == {1, 3}
+    assert chunk_store.has_file(1) and chunk_store.has_file(3)
+    assert not chunk_store.has_file(2)
+
+    # Once the server accepts the chunks, the next ingest indexes the file
+    chunks.reject_file_ids.clear()
+    chunks.reject_on_close_file_ids.clear()
+    assert wu.insert_files_into_weaviate(client, files, COURSE_ID) == {1, 2, 3}
+    assert chunk_store.has_file(2)
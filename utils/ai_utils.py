@@ -1,32 +1,17 @@
-from google import genai
-from google.genai import types
+import html
+import random
 import re
 import os
+import threading
+import time
+from .lazy_imports import LazyModule
 
+# google.genai takes about half a second to import, so it loads on first use
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
 
-def get_gemini_response(prompt: str, api_key: str, model_name: str = "gemini-2.0-flash-lite") -> str:
-    """
-    Sends a prompt to the Gemini API and returns the model's response.
-
-    Args:
-        prompt (str): The prompt to send to the Gemini model.
-        api_key (str): The Gemini API key.
-        model_name (str, optional): The name of the Gemini model to use. 
-                                     Defaults to "gemini-1.5-flash-latest".
-
-    Returns:
-        str: The text response from the Gemini model, or an error message.
-    """
-    if not api_key:
-        return "Error: Gemini API key is missing."
-
-    try:
-        client = genai.Client(api_key=api_key)
-        
-        response = client.models.generate_content(
-            model=model_name,
-            config=types.GenerateContentConfig(
-                system_instruction="""You are a helpful AI assistant that wants to provide where 
+# System instruction sent with every chat request
+GEMINI_SYSTEM_INSTRUCTION = """You are a helpful AI assistant that wants to provide where 
                     the source is for a question. Summarize the answer for each different source 
                     but not for each differnt page or slide. State the quotes after the summary.
                     Do not use '*' charcter for bold text. Use '*' to state a bullet point. Use '--' 
@@ -53,17 +38,350 @@ def get_gemini_response(prompt: str, api_key: str, model_name: str = "gemini-2.0
                     -- Homework7_key.docx [Source: Homework7_key.docx (Paragraph 74)]
                     (Summary)   The C program defines sig_handler() that is invoked upon receiving a SysTick interrupt. The main() function initializes alarmed to 1, schedules sig_hanlder() to be invoked upon a SysTick interrupt, and starts SysTick to count down for 10 seconds.
                     *   "The following C program defines sig_handler( ) (lines 2-4) that is invoked upon receiving a SysTick interrupt and that changes alarmed from 1 to 2. The main( ) function (lines 6-16) initializes alarmed to 1 (line 8), schedules sig_hanlder( ) to be invoked upon a SysTick interrupt (line 9), and starts SysTick to count down for 10 seconds (line 10)."'
-                            """),
-            contents=prompt
-        )
-        
-        
-        return response.text
-
-    except Exception as e:
-        return f"Error communicating with Gemini API: {str(e)}"
-    
-    
+                            """
+
+
+def print_gemini_status(msg): print(f"[GEMINI] {msg}")
+def print_gemini_warning(msg): print(f"[GEMINI_WARNING] {msg}")
+
+
+class GeminiClient:
+    """
+    Long-lived Gemini client that reuses one pooled HTTP connection across questions.
+
+    Requests time out after timeout_seconds and transient failures (timeouts, connection errors,
+    HTTP 408, 429 and 5xx) are retried up to max_retries times with exponential backoff. If
+    use_context_cache is set, the system instruction is uploaded once as cached content and
+    referenced by name afterwards. When the API rejects the cache outright (a 4xx such as the
+    instruction being below the model's minimum cacheable size) caching is turned off and the
+    instruction is sent inline; after a transient failure it is sent inline for cache_retry_seconds
+    and caching is tried again. base_url points the client at
+    another endpoint, such as a local fake server in tests. The underlying genai.Client (and the
+    google.genai import) is created on first request, so constructing a GeminiClient is cheap.
+    """
+
+    RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash-lite", system_instruction: str = None,
+                 timeout_seconds: float = 60.0, max_retries: int = 3, backoff_seconds: float = 1.0,
+                 max_connections: int = 10, base_url: str = None, use_context_cache: bool = True,
+                 cache_ttl_seconds: int = 3600, cache_retry_seconds: float = 60.0):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.system_instruction = system_instruction or GEMINI_SYSTEM_INSTRUCTION
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.use_context_cache = use_context_cache
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_retry_seconds = cache_retry_seconds
+        self._cached_content_name = None
+        self._cache_expires_at = 0.0
+        self._cache_retry_at = 0.0
+        self._cache_lock = threading.Lock()
+        self._base_url = base_url
+        self._timeout_seconds = timeout_seconds
+        self._max_connections = max_connections
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The pooled genai.Client, created on first use; None without an API key."""
+        if self._client is None and self.api_key:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+
+                    limits = httpx.Limits(max_connections=self._max_connections, max_keepalive_connections=self._max_connections)
+                    self._client = genai.Client(
+                        api_key=self.api_key,
+                        http_options=types.HttpOptions(
+                            base_url=self._base_url,
+                            timeout=int(self._timeout_seconds * 1000), # milliseconds
+                            client_args={"limits": limits},
+                            async_client_args={"limits": limits}
+                        )
+                    )
+        return self._client
+
+    def _http_clients(self):
+        """
+        The (sync, async) httpx clients of the genai.Client, or None for those never created.
+        google-genai 1.19 has no public way to close them, so they are read from its private _api_client.
+        """
+        api_client = getattr(self._client, "_api_client", None)
+        return getattr(api_client, "_httpx_client", None), getattr(api_client, "_async_httpx_client", None)
+
+    def _is_retryable(self, error: Exception) -> bool:
+        import httpx
+        from google.genai import errors
+
+        if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+            return True
+        return isinstance(error, errors.APIError) and error.code in self.RETRYABLE_STATUS_CODES
+
+    def _get_cached_content_name(self):
+        """Returns the name of the cached system instruction, creating it if needed, or None."""
+        from google.genai import errors
+
+        if not self.use_context_cache:
+            return None
+        with self._cache_lock:
+            # Renew a little before the server-side TTL runs out
+            if self._cached_content_name and time.time() < self._cache_expires_at - 60:
+                return self._cached_content_name
+            if time.time() < self._cache_retry_at:
+                return None
+            try:
+                cached_content = self.client.caches.create(
+                    model=self.model_name,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=self.system_instruction,
+                        ttl=f"{self.cache_ttl_seconds}s"
+                    )
+                )
+                self._cached_content_name = cached_content.name
+                self._cache_expires_at = time.time() + self.cache_ttl_seconds
+                print_gemini_status(f"Cached the system instruction as {cached_content.name}.")
+                return self._cached_content_name
+            except Exception as e:
+                self._cached_content_name = None
+                if isinstance(e, errors.ClientError) and not self._is_retryable(e):
+                    print_gemini_warning(f"Context caching unsupported, sending the system instruction inline: {e}")
+                    self.use_context_cache = False
+                else:
+                    print_gemini_warning(f"Context caching failed, sending the system instruction inline for {self.cache_retry_seconds:.0f}s: {e}")
+                    self._cache_retry_at = time.time() + self.cache_retry_seconds
+                return None
+
+    def _generate_config(self):
+        cached_content_name = self._get_cached_content_name()
+        if cached_content_name:
+            return types.GenerateContentConfig(cached_content=cached_content_name)
+        return types.GenerateContentConfig(system_instruction=self.system_instruction)
+
+    def _drop_cached_content(self):
+        with self._cache_lock:
+            self._cached_content_name = None
+            self._cache_expires_at = 0.0
+
+    def _with_retries(self, request, can_retry=lambda: True):
+        attempt = 0
+        cache_recreated = False
+        while True:
+            try:
+                return request()
+            except Exception as e:
+                from google.genai import errors
+
+                # A cache that expired or was deleted server-side is recreated once, without counting as a retry
+                if self._cached_content_name and isinstance(e, errors.ClientError) and e.code in (403, 404):
+                    print_gemini_warning(f"Cached system instruction rejected: {e}")
+                    self._drop_cached_content()
+                    if not cache_recreated and can_retry():
+                        cache_recreated = True
+                        continue
+                if attempt >= self.max_retries or not self._is_retryable(e) or not can_retry():
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                print_gemini_warning(f"Gemini request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def generate(self, prompt: str) -> str:
+        """
+        Sends a prompt and returns the model's full response.
+
+        Returns:
+            str: The text response from the Gemini model, or an error message.
+        """
+        if not self.client:
+            return "Error: Gemini API key is missing."
+        try:
+            response = self._with_retries(lambda: self.client.models.generate_content(
+                model=self.model_name,
+                config=self._generate_config(),
+                contents=prompt
+            ))
+            return response.text
+        except Exception as e:
+            return f"Error communicating with Gemini API: {str(e)}"
+
+    def stream(self, prompt: str, on_text=None) -> str:
+        """
+        Sends a prompt and streams the response as it is generated.
+
+        Args:
+            prompt (str): The prompt to send to the Gemini model.
+            on_text (callable): Called with the full text received so far each time a new piece arrives.
+
+        Returns:
+            str: The complete text response from the Gemini model, or an error message.
+
+        A failed request is only retried while no text has been received yet.
+        """
+        if not self.client:
+            return "Error: Gemini API key is missing."
+
+        text_parts = []
+
+        def stream_request():
+            response_stream = self.client.models.generate_content_stream(
+                model=self.model_name,
+                config=self._generate_config(),
+                contents=prompt
+            )
+            for chunk in response_stream:
+                if not chunk.text:
+                    continue
+                text_parts.append(chunk.text)
+                if on_text:
+                    on_text("".join(text_parts))
+
+        try:
+            self._with_retries(stream_request, can_retry=lambda: not text_parts)
+            return "".join(text_parts)
+        except Exception as e:
+            return f"Error communicating with Gemini API: {str(e)}"
+
+    async def astream(self, prompt: str, on_text=None) -> str:
+        """
+        Async version of stream() using the client's asyncio transport.
+
+        Returns:
+            str: The complete text response from the Gemini model, or an error message.
+
+        Cancelling the awaiting task stops the request. Retries follow the same rules as stream().
+        """
+        import asyncio
+        from google.genai import errors
+
+        if not self.client:
+            return "Error: Gemini API key is missing."
+
+        text_parts = []
+        attempt = 0
+        cache_recreated = False
+        while True:
+            try:
+                # Creating the cached system instruction is a blocking call, done at most once per TTL
+                config = await asyncio.to_thread(self._generate_config)
+                response_stream = await self.client.aio.models.generate_content_stream(
+                    model=self.model_name,
+                    config=config,
+                    contents=prompt
+                )
+                async for chunk in response_stream:
+                    if not chunk.text:
+                        continue
+                    text_parts.append(chunk.text)
+                    if on_text:
+                        on_text("".join(text_parts))
+                return "".join(text_parts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._cached_content_name and isinstance(e, errors.ClientError) and e.code in (403, 404):
+                    print_gemini_warning(f"Cached system instruction rejected: {e}")
+                    self._drop_cached_content()
+                    if not cache_recreated and not text_parts:
+                        cache_recreated = True
+                        continue
+                if attempt >= self.max_retries or not self._is_retryable(e) or text_parts:
+                    return f"Error communicating with Gemini API: {str(e)}"
+                delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                print_gemini_warning(f"Gemini request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """Closes the asyncio HTTP connections used by astream(); await it on the event loop that streamed."""
+        _, async_http_client = self._http_clients()
+        if async_http_client is not None and not async_http_client.is_closed:
+            try:
+                await async_http_client.aclose()
+            except Exception as e:
+                print_gemini_warning(f"Could not close the async HTTP client: {e}")
+
+    def close(self):
+        """
+        Deletes the cached system instruction and closes the HTTP connections. The async connections
+        are closed here too unless aclose() already did, which is preferable after astream().
+        """
+        import asyncio
+
+        if self._client is None:
+            return
+        if self._cached_content_name:
+            try:
+                self.client.caches.delete(name=self._cached_content_name)
+            except Exception as e:
+                print_gemini_warning(f"Could not delete cached content {self._cached_content_name}: {e}")
+            self._drop_cached_content()
+        http_client, async_http_client = self._http_clients()
+        if http_client is not None and not http_client.is_closed:
+            try:
+                http_client.close()
+            except Exception as e:
+                print_gemini_warning(f"Could not close the HTTP client: {e}")
+        if async_http_client is not None and not async_http_client.is_closed:
+            try:
+                asyncio.run(async_http_client.aclose())
+            except Exception as e:
+                print_gemini_warning(f"Could not close the async HTTP client: {e}")
+
+
+def get_gemini_response(prompt: str, api_key: str, model_name: str = "gemini-2.0-flash-lite") -> str:
+    """
+    Sends a prompt to the Gemini API and returns the model's response.
+
+    Args:
+        prompt (str): The prompt to send to the Gemini model.
+        api_key (str): The Gemini API key.
+        model_name (str, optional): The name of the Gemini model to use. 
+                                     Defaults to "gemini-2.0-flash-lite".
+
+    Returns:
+        str: The text response from the Gemini model, or an error message.
+
+    Builds a one-off client; long-running callers should keep a GeminiClient instead.
+    """
+    return GeminiClient(api_key, model_name=model_name, use_context_cache=False).generate(prompt)
+
+
+def stream_gemini_response(prompt: str, api_key: str, on_text=None, model_name: str = "gemini-2.0-flash-lite") -> str:
+    """
+    Sends a prompt to the Gemini API and streams the response as it is generated.
+
+    Args:
+        prompt (str): The prompt to send to the Gemini model.
+        api_key (str): The Gemini API key.
+        on_text (callable): Called with the full text received so far each time a new piece arrives.
+        model_name (str, optional): The name of the Gemini model to use.
+
+    Returns:
+        str: The complete text response from the Gemini model, or an error message.
+
+    Builds a one-off client; long-running callers should keep a GeminiClient instead.
+    """
+    return GeminiClient(api_key, model_name=model_name, use_context_cache=False).stream(prompt, on_text=on_text)
+
+
+def format_partial_ai_response(response: str) -> str:
+    """
+    Formats a response that is still being streamed.
+
+    Only complete lines go through format_ai_response; the unfinished last line is shown
+    escaped as plain text, so half-received quotes or [Source: ...] references never
+    produce broken markup.
+    """
+    complete_text, _, pending_line = response.rpartition("\n")
+    formatted = format_ai_response(complete_text) if complete_text else ""
+    if pending_line.strip():
+        formatted += f"<p>{html.escape(pending_line.strip())}</p>"
+    return formatted
+
+
 def format_ai_response(response: str) -> str:
     """
     Converts a plain-text AI response into a more styled HTML
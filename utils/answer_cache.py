@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import numpy as np
+
+from .ingest_cache import _encode_json, _decode_json
+
+ANSWER_CACHE_FILENAME = "answer_cache.npz"
+
+def print_answer_cache_status(msg): print(f"[ANSWER_CACHE] {msg}")
+def print_answer_cache_warning(msg): print(f"[ANSWER_CACHE_WARNING] {msg}")
+
+
+class AnswerCache:
+    """
+    Per-course cache of formatted AI answers, looked up by query embedding.
+
+    A question hits when the cosine similarity between its embedding and a cached question's
+    embedding reaches similarity_threshold, the entry is younger than ttl_seconds and it was
+    answered against the same course index version. Entries for older index versions are
+    dropped as soon as a newer version is seen. Beyond max_entries the least recently used
+    entries are evicted. The cache is stored as Courses/<course_id>/answer_cache.npz; hit
+    bookkeeping stays in memory until the next store, eviction or close().
+    """
+
+    def __init__(self, course_dir: str, similarity_threshold: float = 0.92, ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 500):
+        self.path = os.path.join(course_dir, ANSWER_CACHE_FILENAME)
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries = [] # [{"query", "answer", "index_version", "created_at", "last_used", "hits"}]
+        self.vectors = None # Unit-length float32 matrix, one row per entry
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+        self._dirty = False # In-memory changes (hit counts, last_used) not yet written
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                state = _decode_json(data["state"])
+                vectors = data["vectors"].astype(np.float32, copy=False)
+            if len(state["entries"]) != vectors.shape[0]:
+                raise ValueError(f"{len(state['entries'])} entries but {vectors.shape[0]} vectors")
+            self.entries = state["entries"]
+            self.vectors = vectors if self.entries else None
+            self.stats.update(state.get("stats", {}))
+        except Exception as e:
+            print_answer_cache_warning(f"Ignoring unreadable answer cache {self.path}: {e}")
+
+    def save(self):
+        with self._lock:
+            state = {"entries": [dict(entry) for entry in self.entries], "stats": dict(self.stats)}
+            self._dirty = False
+            vectors = self.vectors if self.vectors is not None else np.empty((0, 0), dtype=np.float32)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, state=_encode_json(state), vectors=vectors)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print_answer_cache_warning(f"Could not write {self.path}: {e}")
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _keep(self, keep_mask):
+        keep_rows = np.flatnonzero(keep_mask)
+        self.entries = [self.entries[row] for row in keep_rows]
+        self.vectors = self.vectors[keep_rows] if len(keep_rows) else None
+
+    def _evict(self, index_version: str) -> int:
+        """Drops expired entries and entries built against another index version. Caller holds the lock."""
+        if not self.entries:
+            return 0
+        now = time.time()
+        keep_mask = np.array([
+            entry["index_version"] == index_version and now - entry["created_at"] <= self.ttl_seconds
+            for entry in self.entries
+        ], dtype=bool)
+        dropped = len(self.entries) - int(keep_mask.sum())
+        if dropped:
+            self.stats["invalidated"] += dropped
+            self._keep(keep_mask)
+        return dropped
+
+    def lookup(self, query_vector, index_version: str):
+        """
+        Returns the cached answer for the most similar earlier question, or None on a miss.
+
+        Args:
+            query_vector (np.ndarray): Embedding of the new question.
+            index_version (str): Current version of the course index (see get_course_index_version).
+        """
+        query_vector = self._normalize(query_vector)
+        answer = None
+        with self._lock:
+            evicted = self._evict(index_version)
+            self._dirty = True
+            similarities = self.vectors @ query_vector if self.vectors is not None else None
+            best_row = int(np.argmax(similarities)) if similarities is not None else None
+            if best_row is None or similarities[best_row] < self.similarity_threshold:
+                self.stats["misses"] += 1
+            else:
+                entry = self.entries[best_row]
+                entry["last_used"] = time.time()
+                entry["hits"] += 1
+                self.stats["hits"] += 1
+                print_answer_cache_status(f"Hit for '{entry['query']}' (similarity {similarities[best_row]:.3f}).")
+                answer = entry["answer"]
+        # Hits are only counted in memory; the file is rewritten when entries actually go away
+        if evicted:
+            self.save()
+        return answer
+
+    def store(self, query_text: str, query_vector, answer: str, index_version: str):
+        """Caches the formatted answer to a question and persists the cache."""
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            self._evict(index_version)
+            self.entries.append({
+                "query": query_text,
+                "answer": answer,
+                "index_version": index_version,
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+            })
+            row = query_vector.reshape(1, -1)
+            self.vectors = row if self.vectors is None else np.concatenate([self.vectors, row])
+            if len(self.entries) > self.max_entries:
+                last_used = np.array([entry["last_used"] for entry in self.entries])
+                keep_mask = np.zeros(len(self.entries), dtype=bool)
+                keep_mask[np.argsort(last_used)[-self.max_entries:]] = True
+                self._keep(keep_mask)
+            self.stats["stores"] += 1
+        self.save()
+
+    def get_stats(self) -> dict:
+        """Returns the counters plus "size" and "hit_rate" (hits / lookups)."""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=len(self.entries), hit_rate=self.stats["hits"] / lookups if lookups else 0.0)
+
+    def clear(self):
+        with self._lock:
+            self.entries = []
+            self.vectors = None
+        self.save()
+
+    def close(self):
+        """Writes hit bookkeeping that is still only in memory."""
+        if self._dirty:
+            self.save()
+
+
+# course_dir -> AnswerCache shared by chat threads
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(course_dir: str) -> AnswerCache:
+    """Returns the shared AnswerCache of a course directory, loading it from disk on first use."""
+    course_dir = os.path.abspath(course_dir)
+    with _caches_lock:
+        cache = _caches.get(course_dir)
+        if cache is None:
+            cache = AnswerCache(course_dir)
+            _caches[course_dir] = cache
+        return cache
+
+
+def close_answer_caches():
+    """Persists every shared AnswerCache, e.g. when the app shuts down."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.close()
@@ -0,0 +1,83 @@
+"""
+Benchmarks the vectorized chunk boundary detection in general_utils against the
+original per-sentence semantic_chunking loop.
+
+Run from the project root:
+    python -m utils.bench_chunking --sentences 2000 --repeats 5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .general_utils import find_chunk_boundaries
+
+
+def legacy_chunk_boundaries(sentence_embeddings, similarity_threshold: float = 0.6) -> list[tuple[int, int]]:
+    """The original semantic_chunking loop, returning sentence ranges instead of joined text."""
+    from sentence_transformers import util
+
+    boundaries = [0]
+    current_embedding = sentence_embeddings[0]
+
+    for i in range(1, len(sentence_embeddings)):
+        similarity = util.cos_sim(current_embedding.reshape(1, -1), sentence_embeddings[i].reshape(1, -1)).item()
+
+        if similarity > similarity_threshold:
+            current_embedding = np.mean([current_embedding, sentence_embeddings[i]], axis=0)
+        else:
+            boundaries.append(i)
+            current_embedding = sentence_embeddings[i]
+    boundaries.append(len(sentence_embeddings))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def make_synthetic_embeddings(num_sentences: int, dim: int = 384, num_topics: int = 12, noise: float = 0.6, seed: int = 0):
+    """Builds unit-length sentence embeddings that drift between topics in runs of 1-15 sentences."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(num_topics, dim))
+    rows = []
+    while sum(len(r) for r in rows) < num_sentences:
+        topic = topics[rng.integers(num_topics)]
+        run_length = int(rng.integers(1, 16))
+        rows.append(topic + noise * rng.normal(size=(run_length, dim)))
+    embeddings = np.concatenate(rows)[:num_sentences].astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def time_call(func, repeats: int) -> float:
+    """Returns the best wall-clock time of `repeats` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark semantic chunk boundary detection.")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    embeddings = make_synthetic_embeddings(args.sentences)
+    print(f"Benchmarking {args.sentences} sentences, threshold {args.threshold}, best of {args.repeats}")
+
+    results = {
+        "legacy loop (decaying mean)": (lambda: legacy_chunk_boundaries(embeddings, args.threshold)),
+        "vectorized centroid": (lambda: find_chunk_boundaries(embeddings, args.threshold, strategy="centroid")),
+        "vectorized valley": (lambda: find_chunk_boundaries(embeddings, args.threshold, strategy="valley")),
+    }
+    legacy_seconds = None
+    for name, func in results.items():
+        seconds = time_call(func, args.repeats)
+        num_chunks = len(func())
+        if legacy_seconds is None:
+            legacy_seconds = seconds
+        print(f"  {name:<30} {seconds * 1000:9.2f} ms  {num_chunks:6d} chunks  {legacy_seconds / seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmarks int8 and binary vector quantization in the local index: recall@k against exact float32
+search versus the bytes scanned per query, with and without full-precision rescoring.
+
+Run from the project root:
+    python -m utils.bench_quantization --vectors 50000 --queries 200 --k 10
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from . import vector_quantization as vq
+from .bench_chunking import make_synthetic_embeddings
+from .local_vector_store import _CourseVectors
+
+
+def build_course_vectors(directory: str, vectors: np.ndarray, quantization: str) -> _CourseVectors:
+    course_vectors = _CourseVectors(directory, vectors.shape[1], quantization)
+    course_vectors.append(vectors)
+    if quantization != vq.QUANTIZATION_NONE:
+        course_vectors.train_quantizer()
+    return course_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector search with rescoring.")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10], help="Rescore multipliers (1 = no rescoring)")
+    args = parser.parse_args()
+
+    vectors = make_synthetic_embeddings(args.vectors + args.queries, dim=args.dim, num_topics=64)
+    rng = np.random.default_rng(1)
+    queries = vectors[args.vectors:] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    vectors = vectors[:args.vectors]
+    float_bytes = args.dim * 4
+    print(f"Benchmarking {args.vectors} x {args.dim}-d vectors, {args.queries} queries, recall@{args.k} vs exact float32")
+
+    root = tempfile.mkdtemp(prefix="bench_quantization_")
+    try:
+        exact = build_course_vectors(f"{root}/none", vectors, vq.QUANTIZATION_NONE)
+        start = time.perf_counter()
+        truth = [set(exact.exact_top_k(query, args.k)[0].tolist()) for query in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+        print(f"  {'float32 exact':<24} {float_bytes:6d} B/vector  {args.vectors * float_bytes / 2**20:8.1f} MB  "
+              f"{'1.0x':>6}  recall 1.000  {exact_ms:7.2f} ms/query")
+
+        for quantization in (vq.QUANTIZATION_INT8, vq.QUANTIZATION_BINARY):
+            course_vectors = build_course_vectors(f"{root}/{quantization}", vectors, quantization)
+            code_bytes = course_vectors.quantizer.code_width * np.dtype(course_vectors.quantizer.code_dtype).itemsize
+            for multiplier in args.rescore:
+                start = time.perf_counter()
+                results = [course_vectors.quantized_top_k(query, args.k, args.k * multiplier)[0] for query in queries]
+                query_ms = (time.perf_counter() - start) * 1000 / args.queries
+                recall = np.mean([len(truth_rows & set(rows.tolist())) / args.k for truth_rows, rows in zip(truth, results)])
+                label = f"{quantization} rescore x{multiplier}" if multiplier > 1 else f"{quantization} (no rescoring)"
+                print(f"  {label:<24} {code_bytes:6d} B/vector  {args.vectors * code_bytes / 2**20:8.1f} MB  "
+                      f"{float_bytes / code_bytes:5.1f}x  recall {recall:.3f}  {query_ms:7.2f} ms/query")
+            course_vectors.release()
+        exact.release()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
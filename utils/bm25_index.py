@@ -0,0 +1,325 @@
+import collections
+import math
+import os
+import re
+import threading
+import numpy as np
+
+# Case-folded runs of Unicode letters and digits, like Weaviate's default "word" tokenization: accented
+# words stay whole, while underscores and punctuation split. CJK text has no spaces, so a run of CJK
+# characters is one token; words inside it only match as part of that exact run.
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+# Stored in saved indexes; indexes built with another tokenizer are rebuilt on load
+TOKENIZER_VERSION = 2
+
+def print_bm25_warning(msg): print(f"[BM25_WARNING] {msg}")
+
+
+def tokenize(text: str) -> list:
+    """Splits text into case-folded tokens of Unicode letters and digits."""
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def encode_varints(values) -> bytes:
+    """Encodes non-negative integers as LEB128 varints (7 bits per byte, high bit = more bytes follow)."""
+    return _encode_varint_array(values)[0].tobytes()
+
+
+def _encode_varint_array(values):
+    """Returns the varint bytes of values as a uint8 array plus the number of bytes of each value."""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64)
+    num_bytes = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        num_bytes += remaining > 0
+        remaining >>= np.uint64(7)
+    starts = np.concatenate([[0], np.cumsum(num_bytes)[:-1]])
+    encoded = np.empty(int(num_bytes.sum()), dtype=np.uint8)
+    for byte_position in range(int(num_bytes.max())):
+        has_byte = num_bytes > byte_position
+        payload = (values[has_byte] >> np.uint64(7 * byte_position)) & np.uint64(0x7F)
+        continues = (num_bytes[has_byte] > byte_position + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[has_byte] + byte_position] = (payload | continues).astype(np.uint8)
+    return encoded, num_bytes
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Decodes bytes written by encode_varints back into a uint64 array."""
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    byte_positions = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    shifted = (encoded & 0x7F).astype(np.uint64) << (7 * byte_positions).astype(np.uint64)
+    return np.add.reduceat(shifted, starts)
+
+
+def encode_varint_groups(values, group_counts) -> list:
+    """Encodes consecutive groups of values (group_counts[i] values each) in one pass; returns one bytes object per group."""
+    encoded, num_bytes = _encode_varint_array(values)
+    data = encoded.tobytes()
+    byte_bounds = np.concatenate([[0], np.cumsum(num_bytes)])[np.concatenate([[0], np.cumsum(group_counts)])].tolist()
+    return [data[start:stop] for start, stop in zip(byte_bounds[:-1], byte_bounds[1:])]
+
+
+def decode_varint_groups(blobs: list):
+    """Decodes several encode_varints outputs in one pass. Returns all values and the number of values per blob."""
+    data = b"".join(blobs)
+    terminators = np.concatenate([[0], np.cumsum(np.frombuffer(data, dtype=np.uint8) < 0x80)])
+    byte_bounds = np.concatenate([[0], np.cumsum([len(blob) for blob in blobs])]).astype(np.int64)
+    return decode_varints(data), np.diff(terminators[byte_bounds])
+
+
+class BM25Index:
+    """
+    BM25 inverted index over documents identified by non-negative integer IDs.
+
+    Postings are kept compressed: per term, the sorted document IDs as delta-encoded varints and
+    the term frequencies as varints. Documents added since the last merge sit in a small
+    uncompressed segment and removed documents are tombstoned; both are folded into the compressed
+    postings by merge(), which runs automatically once either grows past merge_threshold documents.
+    New documents usually have higher IDs than every indexed one (rows are appended), so a merge
+    without tombstones just appends their encoded deltas to the affected terms.
+    Scores use the live corpus statistics. k1 and b default to the values Weaviate uses.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, merge_threshold: int = 2000):
+        self.k1 = k1
+        self.b = b
+        self.merge_threshold = merge_threshold
+        self._lock = threading.RLock()
+        self._postings = {} # term -> (doc ID delta varints, term frequency varints, last doc ID)
+        self._doc_lengths = {} # doc_id -> number of tokens, for every live document
+        self._total_length = 0
+        self._pending = {} # term -> {doc_id: term frequency}, documents added since the last merge
+        self._pending_doc_terms = {} # doc_id -> terms, so pending documents can be removed
+        self._tombstones = set() # removed documents that still appear in the compressed postings
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        with self._lock:
+            return np.sort(np.fromiter(self._doc_lengths.keys(), dtype=np.int64, count=len(self._doc_lengths)))
+
+    def add(self, doc_id: int, text: str):
+        """Indexes a document, replacing an earlier version with the same ID."""
+        tokens = tokenize(text)
+        term_counts = collections.Counter(tokens)
+        with self._lock:
+            # A tombstone left by an earlier version keeps masking only the compressed postings
+            self._remove_locked(doc_id)
+            for term, count in term_counts.items():
+                self._pending.setdefault(term, {})[doc_id] = count
+            self._pending_doc_terms[doc_id] = list(term_counts)
+            self._doc_lengths[doc_id] = len(tokens)
+            self._total_length += len(tokens)
+            self._merge_if_needed()
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._merge_if_needed()
+
+    def _remove_locked(self, doc_id: int):
+        if doc_id not in self._doc_lengths:
+            return
+        pending_terms = self._pending_doc_terms.pop(doc_id, None)
+        if pending_terms is not None:
+            for term in pending_terms:
+                postings = self._pending.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._pending[term]
+        else:
+            self._tombstones.add(doc_id)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def _merge_if_needed(self):
+        if len(self._pending_doc_terms) >= self.merge_threshold or len(self._tombstones) >= self.merge_threshold:
+            self.merge()
+
+    def _decode_postings(self, term: str):
+        compressed = self._postings.get(term)
+        if compressed is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        doc_ids = np.cumsum(decode_varints(compressed[0])).astype(np.int64)
+        term_frequencies = decode_varints(compressed[1]).astype(np.int64)
+        return doc_ids, term_frequencies
+
+    def merge(self):
+        """Folds pending documents and tombstones into the compressed postings."""
+        with self._lock:
+            if not self._pending_doc_terms and not self._tombstones:
+                return
+            # Terms whose postings must be decoded and rewritten; the others only get new IDs appended
+            if self._tombstones:
+                rewrite_terms = list(set(self._postings) | set(self._pending))
+            else:
+                rewrite_terms = [term for term, pending in self._pending.items()
+                                 if term in self._postings and min(pending) <= self._postings[term][2]]
+            rewrite_set = set(rewrite_terms)
+            append_terms = [term for term in self._pending if term not in rewrite_set]
+            terms = rewrite_terms + append_terms
+
+            # Flatten everything into (term position, doc ID, term frequency) arrays
+            groups, doc_ids, term_frequencies = [], [], []
+            if rewrite_terms:
+                deltas, counts = decode_varint_groups([self._postings[term][0] if term in self._postings else b"" for term in rewrite_terms])
+                compressed_frequencies, _ = decode_varint_groups([self._postings[term][1] if term in self._postings else b"" for term in rewrite_terms])
+                group_of_value = np.repeat(np.arange(len(rewrite_terms)), counts)
+                # Deltas restart at every term, so subtract the running sum reached before each term's first value
+                running = np.concatenate([[0], np.cumsum(deltas.astype(np.int64))])
+                group_starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+                compressed_doc_ids = running[1:] - np.repeat(running[group_starts], counts)
+                keep = ~np.isin(compressed_doc_ids, np.fromiter(self._tombstones, dtype=np.int64, count=len(self._tombstones)))
+                groups.append(group_of_value[keep])
+                doc_ids.append(compressed_doc_ids[keep])
+                term_frequencies.append(compressed_frequencies.astype(np.int64)[keep])
+            pending_groups, pending_doc_ids, pending_frequencies = [], [], []
+            for position, term in enumerate(terms):
+                pending = self._pending.get(term)
+                if pending:
+                    pending_groups.extend([position] * len(pending))
+                    pending_doc_ids.extend(pending.keys())
+                    pending_frequencies.extend(pending.values())
+            groups.append(np.array(pending_groups, dtype=np.int64))
+            doc_ids.append(np.array(pending_doc_ids, dtype=np.int64))
+            term_frequencies.append(np.array(pending_frequencies, dtype=np.int64))
+            groups, doc_ids, term_frequencies = np.concatenate(groups), np.concatenate(doc_ids), np.concatenate(term_frequencies)
+            order = np.lexsort((doc_ids, groups))
+            groups, doc_ids, term_frequencies = groups[order], doc_ids[order], term_frequencies[order]
+
+            # Delta-encode per term: the first new ID of a term is relative to its last indexed ID (0 when rewritten)
+            counts = np.bincount(groups, minlength=len(terms))
+            bases = np.array([0] * len(rewrite_terms) + [self._postings[term][2] if term in self._postings else 0 for term in append_terms], dtype=np.int64)
+            deltas = np.diff(doc_ids, prepend=0)
+            is_group_start = np.ones(len(groups), dtype=bool)
+            is_group_start[1:] = groups[1:] != groups[:-1]
+            deltas[is_group_start] = doc_ids[is_group_start] - bases[groups[is_group_start]]
+            doc_blobs = encode_varint_groups(deltas, counts)
+            frequency_blobs = encode_varint_groups(term_frequencies, counts)
+            last_doc_ids = doc_ids[np.maximum(np.cumsum(counts) - 1, 0)] if len(doc_ids) else np.zeros(len(terms), dtype=np.int64)
+
+            for position, term in enumerate(terms):
+                if counts[position] == 0:
+                    if position < len(rewrite_terms):
+                        self._postings.pop(term, None)
+                    continue
+                prefix = self._postings.get(term, (b"", b"")) if position >= len(rewrite_terms) else (b"", b"")
+                self._postings[term] = (prefix[0] + doc_blobs[position], prefix[1] + frequency_blobs[position], int(last_doc_ids[position]))
+            self._pending.clear()
+            self._pending_doc_terms.clear()
+            self._tombstones.clear()
+
+    def _term_postings(self, term: str):
+        """Live (doc_ids, term_frequencies) of a term across the compressed and pending segments."""
+        doc_ids, term_frequencies = self._decode_postings(term)
+        if self._tombstones and len(doc_ids):
+            keep = ~np.isin(doc_ids, np.fromiter(self._tombstones, dtype=np.int64, count=len(self._tombstones)))
+            doc_ids, term_frequencies = doc_ids[keep], term_frequencies[keep]
+        pending = self._pending.get(term)
+        if pending:
+            doc_ids = np.concatenate([doc_ids, np.fromiter(pending.keys(), dtype=np.int64, count=len(pending))])
+            term_frequencies = np.concatenate([term_frequencies, np.fromiter(pending.values(), dtype=np.int64, count=len(pending))])
+        return doc_ids, term_frequencies
+
+    def search(self, query_text: str, limit: int = 10):
+        """
+        Returns the best matching documents for a query.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: int64 document IDs and float32 BM25 scores, best first.
+        """
+        query_terms = set(tokenize(query_text))
+        with self._lock:
+            num_docs = len(self._doc_lengths)
+            if not num_docs or not query_terms:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            average_length = self._total_length / num_docs
+            all_doc_ids, all_scores = [], []
+            for term in query_terms:
+                doc_ids, term_frequencies = self._term_postings(term)
+                if len(doc_ids) == 0:
+                    continue
+                idf = math.log(1 + (num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+                doc_lengths = np.fromiter((self._doc_lengths[doc_id] for doc_id in doc_ids.tolist()), dtype=np.float32, count=len(doc_ids))
+                length_norm = 1 - self.b + self.b * doc_lengths / average_length
+                all_doc_ids.append(doc_ids)
+                all_scores.append(idf * term_frequencies * (self.k1 + 1) / (term_frequencies + self.k1 * length_norm))
+        if not all_doc_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        doc_ids, inverse = np.unique(np.concatenate(all_doc_ids), return_inverse=True)
+        doc_scores = np.zeros(len(doc_ids), dtype=np.float32)
+        np.add.at(doc_scores, inverse, np.concatenate(all_scores).astype(np.float32))
+        if len(doc_ids) > limit:
+            top = np.argpartition(-doc_scores, limit - 1)[:limit]
+            doc_ids, doc_scores = doc_ids[top], doc_scores[top]
+        order = np.argsort(-doc_scores, kind="stable")
+        return doc_ids[order], doc_scores[order]
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the compressed postings in bytes (excluding the pending segment)."""
+        with self._lock:
+            return sum(len(doc_bytes) + len(tf_bytes) for doc_bytes, tf_bytes, _ in self._postings.values())
+
+    def save(self, path: str):
+        """Merges and writes the index to an .npz file (atomically)."""
+        with self._lock:
+            self.merge()
+            terms = sorted(self._postings)
+            doc_bytes = [self._postings[term][0] for term in terms]
+            tf_bytes = [self._postings[term][1] for term in terms]
+            last_doc_ids = np.array([self._postings[term][2] for term in terms], dtype=np.int64)
+            doc_ids = np.fromiter(self._doc_lengths.keys(), dtype=np.int64, count=len(self._doc_lengths))
+            doc_lengths = np.fromiter(self._doc_lengths.values(), dtype=np.int64, count=len(self._doc_lengths))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.savez(
+                file,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                doc_offsets=np.cumsum([0] + [len(data) for data in doc_bytes]),
+                doc_data=np.frombuffer(b"".join(doc_bytes), dtype=np.uint8),
+                tf_offsets=np.cumsum([0] + [len(data) for data in tf_bytes]),
+                tf_data=np.frombuffer(b"".join(tf_bytes), dtype=np.uint8),
+                last_doc_ids=last_doc_ids,
+                doc_ids=doc_ids,
+                doc_lengths=doc_lengths,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                tokenizer_version=np.int64(TOKENIZER_VERSION)
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, merge_threshold: int = 2000):
+        """Reads an index written by save(). Returns None if the file is missing, unreadable or from another tokenizer."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if "tokenizer_version" not in data.files or int(data["tokenizer_version"]) != TOKENIZER_VERSION:
+                    return None
+                k1, b = data["params"].tolist()
+                index = cls(k1=k1, b=b, merge_threshold=merge_threshold)
+                terms_blob = data["terms"].tobytes().decode("utf-8")
+                terms = terms_blob.split("\n") if terms_blob else []
+                doc_offsets, doc_data = data["doc_offsets"], data["doc_data"].tobytes()
+                tf_offsets, tf_data = data["tf_offsets"], data["tf_data"].tobytes()
+                doc_offsets, tf_offsets = doc_offsets.tolist(), tf_offsets.tolist()
+                for position, (term, last_doc_id) in enumerate(zip(terms, data["last_doc_ids"].tolist())):
+                    index._postings[term] = (
+                        doc_data[doc_offsets[position]:doc_offsets[position + 1]],
+                        tf_data[tf_offsets[position]:tf_offsets[position + 1]],
+                        last_doc_id
+                    )
+                index._doc_lengths = dict(zip(data["doc_ids"].tolist(), data["doc_lengths"].tolist()))
+                index._total_length = int(data["doc_lengths"].sum())
+            return index
+        except Exception as e:
+            print_bm25_warning(f"Ignoring unreadable BM25 index {path}: {e}")
+            return None
@@ -0,0 +1,188 @@
+import json
+import mmap
+import os
+import threading
+import types
+import numpy as np
+from .lazy_imports import LazyModule
+
+wvutil = LazyModule("weaviate.util")
+
+CHUNK_STORE_DIR_NAME = ".chunk_store"
+DATA_FILENAME = "chunks.bin"
+INDEX_FILENAME = "index.npy"
+
+def print_store_status(msg): print(f"[CHUNK_STORE] {msg}")
+def print_store_warning(msg): print(f"[CHUNK_STORE_WARNING] {msg}")
+
+
+class StoredChunk:
+    """A chunk read from the sidecar store, shaped like a Weaviate result object (uuid, properties, metadata)."""
+
+    __slots__ = ("uuid", "properties", "metadata")
+
+    def __init__(self, properties: dict):
+        self.uuid = wvutil.generate_uuid5(f'{properties["file_id"]}_{properties["chunk_index"]}', "Chunk")
+        self.properties = properties
+        self.metadata = types.SimpleNamespace(score=None, distance=None)
+
+
+class ChunkStore:
+    """
+    Local sidecar copy of a course's chunk text and metadata, for key lookups by (file_id, chunk_index).
+
+    Chunk properties are appended as UTF-8 JSON records to Courses/<course_id>/.chunk_store/chunks.bin,
+    which is read through a memory map. index.npy holds one int64 row (file_id, chunk_index, offset, length)
+    per live chunk and is rewritten atomically whenever a file is added or removed. Records of replaced or
+    removed files stay in chunks.bin until they outweigh the live ones, then the store is compacted.
+    """
+
+    def __init__(self, course_dir: str):
+        self.store_dir = os.path.join(course_dir, CHUNK_STORE_DIR_NAME)
+        self.data_path = os.path.join(self.store_dir, DATA_FILENAME)
+        self.index_path = os.path.join(self.store_dir, INDEX_FILENAME)
+        self._lock = threading.RLock()
+        self._offsets = {} # (file_id, chunk_index) -> (offset, length)
+        self._file_chunk_counts = {} # file_id -> number of chunks
+        self._mmap = None
+        self._data_file = None
+        self._load_index()
+
+    @staticmethod
+    def exists_for(course_dir: str) -> bool:
+        return os.path.exists(os.path.join(course_dir, CHUNK_STORE_DIR_NAME, INDEX_FILENAME))
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            index = np.load(self.index_path, allow_pickle=False)
+        except Exception as e:
+            print_store_warning(f"Ignoring unreadable chunk store index {self.index_path}: {e}")
+            return
+        for file_id, chunk_index, offset, length in index.reshape(-1, 4).tolist():
+            self._offsets[(file_id, chunk_index)] = (offset, length)
+            self._file_chunk_counts[file_id] = self._file_chunk_counts.get(file_id, 0) + 1
+
+    def _save_index(self):
+        rows = [(file_id, chunk_index, offset, length) for (file_id, chunk_index), (offset, length) in self._offsets.items()]
+        index = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, index)
+        os.replace(tmp_path, self.index_path)
+
+    def _close_map(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+
+    def _read(self, offset: int, length: int) -> bytes:
+        # Appends grow chunks.bin past the current mapping, so remap when a record lies beyond it
+        if self._mmap is None or offset + length > len(self._mmap):
+            self._close_map()
+            self._data_file = open(self.data_path, 'rb')
+            self._mmap = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset:offset + length]
+
+    def has_file(self, file_id: int) -> bool:
+        with self._lock:
+            return file_id in self._file_chunk_counts
+
+    def put_file(self, file_id: int, chunk_properties: list[dict]):
+        """Stores (or replaces) every chunk of a file. Each dict must carry file_id and chunk_index."""
+        with self._lock:
+            self._drop_file(file_id)
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self.data_path, 'ab') as file:
+                offset = file.tell()
+                for properties in chunk_properties:
+                    record = json.dumps(properties, ensure_ascii=False).encode("utf-8") + b"\n"
+                    file.write(record)
+                    self._offsets[(file_id, properties["chunk_index"])] = (offset, len(record) - 1)
+                    offset += len(record)
+            self._file_chunk_counts[file_id] = len(chunk_properties)
+            self._save_index()
+
+    def _drop_file(self, file_id: int):
+        # Ingestion numbers the chunks of a file 0..n-1
+        for chunk_index in range(self._file_chunk_counts.pop(file_id, 0)):
+            self._offsets.pop((file_id, chunk_index), None)
+
+    def remove_files(self, file_ids):
+        with self._lock:
+            removed = [file_id for file_id in file_ids if file_id in self._file_chunk_counts]
+            if not removed:
+                return
+            for file_id in removed:
+                self._drop_file(file_id)
+            self._save_index()
+            live_bytes = sum(length + 1 for _, length in self._offsets.values())
+            if os.path.getsize(self.data_path) > 2 * live_bytes:
+                self.compact()
+
+    def compact(self):
+        """Rewrites chunks.bin with only the live records."""
+        with self._lock:
+            new_offsets = {}
+            tmp_path = self.data_path + ".tmp"
+            with open(tmp_path, 'wb') as file:
+                offset = 0
+                for key, (old_offset, length) in sorted(self._offsets.items(), key=lambda item: item[1][0]):
+                    file.write(self._read(old_offset, length) + b"\n")
+                    new_offsets[key] = (offset, length)
+                    offset += length + 1
+            # The old file must not be mapped while it is replaced (required on Windows)
+            self._close_map()
+            os.replace(tmp_path, self.data_path)
+            self._offsets = new_offsets
+            self._save_index()
+            print_store_status(f"Compacted {self.data_path} to {offset} bytes.")
+
+    def get(self, file_id: int, chunk_index: int):
+        """Returns the StoredChunk at (file_id, chunk_index), or None if it is not stored."""
+        with self._lock:
+            location = self._offsets.get((file_id, chunk_index))
+            if location is None:
+                return None
+            return StoredChunk(json.loads(self._read(*location).decode("utf-8")))
+
+    def get_window(self, file_id: int, chunk_index: int, context_window: int) -> list:
+        """Returns the stored chunks from chunk_index - context_window to chunk_index + context_window."""
+        chunks = []
+        for neighbor_index in range(max(0, chunk_index - context_window), chunk_index + context_window + 1):
+            chunk = self.get(file_id, neighbor_index)
+            if chunk is not None:
+                chunks.append(chunk)
+        return chunks
+
+    def close(self):
+        with self._lock:
+            self._close_map()
+
+
+# course_dir -> ChunkStore shared by ingestion and search threads
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_chunk_store(course_dir: str, create: bool = True):
+    """
+    Returns the shared ChunkStore of a course directory.
+
+    Args:
+        course_dir (str): The course directory (Courses/<course_id>).
+        create (bool): If False, returns None when the course has no sidecar store on disk yet.
+    """
+    course_dir = os.path.abspath(course_dir)
+    with _stores_lock:
+        store = _stores.get(course_dir)
+        if store is None:
+            if not create and not ChunkStore.exists_for(course_dir):
+                return None
+            store = ChunkStore(course_dir)
+            _stores[course_dir] = store
+        return store
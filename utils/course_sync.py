@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import threading
+
+from . import general_utils as gu
+from .ingest_cache import compute_file_hash
+from .job_scheduler import JobScheduler, PRIORITY_BACKGROUND
+
+MANIFEST_FILENAME = "sync_manifest.json"
+
+def print_sync_status(msg): print(f"[SYNC] {msg}")
+def print_sync_warning(msg): print(f"[SYNC_WARNING] {msg}")
+
+
+class SyncManifest:
+    """
+    Records what was last synced for each file of a course: Canvas modified_at, size and
+    the SHA-256 of the downloaded content. Stored as Courses/<course_id>/sync_manifest.json.
+    """
+
+    def __init__(self, course_dir: str):
+        self.path = os.path.join(course_dir, MANIFEST_FILENAME)
+        self.entries = {} # str(file_id) -> {"filename", "modified_at", "size", "sha256"}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            self.entries = data.get("files", {}) if isinstance(data, dict) else {}
+        except (IOError, json.JSONDecodeError) as e:
+            print_sync_warning(f"Could not read {self.path}, starting a fresh manifest: {e}")
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            snapshot = {"files": dict(self.entries)}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file, indent=4)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print_sync_warning(f"Could not write {self.path}: {e}")
+
+    def get(self, file_id):
+        with self._lock:
+            return self.entries.get(str(file_id))
+
+    def needs_redownload(self, file_info: dict, local_file_path: str) -> bool:
+        """
+        True if an existing local copy is stale: Canvas reports a different modified_at or size
+        than what was last synced, or (for files never synced) the local size differs from Canvas.
+        """
+        if not os.path.exists(local_file_path):
+            return False
+        entry = self.get(file_info.get("id"))
+        if entry is None:
+            try:
+                return file_info.get("size") is not None and os.path.getsize(local_file_path) != file_info.get("size")
+            except OSError:
+                return False
+        return entry.get("modified_at") != file_info.get("modified_at") or entry.get("size") != file_info.get("size")
+
+    def record(self, file_info: dict, sha256: str):
+        with self._lock:
+            self.entries[str(file_info["id"])] = {
+                "filename": file_info.get("filename"),
+                "modified_at": file_info.get("modified_at"),
+                "size": file_info.get("size"),
+                "sha256": sha256,
+            }
+
+    def remove(self, file_ids):
+        with self._lock:
+            for file_id in file_ids:
+                self.entries.pop(str(file_id), None)
+
+    def file_ids(self) -> set:
+        with self._lock:
+            return {int(file_id) for file_id in self.entries}
+
+    def content_version(self) -> str:
+        """Returns a digest of the synced file IDs and content hashes; it changes whenever the index does."""
+        with self._lock:
+            items = sorted((file_id, entry.get("sha256")) for file_id, entry in self.entries.items())
+        return hashlib.sha256(json.dumps(items).encode("utf-8")).hexdigest()[:16]
+
+
+def get_course_index_version(course_dir: str) -> str:
+    """Returns the index version of a course (see SyncManifest.content_version)."""
+    return SyncManifest(course_dir).content_version()
+
+
+def sync_course(weaviate_manager, course_id: int, base_url: str, headers: dict, project_root: str = None,
+                download_progress_callback=None, on_downloads_finished=None, ensure_index_ready=None,
+                status_callback=None, should_cancel=None, job_scheduler: JobScheduler = None) -> dict:
+    """
+    Brings the local files and the search index of a course up to date with Canvas.
+
+    Args:
+        weaviate_manager (WeaviateManager): Manager used to ingest and delete course data.
+        course_id (int): The Canvas course ID.
+        base_url (str): The Canvas API base URL.
+        headers (dict): Canvas request headers (Authorization).
+        project_root (str): Project root containing Courses/. Defaults to the manager's project root.
+        download_progress_callback (callable): Per-file download progress (see CourseDownloadScheduler).
+        on_downloads_finished (callable): Called once every page is listed and downloaded, before
+                                          the remaining ingestion finishes.
+        ensure_index_ready (callable): Called before the first ingest; returning False skips ingestion.
+        status_callback (callable): Receives short human-readable status strings.
+        should_cancel (callable): Polled between pages and while downloads run; once it returns True
+                                  queued downloads and page ingests are cancelled and orphaned
+                                  files are left alone.
+        job_scheduler (JobScheduler): Scheduler whose "cpu" pool ingests the pages, as background jobs
+                                      named "Sync ingest ...". Defaults to a private single-worker scheduler.
+
+    Returns:
+        dict: Diff summary with lists of file IDs under "added", "modified", "unchanged",
+              "removed" and "failed", plus "list_result" from listCourseMaterial and "cancelled".
+
+    Files are listed page by page. Files whose Canvas modified_at or size changed are downloaded
+    again, and each page is submitted as a CPU job once its downloads finish. Only files whose content hash
+    changed have their chunks deleted and rebuilt; unchanged files keep their chunks. A file is only
+    recorded in the manifest once ingestion reports it fully indexed; files that fail are counted as
+    failed, their partial chunks are dropped and the next sync ingests them again. Files that
+    disappeared from Canvas are removed from the index once the full list has been fetched.
+    """
+    project_root = project_root or weaviate_manager.project_root
+    course_dir = os.path.join(project_root, "Courses", str(course_id))
+    os.makedirs(course_dir, exist_ok=True)
+
+    manifest = SyncManifest(course_dir)
+    previously_synced_ids = manifest.file_ids()
+    summary = {"added": [], "modified": [], "unchanged": [], "removed": [], "failed": [], "list_result": None, "cancelled": False}
+    listed_ids = set()
+    index_state = {"ready": None}
+
+    def report(msg):
+        print_sync_status(msg)
+        if status_callback:
+            status_callback(msg)
+
+    def is_cancelled() -> bool:
+        if not summary["cancelled"] and should_cancel and should_cancel():
+            summary["cancelled"] = True
+            report(f"Sync of course {course_id} cancelled.")
+        return summary["cancelled"]
+
+    def index_ready() -> bool:
+        if index_state["ready"] is None:
+            index_state["ready"] = ensure_index_ready() if ensure_index_ready else True
+        return index_state["ready"]
+
+    downloader = gu.CourseDownloadScheduler(course_id, headers, progress_callback=download_progress_callback)
+    owns_scheduler = job_scheduler is None
+    if owns_scheduler:
+        job_scheduler = JobScheduler(io_workers=1, cpu_workers=1, reserved_workers=0)
+    page_ingests = [] # {"submitted": Event, "job": Job or None} per listed page
+    page_ingests_lock = threading.Lock()
+
+    def process_page(page_files: list):
+        if is_cancelled():
+            return
+
+        modified_ids = []
+        hashed_files = []
+        for file_info in page_files:
+            if not isinstance(file_info, dict) or "id" not in file_info:
+                continue
+            local_file_path = os.path.join(course_dir, file_info.get("filename", ""))
+            if not file_info.get("filename", "").lower().endswith(downloader.extensions):
+                continue
+            if not os.path.exists(local_file_path):
+                summary["failed"].append(file_info["id"])
+                continue
+            try:
+                sha256 = compute_file_hash(local_file_path)
+            except IOError as e:
+                print_sync_warning(f"Could not hash {local_file_path}: {e}")
+                summary["failed"].append(file_info["id"])
+                continue
+
+            entry = manifest.get(file_info["id"])
+            if entry is None:
+                change = "added"
+            elif entry.get("sha256") != sha256:
+                change = "modified"
+                modified_ids.append(file_info["id"])
+            else:
+                change = "unchanged"
+            summary[change].append(file_info["id"])
+            hashed_files.append((file_info, sha256, change))
+
+        # The manifest is only updated once the index reflects the new content
+        if not index_ready():
+            print_sync_warning(f"Search index not ready; skipping ingestion of {len(page_files)} files for course {course_id}.")
+            return
+
+        # Changed content: drop the old chunks so the new version is chunked from scratch
+        if modified_ids:
+            weaviate_manager.delete_file_chunks(course_id, modified_ids)
+        # Unchanged files are skipped by the chunk existence check inside ingestion
+        ingested_ids = weaviate_manager.ingest_course_files_and_chunks(course_id, files_metadata=page_files)
+        failed_ids = []
+        for file_info, sha256, change in hashed_files:
+            if file_info["id"] in ingested_ids:
+                manifest.record(file_info, sha256)
+            else:
+                summary[change].remove(file_info["id"])
+                failed_ids.append(file_info["id"])
+        if failed_ids:
+            # Drop partly written chunks and forget the files, so the next sync ingests them from scratch
+            print_sync_warning(f"{len(failed_ids)} files of course {course_id} were not fully indexed; they are retried on the next sync.")
+            weaviate_manager.delete_file_chunks(course_id, failed_ids)
+            manifest.remove(failed_ids)
+            summary["failed"].extend(failed_ids)
+        manifest.save()
+
+    def ingest_page(page_files: list):
+        try:
+            process_page(page_files)
+        except Exception as e:
+            print_sync_warning(f"Failed to sync a page of files for course {course_id}: {e}")
+
+    def ingest_when_downloaded(page_files: list, page_downloads: list):
+        """Submits the page to the CPU pool once its downloads are done, so no worker waits on the network."""
+        with page_ingests_lock:
+            page_number = len(page_ingests) + 1
+            page_ingest = {"submitted": threading.Event(), "job": None}
+            page_ingests.append(page_ingest)
+        # One extra count, released below once every callback is attached, so a finished download cannot submit early
+        remaining = [len(page_downloads) + 1]
+
+        def submit(_=None):
+            with page_ingests_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            if not is_cancelled():
+                page_ingest["job"] = job_scheduler.submit(
+                    ingest_page, page_files, name=f"Sync ingest: course {course_id} page {page_number}",
+                    pool="cpu", priority=PRIORITY_BACKGROUND
+                )
+            page_ingest["submitted"].set()
+
+        for future in page_downloads:
+            future.add_done_callback(submit)
+        submit()
+
+    def on_file_list_page(page_files: list):
+        if is_cancelled():
+            return
+        changed_on_canvas = []
+        not_changed = []
+        for file_info in page_files:
+            if not isinstance(file_info, dict):
+                continue
+            if "id" in file_info:
+                listed_ids.add(file_info["id"])
+            local_file_path = os.path.join(course_dir, file_info.get("filename", ""))
+            if manifest.needs_redownload(file_info, local_file_path):
+                changed_on_canvas.append(file_info)
+            else:
+                not_changed.append(file_info)
+
+        page_downloads = downloader.submit_files(not_changed) + downloader.submit_files(changed_on_canvas, overwrite=True)
+        ingest_when_downloaded(page_files, page_downloads)
+
+    try:
+        report(f"Fetching file list for course {course_id}...")
+        summary["list_result"] = gu.listCourseMaterial(course_id, base_url, headers, on_page=on_file_list_page, session=downloader.session)
+        downloader.wait(should_cancel=is_cancelled)
+        if on_downloads_finished:
+            on_downloads_finished()
+
+        for page_ingest in page_ingests:
+            page_ingest["submitted"].wait()
+            page_job = page_ingest["job"]
+            while page_job is not None and not page_job.wait(0.5):
+                if is_cancelled():
+                    page_job.cancel() # Drops a queued page; a running one finishes its current ingest
+    finally:
+        if owns_scheduler:
+            job_scheduler.shutdown()
+
+    # Only trust "missing from Canvas" when the whole list was fetched
+    if summary["list_result"] == "Successful" and not is_cancelled():
+        removed_ids = sorted(previously_synced_ids - listed_ids)
+        if removed_ids and index_ready():
+            weaviate_manager.remove_course_files(course_id, removed_ids)
+            manifest.remove(removed_ids)
+            summary["removed"] = removed_ids
+    manifest.save()
+
+    report(
+        f"Course {course_id} synced: {len(summary['added'])} added, {len(summary['modified'])} modified, "
+        f"{len(summary['unchanged'])} unchanged, {len(summary['removed'])} removed, {len(summary['failed'])} failed."
+    )
+    return summary
@@ -1,5 +1,8 @@
 import os
 import json
+import threading
+from collections import OrderedDict
+from .model_registry import get_embedding_model, DEFAULT_EMBEDDING_MODEL
 
 # Determine project root from general_utils.py's location
 UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -72,11 +75,52 @@ def extract_course_name_id_pairs(json_file_path: str) -> list:
     return courses_data
 
 
+# Function to iterate over every page of a paginated Canvas API endpoint
+def iter_canvas_pages(url: str, headers: dict, session=None, per_page: int = 100):
+    """
+    Fetch a paginated Canvas API list, following the rel="next" Link header.
+
+    Args:
+        url (str): The first page URL (without per_page; it is added here).
+        headers (dict): The headers to include in the request.
+        session (requests.Session): Optional pooled session (see create_canvas_session).
+        per_page (int): Page size requested from Canvas.
+
+    Yields:
+        list: The JSON list of each page, as soon as it arrives.
+
+    Raises:
+        requests.HTTPError: If Canvas returns a non-200 status for any page.
+        requests.RequestException: On connection errors.
+    """
+    import requests
+
+    http = session if session is not None else requests
+    separator = '&' if '?' in url else '?'
+    next_url = f"{url}{separator}per_page={per_page}"
+    while next_url:
+        response = http.get(next_url, headers=headers)
+        if response.status_code != 200:
+            raise requests.HTTPError(f"{response.status_code}, {response.text}", response=response)
+        page = response.json()
+        yield page if isinstance(page, list) else [page]
+        next_url = response.links.get("next", {}).get("url")
+
+
+def _write_json_atomic(path: str, data):
+    """Writes JSON to path via a temp file, so readers never see a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=4)
+    os.replace(tmp_path, path)
+
+
 # Function to get list of all classes
 def getAllClasses(BASE_URL: str, headers: dict) -> str:
     """
     Get all classes from the given base URL and headers.
     This function retrieves a list of courses from the API and saves it to a JSON file (classList.json).
+    Every page of the course list is fetched.
 
     Args:
         BASE_URL (str): The base URL for the API.
@@ -88,34 +132,33 @@ def getAllClasses(BASE_URL: str, headers: dict) -> str:
     import requests
 
     # Get list of courses
-    response = requests.get(f'{BASE_URL}courses?per_page=100', headers=headers)
+    courses = []
+    try:
+        for page in iter_canvas_pages(f'{BASE_URL}courses', headers):
+            courses.extend(page)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching courses: {e}")
+        return "ERROR"
 
-    # Check if request was successful
-    if response.status_code == 200:
-        courses = response.json()
-        
-        # Ensure the resources directory exists
-        resources_dir = os.path.join(PROJECT_ROOT_FROM_UTILS, "resources")
-        if not os.path.exists(resources_dir):
-            os.makedirs(resources_dir)
-            print(f"Created directory: {resources_dir}")
+    # Ensure the resources directory exists
+    resources_dir = os.path.join(PROJECT_ROOT_FROM_UTILS, "resources")
+    if not os.path.exists(resources_dir):
+        os.makedirs(resources_dir)
+        print(f"Created directory: {resources_dir}")
 
-        classlist_path = os.path.join(resources_dir, "ClassList.json")
-        try:
-            with open(classlist_path, "w") as file:
-                json.dump(courses, file, indent=4)
-            print(f"Successfully saved ClassList to: {classlist_path}")
-            return "Successful"
-        except IOError as e:
-            print(f"Error writing ClassList.json: {e}")
-            return "ERROR"
-    else:
-        print(f"Error fetching courses: {response.status_code}, {response.text}")
+    classlist_path = os.path.join(resources_dir, "ClassList.json")
+    try:
+        with open(classlist_path, "w") as file:
+            json.dump(courses, file, indent=4)
+        print(f"Successfully saved ClassList ({len(courses)} courses) to: {classlist_path}")
+        return "Successful"
+    except IOError as e:
+        print(f"Error writing ClassList.json: {e}")
         return "ERROR"
     
 
 # Function to get list of files in given class
-def listCourseMaterial(classId: int, BASE_URL: str, headers: dict) -> str:
+def listCourseMaterial(classId: int, BASE_URL: str, headers: dict, on_page=None, session=None) -> str:
     """
     Get all files from a specific course
 
@@ -123,18 +166,20 @@ def listCourseMaterial(classId: int, BASE_URL: str, headers: dict) -> str:
         classId (int): The ID of the course.
         BASE_URL (str): The base URL for the API.
         headers (dict): The headers to include in the request.
+        on_page (callable): Optional callback receiving each page's list of file dicts as it arrives,
+                            after files.json has been updated with it.
+        session (requests.Session): Optional pooled session (see create_canvas_session).
 
     Returns:
         str: "Successful" if the request was successful, otherwise "ERROR".
 
     This function retrieves the files associated with a course and saves them to a JSON file (files.json).
     This function also checks if the course ID is valid and if the request was successful.
+    Every page of the file list is fetched, and files.json is rewritten after each page so
+    downloads and ingestion can start before the last page arrives.
     """
     import requests
 
-    # Get course files
-    response = requests.get(f'{BASE_URL}courses/{classId}/files?per_page=100', headers=headers)
-
     course_dir = os.path.join(PROJECT_ROOT_FROM_UTILS, "Courses", str(classId))
     if not os.path.exists(course_dir):
         os.makedirs(course_dir)
@@ -142,101 +187,320 @@ def listCourseMaterial(classId: int, BASE_URL: str, headers: dict) -> str:
 
     file_json_path = os.path.join(course_dir, "files.json")
 
-    if response.status_code == 200:
-        files_metadata = response.json()
-        try:
-            with open(file_json_path, "w") as file:
-                json.dump(files_metadata, file, indent=4)
-            print(f"Successfully saved files metadata to: {file_json_path}")
-            return "Successful"
-        except IOError as e:
-            print(f"Error writing {file_json_path}: {e}")
-            return "ERROR"
-    else:
-        error_message = f"Error fetching files for course {classId}: {response.status_code}, {response.text}"
+    # Get course files
+    files_metadata = []
+    try:
+        for page_number, page in enumerate(iter_canvas_pages(f'{BASE_URL}courses/{classId}/files', headers, session=session), start=1):
+            files_metadata.extend(page)
+            _write_json_atomic(file_json_path, files_metadata)
+            print(f"Saved page {page_number} of files metadata ({len(files_metadata)} files so far) to: {file_json_path}")
+            if on_page:
+                on_page(page)
+    except requests.exceptions.RequestException as e:
+        error_message = f"Error fetching files for course {classId}: {e}"
         print(error_message)
-        try:
-            # Still write error into json file
-            with open(file_json_path, "w") as file:
-                json.dump({"error": error_message, "status_code": response.status_code, "response_text": response.text}, file, indent=4)
-        except IOError as e:
-            print(f"Error writing error details to {file_json_path}: {e}")
+        if not files_metadata:
+            response = getattr(e, "response", None)
+            try:
+                # Still write error into json file
+                with open(file_json_path, "w") as file:
+                    json.dump({
+                        "error": error_message,
+                        "status_code": getattr(response, "status_code", None),
+                        "response_text": getattr(response, "text", None)
+                    }, file, indent=4)
+            except IOError as e:
+                print(f"Error writing error details to {file_json_path}: {e}")
+        return "ERROR"
+    except IOError as e:
+        print(f"Error writing {file_json_path}: {e}")
         return "ERROR"
+
+    print(f"Successfully saved files metadata ({len(files_metadata)} files) to: {file_json_path}")
+    return "Successful"
     
 
+# File types the app downloads and knows how to extract text from
+SUPPORTED_DOWNLOAD_EXTENSIONS = ('.pptx', '.pdf', '.docx', '.txt')
+# (connect, read) seconds; the read timeout applies to each wait for data, so a stalled transfer fails
+DOWNLOAD_TIMEOUT = (10, 60)
+
+
+# Function to create a pooled HTTP session for Canvas requests
+def create_canvas_session(headers: dict, pool_size: int = 8, retries: int = 3):
+    """
+    Create a requests.Session that reuses connections to Canvas.
+
+    Args:
+        headers (dict): Headers sent with every request (e.g. the Authorization header).
+        pool_size (int): Maximum number of pooled connections per host. Should be at least
+                         the number of threads sharing the session.
+        retries (int): Number of retries for connection errors and 429/5xx responses.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    session.headers.update(headers)
+    retry_policy = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",)
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry_policy)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 # Function to download a course file given filename and file_path
-def downloadCourseFile(filename: str, download_url: str, full_save_path: str, headers: dict) -> str:
+def downloadCourseFile(filename: str, download_url: str, full_save_path: str, headers: dict, session=None, overwrite: bool = False,
+                       timeout=DOWNLOAD_TIMEOUT) -> str:
     """
     Download a course file from the given URL and save it to the specified full_save_path.
-    Checks if the file already exists before downloading.
+    Checks if the file already exists before downloading, unless overwrite is True
+    (used when Canvas reports that the file changed).
+    If a session is given (see create_canvas_session) its pooled connections are reused.
+    timeout is the (connect, read) timeout in seconds; a failed download leaves no partial file behind.
     """
     import requests
 
-    if os.path.exists(full_save_path):
+    if os.path.exists(full_save_path) and not overwrite:
         print(f"SKIPPING: {filename} already exists at {full_save_path}")
         return "File already exists"
 
+    # Write to a temp file so an interrupted download is never mistaken for a finished one
+    partial_save_path = full_save_path + ".part"
     try:
-        response = requests.get(download_url, headers=headers, stream=True)
+        http = session if session is not None else requests
+        response = http.get(download_url, headers=headers, stream=True, timeout=timeout)
         response.raise_for_status() # Raise HTTPError if HTTP request returned unsuccessful status code
 
-        with open(full_save_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192): # Download in chunks
+        with open(partial_save_path, 'wb') as file:
+            for chunk in response.iter_content(chunk_size=65536): # Download in chunks
                 file.write(chunk)
+        os.replace(partial_save_path, full_save_path)
         print(f"DOWNLOADED: {filename} to {full_save_path}")
         return "Successful"
     except requests.exceptions.RequestException as e:
         print(f"ERROR: Failed to download {filename}. Exception: {e}")
+        _remove_partial_download(partial_save_path)
         return "ERROR"
     except IOError as e:
         print(f"ERROR: Failed to write {filename} to {full_save_path}. Exception: {e}")
+        _remove_partial_download(partial_save_path)
         return "ERROR"
 
 
-def get_specific_course_material(classId: int, headers: dict, file_extension: str) -> str:
-    """Helper function to download files of a specific type for a course."""
-    course_files_dir = os.path.join(PROJECT_ROOT_FROM_UTILS, "Courses", str(classId))
-    files_json_path = os.path.join(course_files_dir, "files.json")
+def _remove_partial_download(partial_save_path: str):
+    try:
+        os.remove(partial_save_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"ERROR: Could not remove partial download {partial_save_path}. Exception: {e}")
+
+
+class CourseDownloadScheduler:
+    """
+    Downloads course files concurrently over one pooled Canvas session.
+
+    Files are queued with submit_files() (which may be called repeatedly, e.g. once per
+    page of the Canvas file list) and wait() blocks until every queued download is done.
+    cancel_pending() drops the downloads that have not started yet.
+    progress_callback, if given, is called from worker threads after each file with a dict:
+    {"filename", "result", "completed", "total", "bytes_downloaded", "bytes_per_second"}.
+    """
+
+    def __init__(self, classId: int, headers: dict, extensions: tuple = SUPPORTED_DOWNLOAD_EXTENSIONS,
+                 max_workers: int = 4, progress_callback=None, session=None):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.classId = classId
+        self.headers = headers
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.course_files_dir = os.path.join(PROJECT_ROOT_FROM_UTILS, "Courses", str(classId))
+        os.makedirs(self.course_files_dir, exist_ok=True)
+
+        self.progress_callback = progress_callback
+        self._owns_session = session is None
+        self.session = session if session is not None else create_canvas_session(headers, pool_size=max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"download-{classId}")
+        self._futures = []
+        self._queued_paths = set()
+        self._lock = threading.Lock()
+
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+        self._started_at = time.monotonic()
+
+    def submit_files(self, files_metadata: list, overwrite: bool = False) -> list:
+        """
+        Queue every file in a Canvas file list whose name matches one of the scheduler's extensions.
+        With overwrite=True, files that already exist locally are downloaded again.
+
+        Returns:
+            list: The futures of the downloads queued by this call. Each resolves to the
+                  downloadCourseFile result string.
+        """
+        queued = []
+        for file_info in files_metadata:
+            if not isinstance(file_info, dict):
+                continue
+            filename = file_info.get('filename')
+            download_url = file_info.get('url')
+            if not filename or not filename.lower().endswith(self.extensions):
+                continue
+            if not download_url:
+                print(f"Skipping file {filename}: Missing download URL.")
+                with self._lock:
+                    self.failed += 1
+                continue
+
+            target_path = os.path.join(self.course_files_dir, filename)
+            with self._lock:
+                # Never let two workers write the same path
+                if target_path in self._queued_paths:
+                    continue
+                self._queued_paths.add(target_path)
+                self.total += 1
+            future = self._executor.submit(self._download_one, filename, download_url, target_path, overwrite)
+            self._futures.append(future)
+            queued.append(future)
+        return queued
+
+    def _download_one(self, filename: str, download_url: str, target_path: str, overwrite: bool = False) -> str:
+        import time
+
+        result = downloadCourseFile(filename, download_url, target_path, self.headers, session=self.session, overwrite=overwrite)
+        with self._lock:
+            self.completed += 1
+            if result == "Successful":
+                try:
+                    self.bytes_downloaded += os.path.getsize(target_path)
+                except OSError:
+                    pass
+            elif result != "File already exists":
+                self.failed += 1
+            elapsed = max(time.monotonic() - self._started_at, 1e-6)
+            progress = {
+                "filename": filename,
+                "result": result,
+                "completed": self.completed,
+                "total": self.total,
+                "bytes_downloaded": self.bytes_downloaded,
+                "bytes_per_second": self.bytes_downloaded / elapsed,
+            }
+        if self.progress_callback:
+            try:
+                self.progress_callback(progress)
+            except Exception as e:
+                print(f"Warning: Download progress callback failed: {e}")
+        return result
+
+    def cancel_pending(self) -> int:
+        """Cancels the queued downloads that have not started; running ones finish. Returns the number cancelled."""
+        cancelled = sum(1 for future in list(self._futures) if future.cancel())
+        if cancelled:
+            print(f"Cancelled {cancelled} pending downloads for course {self.classId}.")
+        return cancelled
+
+    def wait(self, should_cancel=None) -> str:
+        """
+        Block until every queued download has finished, then release the worker threads.
+
+        Args:
+            should_cancel (callable): Polled while waiting; once it returns True the downloads that
+                                      have not started are cancelled and only the running ones are awaited.
+
+        Returns:
+            str: "Successful" if every file downloaded or already existed, "Cancelled" if cancelled, otherwise "ERROR".
+        """
+        import time
+        from concurrent.futures import wait as wait_for_futures
+
+        cancelled = False
+        while wait_for_futures(self._futures, timeout=None if should_cancel is None or cancelled else 0.5).not_done:
+            if should_cancel():
+                cancelled = True
+                self.cancel_pending()
+        self._executor.shutdown(wait=True)
+        if self._owns_session:
+            self.session.close()
+
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        print(f"Downloaded {self.completed}/{self.total} files for course {self.classId}: "
+              f"{self.bytes_downloaded / (1024 * 1024):.1f} MB in {elapsed:.1f}s "
+              f"({self.bytes_downloaded / elapsed / 1024:.0f} KB/s), {self.failed} failed.")
+        if cancelled:
+            return "Cancelled"
+        return "Successful" if self.failed == 0 else "ERROR"
+
+
+def _load_course_files_json(classId: int):
+    """Reads Courses/<classId>/files.json, returning the file list or None if it is missing or invalid."""
+    files_json_path = os.path.join(PROJECT_ROOT_FROM_UTILS, "Courses", str(classId), "files.json")
 
     if not os.path.exists(files_json_path):
         print(f"ERROR: '{files_json_path}' not found. Ensure listCourseMaterial() ran successfully first for course {classId}.")
-        return "ERROR"
+        return None
 
     try:
         with open(files_json_path, 'r') as file:
             files_metadata = json.load(file)
     except json.JSONDecodeError:
         print(f"ERROR: Could not decode JSON from {files_json_path}.")
-        return "ERROR"
+        return None
     except IOError:
         print(f"ERROR: Could not read {files_json_path}.")
-        return "ERROR"
+        return None
 
     if not isinstance(files_metadata, list): # Handle cases where files.json might contain an error object
         print(f"ERROR: Expected a list of files in {files_json_path}, but found: {type(files_metadata)}. Content: {files_metadata}")
+        return None
+
+    return files_metadata
+
+
+# Function to download every supported file of a course in one pass
+def download_course_materials(classId: int, headers: dict, extensions: tuple = SUPPORTED_DOWNLOAD_EXTENSIONS,
+                              max_workers: int = 4, progress_callback=None) -> str:
+    """
+    Download all files of the given types for a course, reading files.json once.
+
+    Args:
+        classId (int): The ID of the course.
+        headers (dict): The headers to include in the requests.
+        extensions (tuple): File extensions to download.
+        max_workers (int): Maximum number of concurrent downloads.
+        progress_callback (callable): Optional per-file progress callback (see CourseDownloadScheduler).
+
+    Returns:
+        str: "Successful", "No files of this type" if nothing matched, otherwise "ERROR".
+    """
+    files_metadata = _load_course_files_json(classId)
+    if files_metadata is None:
         return "ERROR"
 
-    specific_files = [f for f in files_metadata if isinstance(f, dict) and f.get('filename', '').endswith(file_extension)]
-    
-    if not specific_files:
-        print(f"No '{file_extension}' files found for course {classId}.")
+    scheduler = CourseDownloadScheduler(classId, headers, extensions=extensions, max_workers=max_workers, progress_callback=progress_callback)
+    if not scheduler.submit_files(files_metadata) and scheduler.failed == 0:
+        scheduler.wait()
+        print(f"No {', '.join(extensions)} files found for course {classId}.")
         return "No files of this type"
+    return scheduler.wait()
 
-    all_successful = True
-    for file_info in specific_files:
-        download_url = file_info.get('url')
-        filename = file_info.get('filename')
 
-        if download_url and filename:
-            download_target_path = os.path.join(course_files_dir, filename)
-            result = downloadCourseFile(filename, download_url, download_target_path, headers)
-            if result not in ["Successful", "File already exists"]:
-                all_successful = False
-        else:
-            print(f"Skipping file {filename or 'Unknown name'}: Missing download URL or filename.")
-            all_successful = False
-            
-    return "Successful" if all_successful else "ERROR"
+def get_specific_course_material(classId: int, headers: dict, file_extension: str) -> str:
+    """Helper function to download files of a specific type for a course."""
+    return download_course_materials(classId, headers, extensions=(file_extension,))
 
 
 # Function to get list of pptx files in given class
@@ -272,19 +536,16 @@ def extractTextFromPPTX(filePath: str) -> list[tuple[str, str]]:
     from pptx import Presentation
     
     text_with_locations = []
-    try:
-        prs = Presentation(filePath)
-        for i, slide in enumerate(prs.slides):
-            slide_text = ""
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    slide_text += shape.text + "\n"
-            if slide_text.strip(): 
-                text_with_locations.append((slide_text.strip(), f"Slide {i + 1}"))
-        if not text_with_locations:
-            print(f"[GENERAL_UTILS_WARNING] No text extracted from PPTX: {filePath}")
-    except Exception as e:
-        print(f"[GENERAL_UTILS_ERROR] Failed to extract text from PPTX {filePath}: {e}")
+    prs = Presentation(filePath)
+    for i, slide in enumerate(prs.slides):
+        slide_text = ""
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                slide_text += shape.text + "\n"
+        if slide_text.strip(): 
+            text_with_locations.append((slide_text.strip(), f"Slide {i + 1}"))
+    if not text_with_locations:
+        print(f"[GENERAL_UTILS_WARNING] No text extracted from PPTX: {filePath}")
     return text_with_locations
 
 
@@ -296,18 +557,15 @@ def extractTextFromPdf(filePath: str) -> list[tuple[str, str]]:
     from pdfminer.layout import LTTextContainer
     
     text_with_locations = []
-    try:
-        for i, page_layout in enumerate(extract_pages(filePath)):
-            page_text = ""
-            for element in page_layout:
-                if isinstance(element, LTTextContainer):
-                    page_text += element.get_text()
-            if page_text.strip():
-                text_with_locations.append((page_text.strip(), f"Page {i + 1}"))
-        if not text_with_locations:
-             print(f"[GENERAL_UTILS_WARNING] No text extracted from PDF: {filePath}")
-    except Exception as e:
-        print(f"[GENERAL_UTILS_ERROR] Failed to extract text from PDF {filePath}: {e}")
+    for i, page_layout in enumerate(extract_pages(filePath)):
+        page_text = ""
+        for element in page_layout:
+            if isinstance(element, LTTextContainer):
+                page_text += element.get_text()
+        if page_text.strip():
+            text_with_locations.append((page_text.strip(), f"Page {i + 1}"))
+    if not text_with_locations:
+         print(f"[GENERAL_UTILS_WARNING] No text extracted from PDF: {filePath}")
     return text_with_locations
 
 
@@ -317,16 +575,13 @@ def extractTextFromDocx(filePath: str) -> list[tuple[str, str]]:
     from docx import Document
     
     text_with_locations = []
-    try:
-        doc = Document(filePath)
-        
-        for i, para in enumerate(doc.paragraphs):
-            if para.text.strip():
-                text_with_locations.append((para.text.strip(), f"Paragraph {i + 1}"))
-        if not text_with_locations:
-            print(f"[GENERAL_UTILS_WARNING] No text extracted from DOCX: {filePath}")
-    except Exception as e:
-        print(f"[GENERAL_UTILS_ERROR] Failed to extract text from DOCX {filePath}: {e}")
+    doc = Document(filePath)
+    
+    for i, para in enumerate(doc.paragraphs):
+        if para.text.strip():
+            text_with_locations.append((para.text.strip(), f"Paragraph {i + 1}"))
+    if not text_with_locations:
+        print(f"[GENERAL_UTILS_WARNING] No text extracted from DOCX: {filePath}")
     return text_with_locations
 
 
@@ -334,36 +589,210 @@ def extractTextFromDocx(filePath: str) -> list[tuple[str, str]]:
 def extractTextFromTxt(filePath: str) -> list[tuple[str, str]]:
     """Extracts text from a TXT file."""
     text_with_locations = []
+    with open(filePath, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if content.strip():
+        text_with_locations.append((content.strip(), "File Content"))
+    else:
+        print(f"[GENERAL_UTILS_WARNING] No text extracted from TXT: {filePath}")
+    return text_with_locations
+
+
+# Function to extract text from any supported file based on its extension
+def extract_text_segments(filePath: str) -> list[tuple[str, str]]:
+    """
+    Extracts (text, location) segments from a PDF, PPTX, DOCX or TXT file.
+
+    Args:
+        filePath (str): Path to the file. The extractor is picked from the file extension.
+
+    Returns:
+        list[tuple[str, str]]: The extracted segments, or an empty list for unsupported types
+                               and files without text. Unreadable files raise.
+    """
+    extractors = {
+        "pdf": extractTextFromPdf,
+        "pptx": extractTextFromPPTX,
+        "docx": extractTextFromDocx,
+        "txt": extractTextFromTxt,
+    }
+    file_extension = filePath.split('.')[-1].lower()
+    extractor = extractors.get(file_extension)
+    if extractor is None:
+        print(f"[GENERAL_UTILS_WARNING] No text extractor for '.{file_extension}' files: {filePath}")
+        return []
+    return extractor(filePath)
+
+
+def _terminate_process_pool(executor):
+    """Kills the worker processes of a ProcessPoolExecutor so a stuck extraction cannot keep running."""
+    # ProcessPoolExecutor has no public way to kill a busy worker
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to extract text from many files in parallel worker processes
+def iter_extract_text_parallel(files, max_workers: int = None, max_in_flight: int = None, timeout_per_file: float = 180.0):
+    """
+    Extracts text from files across CPU cores, yielding results as each file finishes.
+
+    Args:
+        files (iterable): (key, file_path) pairs. The key is handed back with the file's result.
+        max_workers (int): Number of worker processes. Defaults to one less than the CPU count.
+                           Set to 0 to extract in the calling process instead.
+        max_in_flight (int): Maximum number of files submitted but not yet yielded. Defaults to max_workers.
+        timeout_per_file (float): Seconds a single file may run before it is abandoned.
+
+    Yields:
+        tuple: (key, list[tuple[str, str]]) for every input file, in completion order. Files that
+               fail, crash or time out yield None; files without text yield an empty list.
+
+    A file that exceeds its timeout is reported as failed, the worker pool is torn down to kill it,
+    and the other in-flight files are resubmitted to a fresh pool so one pathological PDF cannot
+    stall the rest of the course. A worker that dies (segfault, out of memory) breaks the whole
+    pool: the pool is rebuilt and the files it held are retried one at a time, so only a file that
+    crashes its worker on its own is reported as failed.
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) - 1)
+
+    if max_workers == 0:
+        for key, file_path in files:
+            try:
+                yield key, extract_text_segments(file_path)
+            except Exception as e:
+                print(f"[GENERAL_UTILS_ERROR] Failed to extract text from {file_path}: {e}")
+                yield key, None
+        return
+
+    max_in_flight = max(1, max_in_flight or max_workers)
+    pending_files = iter(files)
+    resubmit_files = [] # [key, file_path, suspect] to submit before new files; suspects were in a crashed pool
+    in_flight = {} # future -> [key, file_path, started_at, suspect]
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def restart_pool():
+        nonlocal executor
+        _terminate_process_pool(executor)
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
     try:
-        with open(filePath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        if content.strip():
-            text_with_locations.append((content.strip(), "File Content"))
+        exhausted = False
+        while True:
+            # Keep the pool fed without queueing the whole course at once; a suspect runs alone
+            isolate = any(entry[3] for entry in in_flight.values()) or any(entry[2] for entry in resubmit_files)
+            while len(in_flight) < (1 if isolate else max_in_flight):
+                if resubmit_files:
+                    key, file_path, suspect = resubmit_files.pop(0)
+                else:
+                    next_file = None if exhausted else next(pending_files, None)
+                    if next_file is None:
+                        exhausted = True
+                        break
+                    (key, file_path), suspect = next_file, False
+                try:
+                    future = executor.submit(extract_text_segments, file_path)
+                except BrokenProcessPool: # A worker died since the last wait; its futures report it below
+                    resubmit_files.insert(0, [key, file_path, suspect])
+                    if in_flight:
+                        break
+                    restart_pool()
+                    continue
+                in_flight[future] = [key, file_path, None, suspect]
+
+            if not in_flight:
+                break
+
+            done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                key, file_path = in_flight[future][:2]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    pool_broken = True
+                    continue
+                except Exception as e:
+                    print(f"[GENERAL_UTILS_ERROR] Failed to extract text from {file_path}: {e}")
+                    result = None
+                del in_flight[future]
+                yield key, result
+
+            if pool_broken:
+                # Every unfinished file of a broken pool fails, so the one that killed the worker is unknown
+                wait(list(in_flight))
+                crashed = []
+                for future, (key, file_path, _, _) in in_flight.items():
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        crashed.append((key, file_path))
+                        continue
+                    except Exception as e:
+                        print(f"[GENERAL_UTILS_ERROR] Failed to extract text from {file_path}: {e}")
+                        result = None
+                    yield key, result
+                in_flight = {}
+                if len(crashed) == 1:
+                    key, file_path = crashed[0]
+                    print(f"[GENERAL_UTILS_ERROR] Text extraction crashed its worker process: {file_path}")
+                    yield key, None
+                else:
+                    resubmit_files = [[key, file_path, True] for key, file_path in crashed] + resubmit_files
+                restart_pool()
+                continue
+
+            # Timeouts count from when a worker picks the file up, not from submission
+            now = time.monotonic()
+            timed_out = []
+            for future, entry in in_flight.items():
+                if entry[2] is None and future.running():
+                    entry[2] = now
+                elif entry[2] is not None and now - entry[2] > timeout_per_file:
+                    timed_out.append(future)
+
+            if timed_out:
+                for future in timed_out:
+                    key, file_path, _, _ = in_flight.pop(future)
+                    print(f"[GENERAL_UTILS_ERROR] Text extraction timed out after {timeout_per_file}s: {file_path}")
+                    yield key, None
+
+                # Restart the pool and resubmit the files that were still in flight
+                resubmit_files = [[key, file_path, suspect] for key, file_path, _, suspect in in_flight.values()] + resubmit_files
+                in_flight = {}
+                restart_pool()
+    finally:
+        if in_flight:
+            _terminate_process_pool(executor)
         else:
-            print(f"[GENERAL_UTILS_WARNING] No text extracted from TXT: {filePath}")
-    except Exception as e:
-        print(f"[GENERAL_UTILS_ERROR] Failed to extract text from TXT {filePath}: {e}")
-    return text_with_locations
+            executor.shutdown(wait=True)
 
 
 # Function to encode text using SentenceTransformer
-def encode_text(text: str):
+def encode_text(text: str, model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
     """
     Encode text using SentenceTransformer.
 
     Args:
         text (str): The text to be encoded.
+        model_name (str): The SentenceTransformer model to use.
+        device (str): Optional device for the model ('cpu', 'cuda', ...).
 
     Returns:
         np.ndarray: The encoded text as a numpy array.
         
-    This function uses the 'all-MiniLM-L6-v2' model from SentenceTransformer to encode the text.
+    This function uses the shared model from the model registry ('all-MiniLM-L6-v2' by default),
+    so the model is only loaded once per process.
     """
-    import numpy as np
-    from sentence_transformers import SentenceTransformer
-
-    # Load the model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = get_embedding_model(model_name, device)
 
     # Encode the text
     embedding = model.encode(text)
@@ -371,8 +800,146 @@ def encode_text(text: str):
     return embedding
 
 
+# Bounded LRU of query embeddings: (model_name, device, normalized query) -> read-only vector
+QUERY_EMBEDDING_CACHE_SIZE = 256
+_query_embedding_cache = OrderedDict()
+_query_embedding_cache_lock = threading.Lock()
+_query_embedding_cache_stats = {"hits": 0, "misses": 0}
+
+
+def normalize_query_text(text: str) -> str:
+    """Collapses runs of whitespace and strips the ends, so trivially different queries share a cache entry."""
+    return " ".join(text.split())
+
+
+def encode_query(query_text: str, model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
+    """
+    Encode a search query, reusing the embedding of recently seen queries.
+
+    Args:
+        query_text (str): The query to be encoded.
+        model_name (str): The SentenceTransformer model to use.
+        device (str): Optional device for the model ('cpu', 'cuda', ...).
+
+    Returns:
+        np.ndarray: The (read-only) query embedding.
+
+    Embeddings are kept in an LRU of QUERY_EMBEDDING_CACHE_SIZE entries keyed on the
+    normalized query text, the model and the device.
+    """
+    key = (model_name, device, normalize_query_text(query_text))
+    with _query_embedding_cache_lock:
+        embedding = _query_embedding_cache.get(key)
+        if embedding is not None:
+            _query_embedding_cache.move_to_end(key)
+            _query_embedding_cache_stats["hits"] += 1
+            return embedding
+        _query_embedding_cache_stats["misses"] += 1
+
+    embedding = encode_text(key[2], model_name, device)
+    embedding.setflags(write=False) # Shared between callers
+
+    with _query_embedding_cache_lock:
+        _query_embedding_cache[key] = embedding
+        _query_embedding_cache.move_to_end(key)
+        while len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return embedding
+
+
+def get_query_cache_stats() -> dict:
+    """Returns {"hits", "misses", "size"} for the query embedding cache."""
+    with _query_embedding_cache_lock:
+        return dict(_query_embedding_cache_stats, size=len(_query_embedding_cache))
+
+
+# Function to encode many texts at once using SentenceTransformer
+def encode_texts_batched(texts: list[str], batch_size: int = 64, model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
+    """
+    Encode a list of texts in batches, sorted by length to reduce padding waste.
+
+    Args:
+        texts (list[str]): The texts to be encoded.
+        batch_size (int): Number of texts passed to the model per forward pass.
+        model_name (str): The SentenceTransformer model to use.
+        device (str): Optional device for the model ('cpu', 'cuda', ...).
+
+    Returns:
+        np.ndarray: A float32 matrix of shape (len(texts), embedding_dim), rows in the same order as texts.
+
+    Texts of similar length are grouped into the same batch so the tokenizer pads each batch
+    to a short maximum length. The rows are scattered back into the original order before returning.
+    """
+    import numpy as np
+
+    model = get_embedding_model(model_name, device)
+    embedding_dim = model.get_sentence_embedding_dimension()
+
+    if not texts:
+        return np.empty((0, embedding_dim), dtype=np.float32)
+
+    # Longest first, so the slowest batches run while memory is freshest
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    embeddings = np.empty((len(texts), embedding_dim), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        batch_indices = order[start:start + batch_size]
+        batch_vectors = model.encode(
+            [texts[i] for i in batch_indices],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        embeddings[batch_indices] = batch_vectors
+
+    return embeddings
+
+
+# Function to make sure the NLTK sentence tokenizer data is installed (checked once per process)
+_punkt_available = None # None until checked
+_punkt_lock = threading.Lock()
+
+def ensure_nltk_punkt() -> bool:
+    """
+    Downloads NLTK's punkt sentence tokenizer data if it is missing.
+
+    Returns:
+        bool: True if the tokenizer data is available.
+
+    Newer NLTK releases tokenize with 'punkt_tab' while older ones use 'punkt'; both are fetched if missing.
+    nltk.data.find raises LookupError for a missing resource. This runs on first chunking (or in the
+    background after launch) rather than at import time, so it never delays the first window, and
+    only once per process so an offline machine does not retry the download for every file.
+    """
+    global _punkt_available
+    if _punkt_available is not None:
+        return _punkt_available
+    import nltk
+
+    with _punkt_lock:
+        if _punkt_available is None:
+            available = False
+            for resource in ("punkt_tab", "punkt"):
+                try:
+                    nltk.data.find(f"tokenizers/{resource}")
+                    available = True
+                except LookupError:
+                    print(f"NLTK '{resource}' tokenizer not found. Downloading...")
+                    if nltk.download(resource, quiet=True):
+                        available = True
+                    else:
+                        print(f"Warning: Could not download NLTK '{resource}'.")
+            _punkt_available = available
+        return _punkt_available
+
+
+# Boundary strategies understood by semantic_chunking / find_chunk_boundaries
+CHUNKING_STRATEGIES = ("centroid", "valley")
+
+
 # Function to perform semantic chunking based on given text
-def semantic_chunking(text: str, similarity_threshold: float = 0.6) -> list:
+def semantic_chunking(text: str, similarity_threshold: float = 0.6, model_name: str = DEFAULT_EMBEDDING_MODEL, return_vectors: bool = False,
+                      strategy: str = "centroid", max_tokens: int = None) -> list:
     """
     Perform semantic chunking on the given text.
     This function splits the text into chunks based on semantic similarity.
@@ -380,42 +947,165 @@ def semantic_chunking(text: str, similarity_threshold: float = 0.6) -> list:
     Args:
         text (str): The text to be chunked.
         similarity_threshold (float): The threshold for semantic similarity.
+        model_name (str): The SentenceTransformer model to use.
+        return_vectors (bool): If True, return (chunk_text, chunk_vector) pairs instead of plain text.
+        strategy (str): Boundary strategy, one of CHUNKING_STRATEGIES (see find_chunk_boundaries).
+        max_tokens (int): Optional cap on model tokens per chunk. Chunks that would exceed it are split
+                          at sentence boundaries.
 
     Returns:
-        list: A list of text chunks.
+        list: A list of text chunks, or a list of (str, np.ndarray) tuples when return_vectors is True.
 
-    This function uses the 'all-MiniLM-L6-v2' model from SentenceTransformer to encode the text.
+    This function uses the shared 'all-MiniLM-L6-v2' model from the model registry to encode the text.
     It uses NLTK for sentence tokenization and SentenceTransformer for semantic similarity.
     The function first tokenizes the text into sentences, then encodes each sentence.
-    It compares the similarity of each sentence with the current chunk's embedding.
-    If the similarity is above the threshold, it adds the sentence to the current chunk.
-    If the similarity is below the threshold, it creates a new chunk.
-    Finally, it returns a list of text chunks.
+    The boundaries between chunks are then found with NumPy by find_chunk_boundaries.
+    With return_vectors, each chunk vector is the normalized mean of its sentence embeddings,
+    which lets ingestion skip encoding the chunk text a second time.
     """
     import nltk
-    from sentence_transformers import SentenceTransformer, util
     import numpy as np
 
+    ensure_nltk_punkt()
     sentences = nltk.sent_tokenize(text)
+    if not sentences:
+        return []
 
     # Encode text
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    sentence_embeddings = model.encode(sentences)
+    model = get_embedding_model(model_name)
+    sentence_embeddings = np.asarray(model.encode(sentences, convert_to_numpy=True), dtype=np.float32)
 
-    chunks = []
-    current_chunk = [sentences[0]]
-    current_embedding = sentence_embeddings[0]
+    sentence_token_counts = None
+    if max_tokens:
+        sentence_token_counts = [len(ids) for ids in model.tokenizer(sentences, add_special_tokens=False)["input_ids"]]
 
-    for i in range(1, len(sentences)):
-        similarity = util.cos_sim(current_embedding.reshape(1, -1), sentence_embeddings[i].reshape(1, -1)).item()
+    chunk_sentence_ranges = find_chunk_boundaries(
+        sentence_embeddings,
+        similarity_threshold=similarity_threshold,
+        strategy=strategy,
+        sentence_token_counts=sentence_token_counts,
+        max_tokens=max_tokens
+    )
+    chunks = [" ".join(sentences[start:end]) for start, end in chunk_sentence_ranges]
 
-        if similarity > similarity_threshold:
-            current_chunk.append(sentences[i])
-            current_embedding = np.mean([current_embedding, sentence_embeddings[i]], axis=0) #update the current embedding with the new average.
-        else:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [sentences[i]]
-            current_embedding = sentence_embeddings[i]
-    chunks.append(" ".join(current_chunk)) #append the last chunk.
+    if not return_vectors:
+        return chunks
+
+    return list(zip(chunks, pool_sentence_embeddings(sentence_embeddings, chunk_sentence_ranges)))
+
+
+def find_chunk_boundaries(sentence_embeddings, similarity_threshold: float = 0.6, strategy: str = "centroid",
+                          sentence_token_counts: list[int] = None, max_tokens: int = None, lookahead: int = 64) -> list[tuple[int, int]]:
+    """
+    Groups consecutive sentences into chunks based on their embeddings.
+
+    Args:
+        sentence_embeddings (np.ndarray): Matrix of sentence embeddings, one row per sentence.
+        similarity_threshold (float): The threshold for semantic similarity.
+        strategy (str): "centroid" starts a new chunk when a sentence's cosine similarity to the
+                        centroid of the current chunk drops to the threshold or below.
+                        "valley" starts a new chunk at local minima of adjacent-sentence
+                        similarity that fall below the threshold.
+        sentence_token_counts (list[int]): Token count of each sentence, required for max_tokens.
+        max_tokens (int): Optional cap on the summed token count of each chunk.
+        lookahead (int): Number of sentences scored per vectorized step of the centroid strategy.
+
+    Returns:
+        list[tuple[int, int]]: Half-open (start, end) sentence ranges, one per chunk, covering every sentence.
+
+    Embeddings are normalized once. The centroid strategy keeps a running sum of the chunk's
+    embeddings (as prefix sums) so the centroid is the true mean of its sentences, and scores
+    up to `lookahead` upcoming sentences against it in a single matrix operation.
+    """
+    import numpy as np
+
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'. Expected one of {CHUNKING_STRATEGIES}.")
+
+    embeddings = np.asarray(sentence_embeddings, dtype=np.float32)
+    num_sentences = embeddings.shape[0]
+    if num_sentences == 0:
+        return []
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = embeddings / norms
+
+    boundaries = [0]
+    if strategy == "centroid":
+        # prefix_sums[i] is the sum of embeddings[:i]; a chunk [s, i) has sum prefix_sums[i] - prefix_sums[s]
+        prefix_sums = np.zeros((num_sentences + 1, embeddings.shape[1]), dtype=np.float64)
+        np.cumsum(embeddings, axis=0, out=prefix_sums[1:])
+
+        chunk_start = 0
+        candidate = 1
+        while candidate < num_sentences:
+            window_end = min(candidate + lookahead, num_sentences)
+            # Running sum (and count = i - chunk_start) of the chunk before each candidate sentence i
+            running_sums = prefix_sums[candidate:window_end] - prefix_sums[chunk_start]
+            sum_norms = np.linalg.norm(running_sums, axis=1)
+            sum_norms[sum_norms == 0] = 1.0
+            similarities = np.einsum("ij,ij->i", running_sums, embeddings[candidate:window_end]) / sum_norms
+
+            breaks = np.flatnonzero(similarities <= similarity_threshold)
+            if breaks.size == 0:
+                candidate = window_end
+                continue
+            chunk_start = candidate + int(breaks[0])
+            boundaries.append(chunk_start)
+            candidate = chunk_start + 1
+    else:
+        # adjacent[i - 1] is the similarity between sentence i - 1 and sentence i
+        adjacent = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+        padded = np.concatenate(([np.inf], adjacent, [np.inf]))
+        is_valley = (adjacent <= padded[:-2]) & (adjacent <= padded[2:]) & (adjacent <= similarity_threshold)
+        boundaries.extend(int(i) + 1 for i in np.flatnonzero(is_valley))
+
+    boundaries.append(num_sentences)
+    ranges = list(zip(boundaries[:-1], boundaries[1:]))
+
+    if max_tokens:
+        if sentence_token_counts is None or len(sentence_token_counts) != num_sentences:
+            raise ValueError("sentence_token_counts must have one entry per sentence when max_tokens is set.")
+        ranges = _split_ranges_by_token_cap(ranges, sentence_token_counts, max_tokens)
+
+    return ranges
+
+
+def _split_ranges_by_token_cap(ranges: list[tuple[int, int]], sentence_token_counts: list[int], max_tokens: int) -> list[tuple[int, int]]:
+    """Splits sentence ranges so no range sums to more than max_tokens (a single long sentence stays whole)."""
+    capped_ranges = []
+    for start, end in ranges:
+        piece_start = start
+        piece_tokens = 0
+        for i in range(start, end):
+            if i > piece_start and piece_tokens + sentence_token_counts[i] > max_tokens:
+                capped_ranges.append((piece_start, i))
+                piece_start = i
+                piece_tokens = 0
+            piece_tokens += sentence_token_counts[i]
+        capped_ranges.append((piece_start, end))
+    return capped_ranges
+
+
+def pool_sentence_embeddings(sentence_embeddings, sentence_ranges: list[tuple[int, int]]):
+    """
+    Mean-pools sentence embeddings into one unit-length vector per sentence range.
+
+    Args:
+        sentence_embeddings (np.ndarray): Matrix of sentence embeddings, one row per sentence.
+        sentence_ranges (list[tuple[int, int]]): Half-open (start, end) row ranges, one per chunk.
+
+    Returns:
+        np.ndarray: A float32 matrix with one pooled vector per range.
+    """
+    import numpy as np
+
+    sentence_embeddings = np.asarray(sentence_embeddings, dtype=np.float32)
+    pooled = np.empty((len(sentence_ranges), sentence_embeddings.shape[1]), dtype=np.float32)
+    for row, (start, end) in enumerate(sentence_ranges):
+        pooled[row] = sentence_embeddings[start:end].mean(axis=0)
 
-    return chunks
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return pooled / norms
@@ -0,0 +1,120 @@
+import json
+import os
+
+FUSION_RELATIVE_SCORE = "relative_score"
+FUSION_RRF = "rrf"
+FUSION_METHODS = (FUSION_RELATIVE_SCORE, FUSION_RRF)
+
+DEFAULT_ALPHA = 0.5
+DEFAULT_FUSION = FUSION_RELATIVE_SCORE
+RRF_K = 60 # Rank offset of reciprocal rank fusion, the value Weaviate and most papers use
+SEARCH_SETTINGS_FILENAME = "search_settings.json"
+
+def print_fusion_warning(msg): print(f"[FUSION_WARNING] {msg}")
+
+
+def relative_score_fusion(result_lists: list, weights: list, limit: int):
+    """
+    Fuses ranked result lists the way Weaviate's relativeScoreFusion does.
+
+    Args:
+        result_lists (list): One (ids, scores) pair per retriever, each sorted best first.
+                             IDs can be any hashable values (row numbers, UUIDs, ...).
+        weights (list): Weight of each retriever, e.g. [alpha, 1 - alpha].
+        limit (int): Number of fused results to return.
+
+    Returns:
+        tuple[list, list]: The top `limit` IDs and their fused scores, best first.
+
+    Each list's scores are min-max normalized to [0, 1], multiplied by its weight and summed per ID.
+    """
+    fused = {}
+    for (ids, scores), weight in zip(result_lists, weights):
+        if weight <= 0 or len(ids) == 0:
+            continue
+        scores = [float(score) for score in scores]
+        low, high = min(scores), max(scores)
+        for doc_id, score in zip(ids, scores):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return _top(fused, limit)
+
+
+def reciprocal_rank_fusion(result_lists: list, weights: list, limit: int, k: int = RRF_K):
+    """
+    Fuses ranked result lists by weighted reciprocal rank: sum of weight / (k + rank) per ID.
+
+    Arguments and return value are as in relative_score_fusion; only the ranks of the inputs matter,
+    so retrievers with incomparable score scales combine without normalization.
+    """
+    fused = {}
+    for (ids, _), weight in zip(result_lists, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ids, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return _top(fused, limit)
+
+
+def _top(fused: dict, limit: int):
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [doc_id for doc_id, _ in ranked], [score for _, score in ranked]
+
+
+def fuse_results(result_lists: list, weights: list, limit: int, method: str = DEFAULT_FUSION):
+    """Fuses ranked (ids, scores) lists with the given method (see FUSION_METHODS)."""
+    if method == FUSION_RRF:
+        return reciprocal_rank_fusion(result_lists, weights, limit)
+    if method == FUSION_RELATIVE_SCORE:
+        return relative_score_fusion(result_lists, weights, limit)
+    raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
+
+
+def load_search_settings(course_dir: str) -> dict:
+    """
+    Returns the hybrid search settings of a course: {"alpha": float, "fusion": str}.
+
+    Settings come from Courses/<course_id>/search_settings.json; missing or invalid values fall back
+    to DEFAULT_ALPHA and DEFAULT_FUSION.
+    """
+    settings = {"alpha": DEFAULT_ALPHA, "fusion": DEFAULT_FUSION}
+    path = os.path.join(course_dir, SEARCH_SETTINGS_FILENAME)
+    if not os.path.exists(path):
+        return settings
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            stored = json.load(file)
+        alpha = float(stored.get("alpha", DEFAULT_ALPHA))
+        if 0.0 <= alpha <= 1.0:
+            settings["alpha"] = alpha
+        if stored.get("fusion") in FUSION_METHODS:
+            settings["fusion"] = stored["fusion"]
+    except Exception as e:
+        print_fusion_warning(f"Ignoring unreadable search settings {path}: {e}")
+    return settings
+
+
+def save_search_settings(course_dir: str, alpha: float = None, fusion: str = None) -> dict:
+    """Updates the given hybrid search settings of a course and returns the full settings."""
+    if alpha is not None and not 0.0 <= alpha <= 1.0:
+        raise ValueError(f"alpha must be between 0 and 1, got {alpha}")
+    if fusion is not None and fusion not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{fusion}', expected one of {FUSION_METHODS}")
+    settings = load_search_settings(course_dir)
+    if alpha is not None:
+        settings["alpha"] = alpha
+    if fusion is not None:
+        settings["fusion"] = fusion
+    os.makedirs(course_dir, exist_ok=True)
+    path = os.path.join(course_dir, SEARCH_SETTINGS_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(settings, file, indent=4)
+    os.replace(tmp_path, path)
+    return settings
+
+
+def resolve_search_settings(course_dir: str = None, alpha: float = None, fusion: str = None):
+    """Returns (alpha, fusion): explicit values win, then the course's settings, then the defaults."""
+    settings = load_search_settings(course_dir) if course_dir else {"alpha": DEFAULT_ALPHA, "fusion": DEFAULT_FUSION}
+    return (settings["alpha"] if alpha is None else alpha), (fusion or settings["fusion"])
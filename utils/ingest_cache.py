@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from .model_registry import DEFAULT_EMBEDDING_MODEL
+
+# Bump when extractTextFrom* output changes, so cached segments are re-extracted
+EXTRACTOR_VERSION = 1
+# Bump when semantic_chunking output changes, so cached chunks/vectors are rebuilt
+CHUNKER_VERSION = 1
+
+CACHE_DIR_NAME = ".ingest_cache"
+
+def print_cache_status(msg): print(f"[INGEST_CACHE] {msg}")
+def print_cache_warning(msg): print(f"[INGEST_CACHE_WARNING] {msg}")
+
+
+def compute_file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode_json(data) -> np.ndarray:
+    return np.frombuffer(json.dumps(data, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_json(array: np.ndarray):
+    return json.loads(array.tobytes().decode("utf-8"))
+
+
+class IngestCache:
+    """
+    On-disk cache of extracted text segments, chunks and chunk vectors for one course.
+
+    Entries live under Courses/<course_id>/.ingest_cache/ and are keyed by the SHA-256 of
+    the file contents, so renamed or re-downloaded but unchanged files still hit. Segments
+    are keyed by EXTRACTOR_VERSION; chunks and vectors additionally by CHUNKER_VERSION, the
+    embedding model and how the vectors were produced. Each entry is a single .npz file
+    holding the text as UTF-8 JSON and the vectors as a float32 matrix.
+    """
+
+    def __init__(self, course_dir: str, model_name: str = DEFAULT_EMBEDDING_MODEL, vector_mode: str = "encoded"):
+        self.cache_dir = os.path.join(course_dir, CACHE_DIR_NAME)
+        self.model_name = model_name
+        self.vector_mode = vector_mode # "encoded" or "pooled"
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        chunk_key_source = f"chunker={CHUNKER_VERSION}|extractor={EXTRACTOR_VERSION}|model={model_name}|vectors={vector_mode}"
+        self._chunk_key = hashlib.sha256(chunk_key_source.encode("utf-8")).hexdigest()[:16]
+
+    def _segments_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.seg{EXTRACTOR_VERSION}.npz")
+
+    def _chunks_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.chunks-{self._chunk_key}.npz")
+
+    @staticmethod
+    def _write_npz(path: str, **arrays):
+        # Write to a temp file first so a crash never leaves a truncated entry behind
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(tmp_path, path)
+
+    def load_segments(self, file_hash: str):
+        """Returns cached [(text, location), ...] for the file, or None on a miss."""
+        path = self._segments_path(file_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return [tuple(segment) for segment in _decode_json(data["segments"])]
+        except Exception as e:
+            print_cache_warning(f"Ignoring unreadable segment cache {path}: {e}")
+            return None
+
+    def store_segments(self, file_hash: str, segments: list[tuple[str, str]]):
+        try:
+            self._write_npz(self._segments_path(file_hash), segments=_encode_json(segments))
+        except Exception as e:
+            print_cache_warning(f"Could not write segment cache for {file_hash}: {e}")
+
+    def load_chunks(self, file_hash: str):
+        """
+        Returns cached chunks for the file, or None on a miss.
+
+        Returns:
+            tuple: (chunks, vectors) where chunks is [(chunk_text, source_location), ...] and
+                   vectors is a float32 matrix with one row per chunk.
+        """
+        path = self._chunks_path(file_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                chunks = [tuple(chunk) for chunk in _decode_json(data["chunks"])]
+                vectors = data["vectors"].astype(np.float32, copy=False)
+            if len(chunks) != vectors.shape[0]:
+                raise ValueError(f"{len(chunks)} chunks but {vectors.shape[0]} vectors")
+            return chunks, vectors
+        except Exception as e:
+            print_cache_warning(f"Ignoring unreadable chunk cache {path}: {e}")
+            return None
+
+    def store_chunks(self, file_hash: str, chunks: list[tuple[str, str]], vectors: np.ndarray):
+        try:
+            self._write_npz(
+                self._chunks_path(file_hash),
+                chunks=_encode_json(chunks),
+                vectors=np.asarray(vectors, dtype=np.float32)
+            )
+        except Exception as e:
+            print_cache_warning(f"Could not write chunk cache for {file_hash}: {e}")
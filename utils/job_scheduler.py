@@ -0,0 +1,269 @@
+import bisect
+import itertools
+import threading
+import time
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BACKGROUND = 20
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+def print_scheduler_status(msg): print(f"[SCHEDULER] {msg}")
+def print_scheduler_warning(msg): print(f"[SCHEDULER_WARNING] {msg}")
+
+_current_job = threading.local()
+
+
+def get_current_job():
+    """Returns the Job running on the calling worker thread, or None outside the scheduler."""
+    return getattr(_current_job, "job", None)
+
+
+class JobCancelled(Exception):
+    """Raised by Job.raise_if_cancelled() to stop a cancelled job early."""
+
+
+class Job:
+    """
+    A unit of work run by the JobScheduler.
+
+    Jobs cancel cooperatively: cancel() marks a queued job so it never starts and sets
+    cancel_event for a running one, which the job checks through `cancelled` or
+    raise_if_cancelled(). Progress is reported with report(progress, message).
+    """
+
+    def __init__(self, job_id: int, name: str, pool: str, priority: int, func, args: tuple, kwargs: dict, scheduler):
+        self.job_id = job_id
+        self.name = name
+        self.pool = pool
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = JOB_QUEUED
+        self.progress = None # 0.0-1.0, or None when unknown
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._scheduler = scheduler
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.name)
+
+    def cancel(self):
+        self._scheduler.cancel(self.job_id)
+
+    def report(self, progress: float = None, message: str = None):
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+        self._scheduler._notify(self)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until the job finished, failed or was cancelled. Returns False on timeout."""
+        return self._done_event.wait(timeout)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "pool": self.pool,
+            "priority": self.priority,
+            "state": self.state,
+            "progress": self.progress,
+            "message": self.message,
+            "error": str(self.error) if self.error else None,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class _WorkerPool:
+    """Worker threads serving one priority-ordered queue. Caller holds the scheduler lock for queue access."""
+
+    def __init__(self, name: str, num_workers: int, reserved_workers: int):
+        self.name = name
+        self.num_workers = num_workers
+        # Background jobs never occupy the last reserved_workers threads, so interactive jobs always find one
+        self.max_background = max(1, num_workers - reserved_workers)
+        self.queue = [] # sorted [(priority, sequence, job)]
+        self.running_background = 0
+        self.threads = []
+
+    def next_job(self):
+        for position, (priority, _, job) in enumerate(self.queue):
+            if priority >= PRIORITY_BACKGROUND and self.running_background >= self.max_background:
+                continue
+            del self.queue[position]
+            return job
+        return None
+
+
+class JobScheduler:
+    """
+    Runs application work on two persistent thread pools: "io" for network, disk and Docker work
+    and "cpu" for parsing and embedding. Each pool takes the highest-priority queued job first
+    (PRIORITY_INTERACTIVE before PRIORITY_NORMAL before PRIORITY_BACKGROUND) and keeps
+    reserved_workers threads free of background jobs, so a long ingest never starves chat.
+
+    Every state or progress change is passed to the listeners as a Job.snapshot() dict; the GUI
+    binds to it through a Qt signal. snapshot() returns the status of all active jobs.
+    """
+
+    def __init__(self, io_workers: int = 4, cpu_workers: int = 2, reserved_workers: int = 1, keep_finished: int = 50):
+        self._lock = threading.Condition()
+        self._pools = {
+            "io": _WorkerPool("io", io_workers, reserved_workers),
+            "cpu": _WorkerPool("cpu", cpu_workers, reserved_workers),
+        }
+        self._jobs = {} # job_id -> Job, active jobs and the last keep_finished finished ones
+        self._finished_order = []
+        self._keep_finished = keep_finished
+        self._job_ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._listeners = []
+        self._shutting_down = False
+
+        for pool in self._pools.values():
+            for i in range(pool.num_workers):
+                thread = threading.Thread(target=self._worker, args=(pool,), name=f"{pool.name}-worker-{i}", daemon=True)
+                thread.start()
+                pool.threads.append(thread)
+
+    def add_listener(self, callback):
+        """Registers callback(job_snapshot: dict), called from worker threads on every change."""
+        self._listeners.append(callback)
+
+    def _notify(self, job: Job):
+        snapshot = job.snapshot()
+        for callback in list(self._listeners):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print_scheduler_warning(f"Job listener failed: {e}")
+
+    def submit(self, func, *args, name: str = None, pool: str = "io", priority: int = PRIORITY_NORMAL, **kwargs) -> Job:
+        """
+        Queues func(*args, **kwargs) on the given pool ("io" or "cpu").
+
+        Returns:
+            Job: The queued job. Inside func, get_current_job() returns it.
+        """
+        if pool not in self._pools:
+            raise ValueError(f"Unknown pool '{pool}', expected one of {list(self._pools)}")
+        with self._lock:
+            if self._shutting_down:
+                raise RuntimeError("JobScheduler is shut down.")
+            job = Job(next(self._job_ids), name or getattr(func, "__name__", "job"), pool, priority, func, args, kwargs, self)
+            self._jobs[job.job_id] = job
+            # Sequence numbers are unique, so jobs themselves are never compared
+            bisect.insort(self._pools[pool].queue, (priority, next(self._sequence), job))
+            self._lock.notify_all()
+        self._notify(job)
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancels a job. Queued jobs are dropped; running jobs are asked to stop. Returns False if unknown or finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (JOB_QUEUED, JOB_RUNNING):
+                return False
+            job.cancel_event.set()
+            if job.state == JOB_QUEUED:
+                pool = self._pools[job.pool]
+                pool.queue = [entry for entry in pool.queue if entry[2] is not job]
+                self._finish(job, JOB_CANCELLED)
+        self._notify(job)
+        return True
+
+    def cancel_all(self, name_prefix: str = None):
+        """Cancels every active job, or only those whose name starts with name_prefix."""
+        with self._lock:
+            job_ids = [job.job_id for job in self._jobs.values()
+                       if job.state in (JOB_QUEUED, JOB_RUNNING) and (name_prefix is None or job.name.startswith(name_prefix))]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def snapshot(self) -> list:
+        """Returns the status dicts of all queued and running jobs, highest priority first."""
+        with self._lock:
+            active = [job for job in self._jobs.values() if job.state in (JOB_QUEUED, JOB_RUNNING)]
+        return [job.snapshot() for job in sorted(active, key=lambda job: (job.priority, job.job_id))]
+
+    def _finish(self, job: Job, state: str):
+        """Caller holds the lock."""
+        job.state = state
+        job.finished_at = time.time()
+        job._done_event.set()
+        self._finished_order.append(job.job_id)
+        while len(self._finished_order) > self._keep_finished:
+            self._jobs.pop(self._finished_order.pop(0), None)
+
+    def _worker(self, pool: _WorkerPool):
+        while True:
+            with self._lock:
+                job = pool.next_job()
+                while job is None:
+                    if self._shutting_down:
+                        return
+                    self._lock.wait()
+                    job = pool.next_job()
+                job.state = JOB_RUNNING
+                job.started_at = time.time()
+                is_background = job.priority >= PRIORITY_BACKGROUND
+                if is_background:
+                    pool.running_background += 1
+            self._notify(job)
+
+            _current_job.job = job
+            state = JOB_DONE
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+                if job.cancelled:
+                    state = JOB_CANCELLED
+            except JobCancelled:
+                state = JOB_CANCELLED
+            except Exception as e:
+                job.error = e
+                state = JOB_FAILED
+                print_scheduler_warning(f"Job '{job.name}' failed: {e}")
+            finally:
+                _current_job.job = None
+
+            with self._lock:
+                if is_background:
+                    pool.running_background -= 1
+                self._finish(job, state)
+                self._lock.notify_all()
+            self._notify(job)
+
+    def shutdown(self, cancel_pending: bool = True, timeout: float = 5.0):
+        """Stops accepting jobs, optionally cancels outstanding ones and waits for the workers."""
+        if cancel_pending:
+            self.cancel_all()
+        with self._lock:
+            self._shutting_down = True
+            self._lock.notify_all()
+        deadline = time.time() + timeout
+        for pool in self._pools.values():
+            for thread in pool.threads:
+                thread.join(max(0.0, deadline - time.time()))
+        print_scheduler_status("Job scheduler stopped.")
@@ -0,0 +1,159 @@
+import importlib
+import sys
+import threading
+import time
+import types
+
+def print_startup_status(msg): print(f"[STARTUP] {msg}")
+def print_startup_warning(msg): print(f"[STARTUP_WARNING] {msg}")
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module-level stand-in that imports the real module on first attribute access.
+
+    `weaviate = LazyModule("weaviate")` keeps call sites like `weaviate.connect_to_local(...)`
+    unchanged while moving the import cost from module load to first use (or to preload_modules()).
+    """
+
+    def __init__(self, module_name: str):
+        super().__init__(module_name)
+        self._lazy_module_name = module_name
+        self._lazy_module = None
+
+    def _load(self):
+        module = self._lazy_module
+        if module is None:
+            module = importlib.import_module(self._lazy_module_name) # Thread-safe through the import lock
+            self._lazy_module = module
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._lazy_module is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule '{self._lazy_module_name}' ({state})>"
+
+
+def preload_modules(module_names, should_cancel=None) -> dict:
+    """
+    Imports modules ahead of their first use, typically on a background thread after the first window paints.
+
+    Args:
+        module_names (list[str]): Modules to import, in order.
+        should_cancel (callable, optional): Checked between modules; returning True stops early.
+
+    Returns:
+        dict: {module_name: seconds} for the modules imported by this call. Failures are logged and skipped.
+    """
+    timings = {}
+    for module_name in module_names:
+        if should_cancel and should_cancel():
+            break
+        if module_name in sys.modules:
+            continue
+        start_time = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            timings[module_name] = time.perf_counter() - start_time
+        except Exception as e:
+            print_startup_warning(f"Could not preload '{module_name}': {e}")
+    if timings:
+        print_startup_status("Preloaded " + ", ".join(f"{name} ({seconds:.2f}s)" for name, seconds in timings.items()))
+    return timings
+
+
+class _TimingFinder:
+    """sys.meta_path entry that wraps each found module's exec_module to time it."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "searching", False):
+            return None
+        self._local.searching = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self._local.searching = False
+
+        loader = getattr(spec, "loader", None) if spec is not None else None
+        # Builtin and frozen importers are classes shared by every module; only wrap per-module loader instances
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self.profiler._enter(fullname)
+            try:
+                exec_module(module)
+            finally:
+                self.profiler._exit(fullname)
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+
+class ImportProfiler:
+    """
+    Measures how long each module takes to import while active (start() ... stop()).
+
+    Cumulative time includes the modules a module imports; self time excludes them. Used by
+    `python main.py --profile-startup` to find what delays the first window.
+    """
+
+    def __init__(self):
+        self.timings = {} # module -> {"cumulative": seconds, "self": seconds}
+        self.started_at = None
+        self._finder = _TimingFinder(self)
+        self._local = threading.local()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+        return self
+
+    def stop(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def _enter(self, module_name: str):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append([module_name, time.perf_counter(), 0.0]) # name, start, time spent in child imports
+
+    def _exit(self, module_name: str):
+        stack = self._local.stack
+        name, start_time, child_seconds = stack.pop()
+        cumulative = time.perf_counter() - start_time
+        self.timings[name] = {"cumulative": cumulative, "self": cumulative - child_seconds}
+        if stack:
+            stack[-1][2] += cumulative
+
+    def report(self, top_n: int = 15, label: str = "Startup"):
+        """Prints the elapsed time since start() and the top_n modules by cumulative and by self import time."""
+        if self.started_at is not None:
+            print_startup_status(f"{label}: {time.perf_counter() - self.started_at:.3f}s since profiling started, {len(self.timings)} modules imported.")
+        for key in ("cumulative", "self"):
+            print_startup_status(f"Slowest imports by {key} time:")
+            ranked = sorted(self.timings.items(), key=lambda item: item[1][key], reverse=True)[:top_n]
+            for module_name, timing in ranked:
+                print_startup_status(f"  {timing[key] * 1000:8.1f} ms  {module_name}")
@@ -0,0 +1,814 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from . import hybrid_fusion
+from . import vector_quantization as vq
+from . import weaviate_utils as wu
+from .bm25_index import BM25Index
+from .chunk_store import StoredChunk
+from .general_utils import encode_query
+from .vector_store import VectorStore
+
+LOCAL_INDEX_DB_FILENAME = "local_index.sqlite"
+VECTOR_INDEX_DIR_NAME = ".vector_index"
+VECTORS_FILENAME = "vectors.f32"
+IVF_FILENAME = "ivf.npz"
+BM25_FILENAME = "bm25.npz"
+QUANTIZER_FILENAME = "quantizer.npz"
+
+def print_local_status(msg): print(f"[LOCAL_INDEX] {msg}")
+def print_local_warning(msg): print(f"[LOCAL_INDEX_WARNING] {msg}")
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_id INTEGER PRIMARY KEY,
+    properties TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL,
+    properties TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    course_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    file_name TEXT,
+    source_location TEXT,
+    chunk_text TEXT NOT NULL,
+    PRIMARY KEY (course_id, row)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (course_id, file_id, chunk_index);
+CREATE TABLE IF NOT EXISTS vector_files (
+    course_id INTEGER PRIMARY KEY,
+    dimensions INTEGER NOT NULL
+);
+"""
+
+CHUNK_COLUMNS = "row, file_id, chunk_index, course_id, file_name, source_location, chunk_text"
+
+
+def _chunk_from_row(db_row, score: float = None) -> StoredChunk:
+    _, file_id, chunk_index, course_id, file_name, source_location, chunk_text = db_row
+    chunk = StoredChunk({
+        "chunk_text": chunk_text,
+        "chunk_index": chunk_index,
+        "file_id": file_id,
+        "course_id": course_id,
+        "file_name": file_name,
+        "source_location": source_location,
+    })
+    chunk.metadata.score = score
+    return chunk
+
+
+def _nearest_centroids(matrix: np.ndarray, centroids: np.ndarray, start: int, stop: int, block_rows: int = 65536) -> np.ndarray:
+    """The index of the nearest unit centroid of each row in [start, stop)."""
+    nearest = np.empty(max(stop - start, 0), dtype=np.int32)
+    for block_start in range(start, stop, block_rows):
+        block = np.asarray(matrix[block_start:min(stop, block_start + block_rows)], dtype=np.float32)
+        nearest[block_start - start:block_start - start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return nearest
+
+
+class _CourseVectors:
+    """
+    The vectors of one course: an append-only float32 file read through np.memmap, a live-row mask,
+    a BM25 index over the chunk text of the live rows and, for large courses, an IVF index.
+
+    With int8 or binary quantization a parallel file of codes (codes.<mode>) is kept in step with
+    the float32 file. Searches scan the codes and rescore only the best candidates with the full
+    vectors, so the bytes read per query shrink 4x (int8) or 32x (binary).
+    """
+
+    def __init__(self, course_dir: str, dimensions: int, quantization: str = vq.QUANTIZATION_NONE):
+        self.dir = os.path.join(course_dir, VECTOR_INDEX_DIR_NAME)
+        self.vectors_path = os.path.join(self.dir, VECTORS_FILENAME)
+        self.ivf_path = os.path.join(self.dir, IVF_FILENAME)
+        self.bm25_path = os.path.join(self.dir, BM25_FILENAME)
+        self.codes_path = os.path.join(self.dir, f"codes.{quantization}")
+        self.quantizer_path = os.path.join(self.dir, QUANTIZER_FILENAME)
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.quantizer = None # Set once trained; codes then cover every row
+        self.live = np.zeros(0, dtype=bool)
+        self.bm25 = BM25Index()
+        self._matrix = None
+        self._codes = None
+        # IVF state: unit centroids, the centroid of every row (-1 = unassigned) and the rows per list
+        self.centroids = None
+        self.assignments = None
+        self.trained_rows = 0
+        self._list_order = None
+        self._list_offsets = None
+
+    @property
+    def num_rows(self) -> int:
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dimensions)
+
+    def matrix(self) -> np.ndarray:
+        """The memory-mapped (num_rows, dimensions) matrix, remapped after appends."""
+        num_rows = self.num_rows
+        if self._matrix is None or self._matrix.shape[0] != num_rows:
+            self._matrix = None
+            self.pad_live(num_rows)
+            if num_rows == 0:
+                return np.empty((0, self.dimensions), dtype=np.float32)
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(num_rows, self.dimensions))
+        return self._matrix
+
+    def pad_live(self, num_rows: int = None):
+        """Extends the live mask to every row of the vector file; rows without a chunk (deleted or from an interrupted write) are dead."""
+        num_rows = self.num_rows if num_rows is None else num_rows
+        if len(self.live) < num_rows:
+            self.live = np.concatenate([self.live, np.zeros(num_rows - len(self.live), dtype=bool)])
+
+    def release(self):
+        self._matrix = self._codes = None
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Appends unit-length vectors and returns the row of the first one."""
+        os.makedirs(self.dir, exist_ok=True)
+        first_row = self.num_rows
+        with open(self.vectors_path, 'ab') as file:
+            file.seek(first_row * 4 * self.dimensions) # Drop a partially written row from an earlier crash
+            file.truncate()
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.set_live(range(first_row, first_row + len(vectors)), True)
+        if self.centroids is not None:
+            self._assign(first_row, first_row + len(vectors))
+        if self.quantizer is not None:
+            self._encode_rows(first_row, first_row + len(vectors))
+        return first_row
+
+    def set_live(self, rows, is_live: bool):
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows) and rows.max() >= len(self.live):
+            self.live = np.concatenate([self.live, np.zeros(int(rows.max()) + 1 - len(self.live), dtype=bool)])
+        self.live[rows] = is_live
+
+    def exact_top_k(self, query_vector: np.ndarray, k: int, block_rows: int = 65536):
+        return self._scan_top_k(self.matrix(), lambda block: block @ query_vector, k, block_rows)
+
+    def _scan_top_k(self, matrix: np.ndarray, score_block, k: int, block_rows: int = 65536):
+        """Top k live rows of matrix by score_block(rows), scanned in blocks to bound memory."""
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, matrix.shape[0], block_rows):
+            block_scores = np.asarray(score_block(matrix[start:start + block_rows]), dtype=np.float32)
+            block_scores[~self.live[start:start + len(block_scores)]] = -np.inf
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(block_scores))])
+            best_scores = np.concatenate([best_scores, block_scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        keep = np.isfinite(best_scores)
+        best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores, kind="stable")
+        return best_rows[order], best_scores[order]
+
+    def _rescore(self, rows: np.ndarray, query_vector: np.ndarray, k: int):
+        """Exact scores of candidate rows from the float32 vectors; returns the top k, best first."""
+        rows = np.sort(rows)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.asarray(self.matrix()[rows] @ query_vector, dtype=np.float32)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order].astype(np.int64), scores[order]
+
+    # --- Quantized codes ---
+
+    @property
+    def num_code_rows(self) -> int:
+        if self.quantizer is None or not os.path.exists(self.codes_path):
+            return 0
+        return os.path.getsize(self.codes_path) // self.quantizer.code_width
+
+    def codes(self) -> np.ndarray:
+        """The memory-mapped (num_rows, code_width) codes, remapped after appends."""
+        num_code_rows = self.num_code_rows
+        if self._codes is None or self._codes.shape[0] != num_code_rows:
+            self._codes = None
+            if num_code_rows == 0:
+                return np.empty((0, self.quantizer.code_width), dtype=self.quantizer.code_dtype)
+            self._codes = np.memmap(self.codes_path, dtype=self.quantizer.code_dtype, mode='r', shape=(num_code_rows, self.quantizer.code_width))
+        return self._codes
+
+    def _encode_rows(self, start: int, stop: int, block_rows: int = 65536):
+        """Writes the codes of rows [start, stop), replacing any codes from start on."""
+        matrix = self.matrix()
+        self._codes = None
+        with open(self.codes_path, 'ab') as file:
+            file.seek(start * self.quantizer.code_width)
+            file.truncate()
+            for block_start in range(start, stop, block_rows):
+                block = np.asarray(matrix[block_start:min(stop, block_start + block_rows)], dtype=np.float32)
+                file.write(np.ascontiguousarray(self.quantizer.encode(block)).tobytes())
+
+    def fit_quantizer(self, matrix: np.ndarray, live: np.ndarray, sample_size: int = 50000, seed: int = 0):
+        """
+        Trains a quantizer on a sample of the live rows of a matrix snapshot and writes the codes of all its
+        rows to a temporary file. Touches no shared state, so it can run without the store lock.
+
+        Returns:
+            tuple: (quantizer, temporary codes path, number of encoded rows), or None if there is nothing to train on.
+        """
+        quantizer = vq.create_quantizer(self.quantization, self.dimensions)
+        live_rows = np.flatnonzero(live[:matrix.shape[0]])
+        if quantizer is None or len(live_rows) == 0:
+            return None
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(live_rows, size=min(sample_size, len(live_rows)), replace=False))
+        quantizer.train(np.asarray(matrix[sample_rows], dtype=np.float32))
+        tmp_path = self.codes_path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            for block_start in range(0, matrix.shape[0], 65536):
+                block = np.asarray(matrix[block_start:block_start + 65536], dtype=np.float32)
+                file.write(np.ascontiguousarray(quantizer.encode(block)).tobytes())
+        return quantizer, tmp_path, matrix.shape[0]
+
+    def install_quantizer(self, quantizer, tmp_codes_path: str, encoded_rows: int):
+        """Switches to a quantizer from fit_quantizer(), encoding the rows appended since its snapshot."""
+        self._codes = None
+        os.replace(tmp_codes_path, self.codes_path)
+        self.quantizer = quantizer
+        if self.num_rows > encoded_rows:
+            self._encode_rows(encoded_rows, self.num_rows)
+        vq.save_quantizer(self.quantizer_path, quantizer)
+
+    def train_quantizer(self, sample_size: int = 50000, seed: int = 0) -> bool:
+        """Trains the quantizer on a sample of the live vectors and encodes every row."""
+        fitted = self.fit_quantizer(self.matrix(), self.live, sample_size, seed)
+        if fitted is None:
+            return False
+        self.install_quantizer(*fitted)
+        return True
+
+    def load_quantizer(self):
+        if self.quantization == vq.QUANTIZATION_NONE:
+            return
+        quantizer = vq.load_quantizer(self.quantizer_path, self.quantization, self.dimensions)
+        if quantizer is None or not os.path.exists(self.codes_path):
+            return
+        self.quantizer = quantizer
+        num_rows, num_code_rows = self.num_rows, self.num_code_rows
+        if num_code_rows > num_rows:
+            self.quantizer = None
+        elif num_code_rows < num_rows: # Rows appended by a run without quantization
+            self._encode_rows(num_code_rows, num_rows)
+
+    def drop_quantizer(self):
+        self.quantizer = self._codes = None
+        for path in (self.codes_path, self.quantizer_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def quantized_top_k(self, query_vector: np.ndarray, k: int, rescore_k: int, block_rows: int = 8192):
+        """Scans the codes for the rescore_k best rows, then returns their top k by exact score."""
+        prepared_query = self.quantizer.prepare_query(query_vector)
+        candidate_rows, _ = self._scan_top_k(self.codes(), lambda block: self.quantizer.scores(block, prepared_query), max(rescore_k, k), block_rows)
+        return self._rescore(candidate_rows, query_vector, k)
+
+    # --- IVF ---
+
+    def fit_ivf(self, matrix: np.ndarray, live: np.ndarray, num_lists: int = None, iterations: int = 10, sample_size: int = 50000,
+                seed: int = 0):
+        """
+        Clusters the live rows of a matrix snapshot with spherical k-means and assigns all its rows to their
+        nearest centroid. Touches no shared state, so it can run without the store lock.
+
+        Returns:
+            tuple: (centroids, assignments, number of live rows trained on), or None if there are too few rows.
+        """
+        live_rows = np.flatnonzero(live[:matrix.shape[0]])
+        num_lists = num_lists or int(np.clip(np.sqrt(len(live_rows)), 16, 4096))
+        if len(live_rows) < num_lists:
+            return None
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(live_rows, size=min(sample_size, len(live_rows)), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=num_lists, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(num_lists):
+                members = sample[nearest == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        return centroids, _nearest_centroids(matrix, centroids, 0, matrix.shape[0]), len(live_rows)
+
+    def install_ivf(self, centroids: np.ndarray, assignments: np.ndarray, trained_rows: int):
+        """Switches to an IVF index from fit_ivf(), assigning the rows appended since its snapshot."""
+        self.centroids, self.assignments, self.trained_rows = centroids, assignments, trained_rows
+        self._list_order = None
+        if self.num_rows > len(assignments):
+            self._assign(len(assignments), self.num_rows)
+        self.save_ivf()
+
+    def _assign(self, start: int, stop: int):
+        if len(self.assignments) < stop:
+            self.assignments = np.concatenate([self.assignments, np.full(stop - len(self.assignments), -1, dtype=np.int32)])
+        self.assignments[start:stop] = _nearest_centroids(self.matrix(), self.centroids, start, stop)
+        self._list_order = None
+
+    def ivf_top_k(self, query_vector: np.ndarray, k: int, nprobe: int, rescore_k: int = None):
+        if self._list_order is None:
+            self._list_order = np.argsort(self.assignments, kind="stable")
+            self._list_offsets = np.searchsorted(self.assignments[self._list_order], np.arange(len(self.centroids) + 1))
+        probe_lists = np.argsort(-(self.centroids @ query_vector))[:nprobe]
+        candidate_rows = np.concatenate([
+            self._list_order[self._list_offsets[list_id]:self._list_offsets[list_id + 1]] for list_id in probe_lists
+        ])
+        candidate_rows = np.sort(candidate_rows[self.live[candidate_rows]])
+        rescore_k = max(rescore_k or 0, k)
+        if self.quantizer is not None and len(candidate_rows) > rescore_k:
+            code_scores = self.quantizer.scores(np.asarray(self.codes()[candidate_rows]), self.quantizer.prepare_query(query_vector))
+            candidate_rows = candidate_rows[np.argpartition(-code_scores, rescore_k - 1)[:rescore_k]]
+        return self._rescore(candidate_rows, query_vector, k)
+
+    def save_ivf(self):
+        tmp_path = self.ivf_path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, centroids=self.centroids, assignments=self.assignments, trained_rows=np.int64(self.trained_rows))
+        os.replace(tmp_path, self.ivf_path)
+
+    def load_ivf(self):
+        if not os.path.exists(self.ivf_path):
+            return
+        try:
+            with np.load(self.ivf_path, allow_pickle=False) as data:
+                centroids, assignments = data["centroids"], data["assignments"]
+                trained_rows = int(data["trained_rows"])
+        except Exception as e:
+            print_local_warning(f"Ignoring unreadable IVF index {self.ivf_path}: {e}")
+            return
+        num_rows = self.num_rows
+        if centroids.shape[1] != self.dimensions or len(assignments) > num_rows:
+            return
+        self.centroids, self.assignments, self.trained_rows = centroids, assignments, trained_rows
+        if len(assignments) < num_rows:
+            self._assign(len(assignments), num_rows)
+
+    def load_bm25(self, live_rows: np.ndarray, rows_and_texts) -> bool:
+        """Uses the saved BM25 index if it covers exactly the live rows, else rebuilds it. Returns True if rebuilt."""
+        saved = BM25Index.load(self.bm25_path)
+        if saved is not None and np.array_equal(saved.doc_ids, np.sort(live_rows)):
+            self.bm25 = saved
+            return False
+        self.bm25 = BM25Index()
+        for row, chunk_text in rows_and_texts():
+            self.bm25.add(row, chunk_text)
+        self.save_bm25()
+        return True
+
+    def save_bm25(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.bm25.save(self.bm25_path)
+
+    def drop_ivf(self):
+        self.centroids = self.assignments = self._list_order = self._list_offsets = None
+        self.trained_rows = 0
+        if os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process VectorStore that needs no Docker service.
+
+    Course, file and chunk metadata live in Courses/local_index.sqlite. Each course keeps its unit-length
+    chunk vectors in Courses/<course_id>/.vector_index/vectors.f32, searched through np.memmap either
+    exactly or, once a course has ivf_min_rows live chunks (search_mode "auto"), through an IVF index
+    probing ivf_nprobe clusters. The keyword half of hybrid search is a compressed BM25 index updated on
+    every ingest and delete and saved to .vector_index/bm25.npz. Both halves are combined with relative
+    score fusion or reciprocal rank fusion weighted by alpha, per course settings (see hybrid_fusion).
+    Deleted chunks leave dead vector rows behind until they outnumber the live ones, then the course's
+    vector file is compacted.
+
+    quantization "int8" or "binary" (default: the VECTOR_QUANTIZATION environment variable) makes
+    searches of courses with at least quantize_min_rows chunks scan compact codes and rescore the
+    best rescore_multiplier * k candidates (default per mode, see vq.DEFAULT_RESCORE_MULTIPLIERS)
+    with the float32 vectors. Quantizers and IVF indexes are trained after ingests and deletes (see
+    train_indexes), never inside a search.
+    """
+
+    name = "local"
+
+    def __init__(self, project_root: str, search_mode: str = "auto", ivf_min_rows: int = 20000, ivf_nprobe: int = 16,
+                 candidate_multiplier: int = 5, quantization: str = None, quantize_min_rows: int = 1000, rescore_multiplier: int = None):
+        if search_mode not in ("auto", "exact", "ivf"):
+            raise ValueError(f"Unknown search_mode '{search_mode}', expected 'auto', 'exact' or 'ivf'")
+        quantization = vq.resolve_quantization(quantization)
+        if quantization == vq.QUANTIZATION_PQ:
+            print_local_warning("PQ quantization is only available with the Weaviate backend; the local index stores full vectors.")
+            quantization = vq.QUANTIZATION_NONE
+        self.project_root = project_root
+        self.courses_dir = os.path.join(project_root, "Courses")
+        self.db_path = os.path.join(self.courses_dir, LOCAL_INDEX_DB_FILENAME)
+        self.search_mode = search_mode
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_nprobe = ivf_nprobe
+        self.candidate_multiplier = candidate_multiplier
+        self.quantization = quantization
+        self.quantize_min_rows = quantize_min_rows
+        self.rescore_multiplier = rescore_multiplier or vq.DEFAULT_RESCORE_MULTIPLIERS.get(quantization, 1)
+        self._lock = threading.RLock()
+        self._db = None
+        self._courses = {} # course_id -> _CourseVectors
+        self._training_courses = set() # Courses whose quantizer or IVF index is being trained
+        self.last_search_timings = {} # Seconds spent per stage of the most recent search
+
+    def is_connected(self) -> bool:
+        return self._db is not None
+
+    def connect(self) -> bool:
+        with self._lock:
+            if self._db is None:
+                os.makedirs(self.courses_dir, exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self.ensure_schema()
+                print_local_status(f"Opened local index {self.db_path}")
+        return True
+
+    def ensure_schema(self):
+        with self._lock:
+            self._db.executescript(SCHEMA_SQL)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            for course_vectors in self._courses.values():
+                course_vectors.release()
+            self._courses.clear()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _course_vectors(self, course_id: int, dimensions: int = None):
+        """Returns the loaded _CourseVectors of a course, creating them if dimensions is given, else None."""
+        course_vectors = self._courses.get(course_id)
+        if course_vectors is not None:
+            return course_vectors
+        db_row = self._db.execute("SELECT dimensions FROM vector_files WHERE course_id = ?", (course_id,)).fetchone()
+        if db_row is None:
+            if dimensions is None:
+                return None
+            self._db.execute("INSERT INTO vector_files (course_id, dimensions) VALUES (?, ?)", (course_id, dimensions))
+            self._db.commit()
+        else:
+            dimensions = db_row[0]
+
+        course_vectors = _CourseVectors(wu.get_course_dir(course_id, self.project_root), dimensions, self.quantization)
+        live_rows = np.array([row for (row,) in self._db.execute("SELECT row FROM chunks WHERE course_id = ?", (course_id,))], dtype=np.int64)
+        course_vectors.set_live(live_rows, True)
+        course_vectors.pad_live() # The code and IVF scans index the mask by row without mapping the vectors first
+        rows_and_texts = lambda: self._db.execute("SELECT row, chunk_text FROM chunks WHERE course_id = ?", (course_id,))
+        if course_vectors.load_bm25(live_rows, rows_and_texts) and len(live_rows):
+            print_local_status(f"Rebuilt the BM25 index of course {course_id} ({len(live_rows)} chunks).")
+        course_vectors.load_ivf()
+        course_vectors.load_quantizer()
+        self._courses[course_id] = course_vectors
+        return course_vectors
+
+    def insert_courses(self, courses_prepared_data: list):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO courses (course_id, properties) VALUES (?, ?)",
+                [(course_props["course_id"], json.dumps(course_props)) for course_props in courses_prepared_data]
+            )
+            self._db.commit()
+        print_local_status(f"Successfully inserted/updated {len(courses_prepared_data)} course objects.")
+
+    def insert_files(self, files_prepared_data: list, course_id: int) -> set:
+        ingested_file_ids = wu.run_ingest_pipeline(self, files_prepared_data, course_id)
+        self._save_bm25(course_id)
+        self.train_indexes(course_id)
+        return ingested_file_ids
+
+    def _save_bm25(self, course_id: int):
+        with self._lock:
+            course_vectors = self._courses.get(course_id)
+            if course_vectors is not None:
+                course_vectors.save_bm25()
+
+    # --- Sink interface of weaviate_utils.run_ingest_pipeline ---
+
+    def upsert_files(self, files_prepared_data: list, course_id: int):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (file_id, course_id, properties) VALUES (?, ?, ?)",
+                [(file_props["file_id"], course_id, json.dumps(file_props)) for file_props in files_prepared_data]
+            )
+            self._db.commit()
+        print_local_status(f"Successfully inserted/updated file metadata for course {course_id}.")
+
+    def get_chunk_counts(self, course_id: int, file_ids: list) -> dict:
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT file_id, COUNT(*) FROM chunks WHERE course_id = ? GROUP BY file_id", (course_id,)
+            ).fetchall())
+
+    @contextlib.contextmanager
+    def chunk_writer(self, failed_file_ids: set = None):
+        # Writes are synchronous, so write() already reports every failure
+        yield self._write_file_chunks
+
+    def _write_file_chunks(self, file_props: dict, file_items: list, file_vectors) -> int:
+        """Stores (or replaces) the chunks of one file. Returns the number of chunks that failed."""
+        vectors = np.asarray(file_vectors, dtype=np.float32).reshape(len(file_items), -1)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        course_id = file_items[0]["properties"]["course_id"]
+        with self._lock:
+            try:
+                course_vectors = self._course_vectors(course_id, dimensions=vectors.shape[1])
+                if course_vectors.dimensions != vectors.shape[1]:
+                    print_local_warning(f"'{file_props['filename']}' has {vectors.shape[1]}-d vectors but course {course_id} uses {course_vectors.dimensions}-d.")
+                    return len(file_items)
+                self._delete_chunks_locked(course_id, [file_props["file_id"]], commit=False)
+                first_row = course_vectors.append(vectors)
+                self._db.executemany(
+                    f"INSERT INTO chunks ({CHUNK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(first_row + offset, props["file_id"], props["chunk_index"], props["course_id"], props["file_name"],
+                      props["source_location"], props["chunk_text"])
+                     for offset, props in enumerate(item["properties"] for item in file_items)]
+                )
+                self._db.commit()
+            except Exception as e:
+                self._db.rollback()
+                self._courses.pop(course_id, None) # Reload from SQLite, the source of truth, on next use
+                print_local_warning(f"Could not store the chunks of '{file_props['filename']}': {e}")
+                return len(file_items)
+            for offset, item in enumerate(file_items):
+                course_vectors.bm25.add(first_row + offset, item["properties"]["chunk_text"])
+        return 0
+
+    # --- Deletes ---
+
+    def _delete_chunks_locked(self, course_id: int, file_ids: list, commit: bool = True) -> int:
+        placeholders = ",".join("?" * len(file_ids))
+        rows = [row for (row,) in self._db.execute(
+            f"SELECT row FROM chunks WHERE course_id = ? AND file_id IN ({placeholders})", (course_id, *file_ids)
+        ).fetchall()]
+        if not rows:
+            return 0
+        self._db.execute(f"DELETE FROM chunks WHERE course_id = ? AND file_id IN ({placeholders})", (course_id, *file_ids))
+        if commit:
+            self._db.commit()
+        course_vectors = self._course_vectors(course_id)
+        if course_vectors is not None:
+            course_vectors.set_live(rows, False)
+            for row in rows:
+                course_vectors.bm25.remove(row)
+        return len(rows)
+
+    def delete_file_chunks(self, course_id: int, file_ids: list) -> int:
+        if not file_ids:
+            return 0
+        with self._lock:
+            deleted = self._delete_chunks_locked(course_id, list(file_ids))
+            self._compact_if_needed(course_id)
+            self._save_bm25(course_id)
+        print_local_status(f"Deleted {deleted} chunks for {len(file_ids)} files in course {course_id}.")
+        self.train_indexes(course_id) # Compaction drops the quantizer and IVF index
+        return deleted
+
+    def remove_files(self, course_id: int, file_ids: list) -> int:
+        if not file_ids:
+            return 0
+        deleted = self.delete_file_chunks(course_id, file_ids)
+        with self._lock:
+            placeholders = ",".join("?" * len(file_ids))
+            self._db.execute(f"DELETE FROM files WHERE course_id = ? AND file_id IN ({placeholders})", (course_id, *file_ids))
+            self._db.commit()
+        print_local_status(f"Deleted {len(file_ids)} file objects from course {course_id}.")
+        return deleted
+
+    def _compact_if_needed(self, course_id: int):
+        course_vectors = self._course_vectors(course_id)
+        if course_vectors is None or course_id in self._training_courses: # Renumbering rows would void the training
+            return
+        num_rows = course_vectors.num_rows
+        live_rows = np.flatnonzero(course_vectors.live[:num_rows])
+        if num_rows - len(live_rows) > max(len(live_rows), 1000):
+            self.compact(course_id)
+
+    def compact(self, course_id: int):
+        """Rewrites a course's vector file with only the live rows and renumbers them in SQLite."""
+        with self._lock:
+            course_vectors = self._course_vectors(course_id)
+            if course_vectors is None:
+                return
+            live_rows = np.flatnonzero(course_vectors.live[:course_vectors.num_rows])
+            tmp_path = course_vectors.vectors_path + ".tmp"
+            with open(tmp_path, 'wb') as file:
+                matrix = course_vectors.matrix()
+                for start in range(0, len(live_rows), 65536):
+                    file.write(np.ascontiguousarray(matrix[live_rows[start:start + 65536]]).tobytes())
+            # Ascending renumbering never collides with a row that still has to move
+            self._db.executemany(
+                "UPDATE chunks SET row = ? WHERE course_id = ? AND row = ?",
+                [(new_row, course_id, int(old_row)) for new_row, old_row in enumerate(live_rows)]
+            )
+            # The old file must not be mapped while it is replaced (required on Windows)
+            course_vectors.release()
+            del matrix
+            os.replace(tmp_path, course_vectors.vectors_path)
+            self._db.commit()
+            course_vectors.drop_ivf()
+            course_vectors.drop_quantizer()
+            if os.path.exists(course_vectors.bm25_path): # Row IDs changed; rebuilt on next load
+                os.remove(course_vectors.bm25_path)
+            self._courses.pop(course_id, None)
+        print_local_status(f"Compacted the vectors of course {course_id} to {len(live_rows)} rows.")
+
+    # --- Index training ---
+
+    def _use_ivf(self, num_live: int) -> bool:
+        return self.search_mode == "ivf" or (self.search_mode == "auto" and num_live >= self.ivf_min_rows)
+
+    def _training_due(self, course_vectors: _CourseVectors):
+        """Returns (train the quantizer, train the IVF index) for a course's current size."""
+        num_live = int(course_vectors.live.sum())
+        train_quantizer = (course_vectors.quantizer is None and self.quantization != vq.QUANTIZATION_NONE
+                           and num_live >= self.quantize_min_rows)
+        # Retrain the clusters once the course has doubled since they were computed
+        train_ivf = self._use_ivf(num_live) and (course_vectors.centroids is None or num_live > 2 * course_vectors.trained_rows)
+        return train_quantizer, train_ivf
+
+    def train_indexes(self, course_id: int) -> bool:
+        """
+        Trains a course's quantizer and IVF index if its size calls for them.
+
+        Called after ingests and deletes. The k-means and encoding work runs on a snapshot of the
+        vectors without holding the store lock, so searches and writes continue meanwhile; rows
+        appended in the meantime are encoded and assigned when the result is installed.
+
+        Returns:
+            bool: True if anything was trained and installed.
+        """
+        with self._lock:
+            if self._db is None or course_id in self._training_courses:
+                return False
+            course_vectors = self._course_vectors(course_id)
+            if course_vectors is None:
+                return False
+            train_quantizer, train_ivf = self._training_due(course_vectors)
+            if not (train_quantizer or train_ivf):
+                return False
+            self._training_courses.add(course_id)
+            matrix = course_vectors.matrix()
+            live = course_vectors.live[:matrix.shape[0]].copy()
+
+        fitted_quantizer = fitted_ivf = None
+        try:
+            start_time = time.perf_counter()
+            if train_quantizer:
+                fitted_quantizer = course_vectors.fit_quantizer(matrix, live)
+            if train_ivf:
+                fitted_ivf = course_vectors.fit_ivf(matrix, live)
+            del matrix
+            with self._lock:
+                if self._courses.get(course_id) is not course_vectors: # Closed or reloaded meanwhile
+                    return False
+                if fitted_quantizer is not None:
+                    course_vectors.install_quantizer(*fitted_quantizer)
+                    fitted_quantizer = None
+                if fitted_ivf is not None:
+                    course_vectors.install_ivf(*fitted_ivf)
+            print_local_status(f"Trained the vector index of course {course_id} in {time.perf_counter() - start_time:.1f} s.")
+            return True
+        except Exception as e:
+            print_local_warning(f"Could not train the vector index of course {course_id}: {e}")
+            return False
+        finally:
+            if fitted_quantizer is not None and os.path.exists(fitted_quantizer[1]):
+                os.remove(fitted_quantizer[1])
+            with self._lock:
+                self._training_courses.discard(course_id)
+
+    def _train_in_background(self, course_id: int, course_vectors: _CourseVectors):
+        """Starts training a course whose size outgrew its indexes (e.g. an older store reopened) without blocking the search."""
+        if course_id in self._training_courses or not any(self._training_due(course_vectors)):
+            return
+        threading.Thread(target=self.train_indexes, args=(course_id,), name=f"train-index-{course_id}", daemon=True).start()
+
+    # --- Search ---
+
+    def _vector_candidates(self, course_vectors: _CourseVectors, query_vector: np.ndarray, k: int):
+        """Scans the best index already trained; an untrained course is searched exactly until training finishes."""
+        rescore_k = k * self.rescore_multiplier
+        if course_vectors.centroids is not None and self._use_ivf(int(course_vectors.live.sum())):
+            return course_vectors.ivf_top_k(query_vector, k, self.ivf_nprobe, rescore_k)
+        if course_vectors.quantizer is not None:
+            return course_vectors.quantized_top_k(query_vector, k, rescore_k)
+        return course_vectors.exact_top_k(query_vector, k)
+
+    def _fetch_rows(self, course_id: int, rows) -> dict:
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        placeholders = ",".join("?" * len(rows))
+        return {db_row[0]: db_row for db_row in self._db.execute(
+            f"SELECT {CHUNK_COLUMNS} FROM chunks WHERE course_id = ? AND row IN ({placeholders})", (course_id, *rows)
+        ).fetchall()}
+
+    def _search_course(self, course_id: int, query_text: str, query_vector, limit: int, alpha_hybrid: float, fusion: str,
+                       timings: dict):
+        """Returns the course's fused matches and the query vector (encoded on first use, reused across courses)."""
+        course_vectors = self._course_vectors(course_id)
+        if course_vectors is None:
+            return [], query_vector
+        settings = hybrid_fusion.load_search_settings(wu.get_course_dir(course_id, self.project_root))
+        alpha = settings["alpha"] if alpha_hybrid is None else alpha_hybrid
+        fusion = fusion or settings["fusion"]
+        num_candidates = max(limit * self.candidate_multiplier, limit)
+        result_lists, weights = [], []
+        if alpha > 0:
+            start_time = time.perf_counter()
+            if query_vector is None:
+                query_vector = self._encode_query(query_text)
+            self._train_in_background(course_id, course_vectors)
+            result_lists.append(self._vector_candidates(course_vectors, query_vector, num_candidates))
+            weights.append(alpha)
+            timings["vector"] += time.perf_counter() - start_time
+        if alpha < 1:
+            start_time = time.perf_counter()
+            result_lists.append(course_vectors.bm25.search(query_text, num_candidates))
+            weights.append(1 - alpha)
+            timings["keyword"] += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        rows, scores = hybrid_fusion.fuse_results(
+            [(ids.tolist(), scores.tolist()) for ids, scores in result_lists], weights, limit, fusion
+        )
+        timings["fusion"] += time.perf_counter() - start_time
+        db_rows = self._fetch_rows(course_id, rows)
+        return [_chunk_from_row(db_rows[row], score) for row, score in zip(rows, scores) if row in db_rows], query_vector
+
+    @staticmethod
+    def _encode_query(query_text: str) -> np.ndarray:
+        query_vector = np.asarray(encode_query(query_text), dtype=np.float32)
+        return query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+
+    def _context_chunks(self, matched_chunks: list, context_window: int) -> list:
+        context_chunks = []
+        for matched_chunk in matched_chunks:
+            props = matched_chunk.properties
+            context_chunks.extend(_chunk_from_row(db_row) for db_row in self._db.execute(
+                f"SELECT {CHUNK_COLUMNS} FROM chunks WHERE course_id = ? AND file_id = ? AND chunk_index BETWEEN ? AND ?",
+                (props["course_id"], props["file_id"], props["chunk_index"] - context_window, props["chunk_index"] + context_window)
+            ).fetchall())
+        return context_chunks
+
+    def search(self, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = None, context_window: int = 1,
+               fusion: str = None) -> list:
+        """
+        Hybrid search over one course (or all courses), returning matches plus their context windows.
+
+        alpha_hybrid and fusion default to each course's search settings. Per-stage timings (vector and
+        keyword retrieval, fusion, context lookup) are logged and kept in last_search_timings.
+        """
+        print_local_status(f"Searching for '{query_text}' with limit {limit}, course_id {course_id}, context_window {context_window}")
+        timings = {"vector": 0.0, "keyword": 0.0, "fusion": 0.0, "context": 0.0}
+        try:
+            with self._lock:
+                if course_id is not None:
+                    course_ids = [course_id]
+                else:
+                    course_ids = [row[0] for row in self._db.execute("SELECT course_id FROM vector_files").fetchall()]
+                matches, query_vector = [], None
+                for search_course_id in course_ids:
+                    course_matches, query_vector = self._search_course(
+                        search_course_id, query_text, query_vector, limit, alpha_hybrid, fusion, timings
+                    )
+                    matches.extend(course_matches)
+                # Fused scores are relative to their course; across courses they are only roughly comparable
+                matches = sorted(matches, key=lambda chunk: chunk.metadata.score, reverse=True)[:limit]
+                if not matches:
+                    print_local_status("No primary matches found.")
+                    return []
+                if context_window == 0:
+                    return matches
+
+                start_time = time.perf_counter()
+                chunks_by_uuid = {str(chunk.uuid): chunk for chunk in matches}
+                for context_chunk in self._context_chunks(matches, context_window):
+                    chunks_by_uuid.setdefault(str(context_chunk.uuid), context_chunk)
+                timings["context"] = time.perf_counter() - start_time
+        finally:
+            self.last_search_timings = timings
+            print_local_status("Search timings: " + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in timings.items()))
+
+        final_sorted_chunks = wu.sort_chunks_by_position(chunks_by_uuid.values())
+        print_local_status(f"Returning {len(final_sorted_chunks)} chunks (primary matches + context), sorted.")
+        return final_sorted_chunks
@@ -0,0 +1,116 @@
+import threading
+import time
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+def print_registry_status(msg): print(f"[MODEL_REGISTRY] {msg}")
+
+# (model_name, device) -> loaded SentenceTransformer
+_models = {}
+# (model_name, device) -> {"load_seconds": float, "memory_bytes": int}
+_model_stats = {}
+_registry_lock = threading.Lock()
+# (model_name, device) keys that already ran a dummy encode
+_warmed_up = set()
+
+
+def _estimate_model_memory(model) -> int:
+    """Returns the number of bytes held by the model's parameters and buffers."""
+    total_bytes = 0
+    try:
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total_bytes += tensor.numel() * tensor.element_size()
+    except Exception as e:
+        print_registry_status(f"Could not estimate model memory: {e}")
+    return total_bytes
+
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
+    """
+    Returns a shared SentenceTransformer instance, loading it on first use.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        device (str): Device to load the model on ('cpu', 'cuda', ...). None lets
+                      SentenceTransformer pick the best available device.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+
+    Models are cached per (model_name, device) for the lifetime of the process.
+    Loading happens under a lock so concurrent callers (GUI worker threads) never
+    load the same model twice.
+    """
+    key = (model_name, device)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        # Another thread may have finished loading while we waited for the lock
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        from sentence_transformers import SentenceTransformer
+
+        start_time = time.perf_counter()
+        model = SentenceTransformer(model_name, device=device)
+        load_seconds = time.perf_counter() - start_time
+        memory_bytes = _estimate_model_memory(model)
+
+        _models[key] = model
+        _model_stats[key] = {"load_seconds": load_seconds, "memory_bytes": memory_bytes}
+        print_registry_status(
+            f"Loaded '{model_name}' on {model.device} in {load_seconds:.2f}s "
+            f"(~{memory_bytes / (1024 * 1024):.1f} MB of weights)."
+        )
+        return model
+
+
+def warm_up_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
+    """Loads the model and runs one dummy encode so the first real query pays no start-up cost."""
+    key = (model_name, device)
+    if key in _warmed_up:
+        return
+    try:
+        start_time = time.perf_counter()
+        get_embedding_model(model_name, device).encode("warm up")
+        _warmed_up.add(key)
+        print_registry_status(f"Warmed up '{model_name}' in {time.perf_counter() - start_time:.2f}s.")
+    except Exception as e:
+        print_registry_status(f"Could not warm up '{model_name}': {e}")
+
+
+def start_model_warm_up(model_name: str = DEFAULT_EMBEDDING_MODEL, device: str = None):
+    """
+    Warms up the model on a background daemon thread.
+
+    Returns:
+        threading.Thread: The started thread, or None if the model is already warm.
+    """
+    if (model_name, device) in _warmed_up:
+        return None
+    thread = threading.Thread(target=warm_up_embedding_model, args=(model_name, device), daemon=True)
+    thread.start()
+    return thread
+
+
+def get_model_stats() -> dict:
+    """
+    Returns load statistics for every model currently held by the registry.
+
+    Returns:
+        dict: {(model_name, device): {"load_seconds": float, "memory_bytes": int}}
+    """
+    with _registry_lock:
+        return {key: dict(stats) for key, stats in _model_stats.items()}
+
+
+def release_models():
+    """Drops all cached models so their memory can be reclaimed."""
+    with _registry_lock:
+        _models.clear()
+        _model_stats.clear()
+        _warmed_up.clear()
+    print_registry_status("Released all cached embedding models.")
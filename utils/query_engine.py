@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import os
+import threading
+
+from . import weaviate_utils as wu
+from .ai_utils import format_ai_response, format_partial_ai_response
+from .answer_cache import get_answer_cache, close_answer_caches
+from .course_sync import get_course_index_version
+from .general_utils import encode_query
+
+def print_engine_status(msg): print(f"[QUERY_ENGINE] {msg}")
+def print_engine_warning(msg): print(f"[QUERY_ENGINE_WARNING] {msg}")
+
+CANCELLED_MESSAGE = "<i>[Cancelled: a newer question was asked]</i>"
+
+
+class QueryJob:
+    """One chat question and the callbacks that report its progress."""
+
+    def __init__(self, query_id: int, query_text: str, course_id: int, status_callback=None,
+                 stream_started=None, stream_updated=None, stream_finished=None):
+        self.query_id = query_id
+        self.query_text = query_text
+        self.course_id = course_id
+        self.status_callback = status_callback
+        self.stream_started = stream_started
+        self.stream_updated = stream_updated
+        self.stream_finished = stream_finished
+        self.cancelled = False
+        self.answer_started = False
+
+    def report(self, msg: str):
+        if self.status_callback:
+            self.status_callback(msg)
+
+    def start_answer(self):
+        self.answer_started = True
+        if self.stream_started:
+            self.stream_started(self.query_id)
+
+    def finish_answer(self, message_text: str):
+        if not self.answer_started:
+            self.start_answer()
+        if self.stream_finished:
+            self.stream_finished(self.query_id, message_text)
+
+
+class QueryEngine:
+    """
+    Answers chat questions one at a time on an asyncio event loop running in a background thread.
+
+    submit() is safe to call from the Qt thread; progress comes back through the job's callbacks
+    (typically pyqtSignal.emit, so Qt delivers them on the GUI thread). Jobs wait in a queue of at
+    most max_queued entries and a single worker runs them in order. Submitting with supersede=True
+    cancels the running question and drops everything still queued. Within a question the query
+    embedding and the index version are computed concurrently, local and remote context lookups
+    overlap, and the search and the Gemini stream use async clients.
+    """
+
+    def __init__(self, weaviate_manager, gemini_client=None, project_root: str = None, max_queued: int = 4,
+                 search_limit: int = 5, context_window: int = 1, alpha_hybrid: float = None):
+        self.weaviate_manager = weaviate_manager
+        self.gemini_client = gemini_client
+        self.project_root = project_root or weaviate_manager.project_root
+        self.max_queued = max_queued
+        self.search_limit = search_limit
+        self.context_window = context_window
+        self.alpha_hybrid = alpha_hybrid
+
+        self._query_ids = itertools.count(1)
+        self._loop = asyncio.new_event_loop()
+        self._queue = None # asyncio.Queue, created on the engine loop
+        self._current_job = None
+        self._current_task = None
+        self._async_client = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="QueryEngine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._worker_task = self._loop.create_task(self._worker())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def submit(self, query_text: str, course_id: int, supersede: bool = True, status_callback=None,
+               stream_started=None, stream_updated=None, stream_finished=None) -> int:
+        """
+        Queues a question. Returns its query ID, which is passed to the stream callbacks:
+        stream_started(query_id), stream_updated(query_id, formatted_text_so_far) and
+        stream_finished(query_id, formatted_text).
+        """
+        job = QueryJob(next(self._query_ids), query_text, course_id, status_callback,
+                       stream_started, stream_updated, stream_finished)
+        self._loop.call_soon_threadsafe(self._enqueue, job, supersede)
+        return job.query_id
+
+    def cancel_all(self):
+        """Cancels the running question and every queued one."""
+        self._loop.call_soon_threadsafe(self._cancel_pending)
+
+    def _cancel_pending(self):
+        while not self._queue.empty():
+            self._mark_cancelled(self._queue.get_nowait())
+        if self._current_task and not self._current_task.done():
+            self._current_task.cancel()
+
+    def _mark_cancelled(self, job: QueryJob):
+        job.cancelled = True
+        if job.answer_started:
+            job.finish_answer(CANCELLED_MESSAGE)
+
+    def _enqueue(self, job: QueryJob, supersede: bool):
+        if supersede:
+            self._cancel_pending()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            print_engine_warning(f"Query queue full ({self.max_queued}); dropping '{job.query_text}'.")
+            job.report("Too many questions pending; please wait for the current answers.")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                continue
+            self._current_job = job
+            self._current_task = asyncio.ensure_future(self._answer(job))
+            # Wait without propagating the task's cancellation into the worker
+            await asyncio.wait([self._current_task])
+            if self._current_task.cancelled():
+                print_engine_status(f"Cancelled query {job.query_id}: '{job.query_text}'")
+                self._mark_cancelled(job)
+            elif self._current_task.exception() is not None:
+                error = self._current_task.exception()
+                print_engine_warning(f"Query {job.query_id} failed: {error}")
+                job.finish_answer(f"Error processing AI response: {error}")
+                job.report("Error getting AI response.")
+            self._current_job = None
+            self._current_task = None
+
+    async def _get_async_client(self):
+        if self._async_client is not None and self._async_client.is_connected():
+            return self._async_client
+        self._async_client = await wu.create_async_client()
+        return self._async_client
+
+    async def _search(self, job: QueryJob, query_vector):
+        async_client = None
+        if self.weaviate_manager.vector_store.supports_async_search:
+            async_client = await self._get_async_client()
+        if async_client is not None:
+            try:
+                return await wu.search_weaviate_async(
+                    async_client, job.query_text, query_vector, course_id=job.course_id, limit=self.search_limit,
+                    alpha_hybrid=self.alpha_hybrid, context_window=self.context_window, project_root=self.project_root
+                )
+            except Exception as e:
+                print_engine_warning(f"Async search failed, falling back to the sync client: {e}")
+        return await asyncio.to_thread(
+            self.weaviate_manager.search_chunks, job.query_text, course_id=job.course_id,
+            limit=self.search_limit, alpha_hybrid=self.alpha_hybrid, context_window=self.context_window
+        )
+
+    async def _answer(self, job: QueryJob):
+        course_dir = os.path.join(self.project_root, "Courses", str(job.course_id))
+        query_vector, index_version = await asyncio.gather(
+            asyncio.to_thread(encode_query, job.query_text),
+            asyncio.to_thread(get_course_index_version, course_dir)
+        )
+
+        # Near-identical questions against an unchanged index reuse the earlier answer
+        answer_cache = get_answer_cache(course_dir)
+        cached_answer = await asyncio.to_thread(answer_cache.lookup, query_vector, index_version)
+        if cached_answer is not None:
+            job.finish_answer(cached_answer)
+            job.report(f"Answered from cache (hit rate {answer_cache.get_stats()['hit_rate']:.0%}).")
+            return
+
+        job.report(f"Searching for: '{job.query_text}'...")
+        results = await self._search(job, query_vector)
+
+        llm_max_chunks = self.search_limit * (1 + 2 * self.context_window)
+        generated_prompt = wu.generate_prompt_for_llm(job.query_text, results or [], max_context_chunks=llm_max_chunks)
+
+        if not self.gemini_client:
+            job.report("AI response unavailable (API key missing). Prompt printed to console.")
+            return
+
+        job.report("Getting AI response...")
+        job.start_answer()
+
+        def on_text(text_so_far):
+            if job.stream_updated:
+                job.stream_updated(job.query_id, format_partial_ai_response(text_so_far))
+
+        ai_response_text = await self.gemini_client.astream(generated_prompt, on_text=on_text)
+        print(f"[AI_RESPONSE] {ai_response_text}") # Print AI response to console for debugging
+        is_error_response = ai_response_text.startswith("Error")
+        ai_response_text = format_ai_response(ai_response_text)
+        if not is_error_response:
+            await asyncio.to_thread(answer_cache.store, job.query_text, query_vector, ai_response_text, index_version)
+
+        job.finish_answer(ai_response_text)
+        job.report("AI response received.")
+
+    def shutdown(self, timeout: float = 5.0):
+        """Cancels outstanding questions, closes the async Weaviate and Gemini connections, stops the engine thread and saves the answer caches."""
+        async def stop():
+            self._cancel_pending()
+            await self._queue.put(None)
+            try:
+                await asyncio.wait_for(self._worker_task, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            if self._async_client is not None:
+                try:
+                    await self._async_client.close()
+                except Exception as e:
+                    print_engine_warning(f"Error closing the async Weaviate client: {e}")
+            if self.gemini_client is not None:
+                # Its async connections belong to this loop
+                await self.gemini_client.aclose()
+
+        try:
+            asyncio.run_coroutine_threadsafe(stop(), self._loop).result(timeout)
+        except Exception as e:
+            print_engine_warning(f"Query engine did not stop cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+        close_answer_caches()
@@ -0,0 +1,135 @@
+import os
+import numpy as np
+
+QUANTIZATION_NONE = "none"
+QUANTIZATION_INT8 = "int8"
+QUANTIZATION_BINARY = "binary"
+QUANTIZATION_PQ = "pq" # Weaviate only
+QUANTIZATION_MODES = (QUANTIZATION_NONE, QUANTIZATION_INT8, QUANTIZATION_BINARY, QUANTIZATION_PQ)
+# Candidates rescored with the full vectors per requested result (see utils/bench_quantization.py)
+DEFAULT_RESCORE_MULTIPLIERS = {QUANTIZATION_INT8: 4, QUANTIZATION_BINARY: 20}
+
+# The +-1 signs of the 8 bits of every byte value, most significant bit first (np.packbits order)
+_BYTE_SIGNS = (((np.arange(256)[:, None] >> np.arange(7, -1, -1)[None, :]) & 1) * 2 - 1).astype(np.float32)
+
+def print_quantization_warning(msg): print(f"[QUANTIZATION_WARNING] {msg}")
+
+
+class ScalarQuantizer:
+    """
+    int8 scalar quantization: each dimension is scaled by its own step so that (nearly) all trained
+    values fit in [-127, 127]. A 384-d vector takes 384 bytes instead of 1536.
+    """
+
+    mode = QUANTIZATION_INT8
+    code_dtype = np.int8
+
+    def __init__(self, dimensions: int, scales: np.ndarray = None):
+        self.dimensions = dimensions
+        self.scales = scales
+
+    @property
+    def code_width(self) -> int:
+        return self.dimensions
+
+    def train(self, sample: np.ndarray, clip_quantile: float = 0.999):
+        """Sets the per-dimension steps from a sample; the top 0.1% of magnitudes are clipped."""
+        max_abs = np.quantile(np.abs(np.asarray(sample, dtype=np.float32)), clip_quantile, axis=0)
+        self.scales = (np.maximum(max_abs, 1e-6) / 127).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(np.asarray(vectors, dtype=np.float32) / self.scales), -127, 127).astype(np.int8)
+
+    def prepare_query(self, query_vector: np.ndarray) -> np.ndarray:
+        return (query_vector * self.scales).astype(np.float32)
+
+    def scores(self, codes: np.ndarray, prepared_query: np.ndarray) -> np.ndarray:
+        """Approximate dot products of the encoded vectors with the query (higher is better)."""
+        return codes.astype(np.float32) @ prepared_query
+
+    def state(self) -> dict:
+        return {"scales": self.scales}
+
+
+class BinaryQuantizer:
+    """
+    Binary quantization: one sign bit per dimension. A 384-d vector takes 48 bytes instead of 1536.
+    Codes are ranked by the dot product of the full-precision query with their +-1 signs, read from
+    a per-byte lookup table; that ranks noticeably better than the Hamming distance between sign bits.
+    Needs no training.
+    """
+
+    mode = QUANTIZATION_BINARY
+    code_dtype = np.uint8
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    @property
+    def code_width(self) -> int:
+        return (self.dimensions + 7) // 8
+
+    def train(self, sample: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    def prepare_query(self, query_vector: np.ndarray) -> np.ndarray:
+        """(code_width, 256) table: the query's dot product with the signs of each byte value at each position."""
+        padded = np.zeros(self.code_width * 8, dtype=np.float32)
+        padded[:self.dimensions] = query_vector
+        return padded.reshape(-1, 8) @ _BYTE_SIGNS.T
+
+    def scores(self, codes: np.ndarray, prepared_query: np.ndarray) -> np.ndarray:
+        """Approximate dot products of the sign vectors with the query (higher is better)."""
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for byte_position in range(self.code_width):
+            scores += prepared_query[byte_position][codes[:, byte_position]]
+        return scores
+
+    def state(self) -> dict:
+        return {}
+
+
+def create_quantizer(mode: str, dimensions: int):
+    """Returns an untrained quantizer for a local index mode ("int8" or "binary"), or None for "none"."""
+    if mode in (None, QUANTIZATION_NONE):
+        return None
+    if mode == QUANTIZATION_INT8:
+        return ScalarQuantizer(dimensions)
+    if mode == QUANTIZATION_BINARY:
+        return BinaryQuantizer(dimensions)
+    raise ValueError(f"Quantization '{mode}' is not supported by the local index, expected 'none', 'int8' or 'binary'")
+
+
+def save_quantizer(path: str, quantizer):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, mode=np.array(quantizer.mode), dimensions=np.int64(quantizer.dimensions), **quantizer.state())
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path: str, mode: str, dimensions: int):
+    """Reads a quantizer written by save_quantizer(). Returns None if missing, unreadable or of another mode."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["mode"]) != mode or int(data["dimensions"]) != dimensions:
+                return None
+            quantizer = create_quantizer(mode, dimensions)
+            if mode == QUANTIZATION_INT8:
+                quantizer.scales = data["scales"].astype(np.float32)
+            return quantizer
+    except Exception as e:
+        print_quantization_warning(f"Ignoring unreadable quantizer {path}: {e}")
+        return None
+
+
+def resolve_quantization(mode: str = None) -> str:
+    """Returns the quantization mode to use: the given one, else the VECTOR_QUANTIZATION environment variable, else "none"."""
+    mode = (mode or os.getenv("VECTOR_QUANTIZATION") or QUANTIZATION_NONE).strip().lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown vector quantization '{mode}', expected one of {QUANTIZATION_MODES}")
+    return mode
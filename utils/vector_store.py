@@ -0,0 +1,115 @@
+from . import weaviate_utils as wu
+
+VECTOR_BACKENDS = ("weaviate", "local")
+
+
+class VectorStore:
+    """
+    Interface of the chunk index behind WeaviateManager.
+
+    Search results are objects with uuid, properties (chunk_text, chunk_index, file_id, course_id,
+    file_name, source_location) and metadata.score, sorted by file_id and chunk_index when
+    context_window > 0, exactly like Weaviate result objects.
+    """
+
+    name = None
+    requires_service = False # True if a separate server (the Weaviate container) must be running
+    supports_async_search = False # True if the QueryEngine may search through an async Weaviate client
+
+    def is_connected(self) -> bool:
+        raise NotImplementedError
+
+    def connect(self) -> bool:
+        raise NotImplementedError
+
+    def ensure_schema(self):
+        raise NotImplementedError
+
+    def insert_courses(self, courses_prepared_data: list):
+        raise NotImplementedError
+
+    def insert_files(self, files_prepared_data: list, course_id: int) -> set:
+        """Indexes prepared files and returns the IDs of those fully indexed (see weaviate_utils.run_ingest_pipeline)."""
+        raise NotImplementedError
+
+    def delete_file_chunks(self, course_id: int, file_ids: list) -> int:
+        raise NotImplementedError
+
+    def remove_files(self, course_id: int, file_ids: list) -> int:
+        raise NotImplementedError
+
+    def search(self, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = None, context_window: int = 1,
+               fusion: str = None) -> list:
+        """alpha_hybrid and fusion default to the course's search settings (see hybrid_fusion)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class WeaviateVectorStore(VectorStore):
+    """VectorStore backed by the Weaviate container; the client is owned by the WeaviateManager."""
+
+    name = "weaviate"
+    requires_service = True
+    supports_async_search = True
+
+    def __init__(self, get_client, project_root: str, quantization: str = None):
+        self.get_client = get_client
+        self.project_root = project_root
+        self.quantization = quantization
+
+    def is_connected(self) -> bool:
+        # No readiness probe here: it is an HTTP round trip and this runs before every search and write
+        return self.get_client() is not None
+
+    def connect(self) -> bool:
+        client = self.get_client()
+        return bool(client and client.is_ready())
+
+    def ensure_schema(self):
+        wu.create_schema(self.get_client(), quantization=self.quantization)
+
+    def insert_courses(self, courses_prepared_data: list):
+        wu.insert_courses_into_weaviate(self.get_client(), courses_prepared_data)
+
+    def insert_files(self, files_prepared_data: list, course_id: int) -> set:
+        return wu.insert_files_into_weaviate(self.get_client(), files_prepared_data, course_id)
+
+    def delete_file_chunks(self, course_id: int, file_ids: list) -> int:
+        return wu.delete_chunks_for_files(self.get_client(), course_id, file_ids, self.project_root)
+
+    def remove_files(self, course_id: int, file_ids: list) -> int:
+        return wu.delete_files_from_weaviate(self.get_client(), course_id, file_ids, self.project_root)
+
+    def search(self, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = None, context_window: int = 1,
+               fusion: str = None) -> list:
+        return wu.search_weaviate(
+            self.get_client(),
+            query_text,
+            course_id=course_id,
+            limit=limit,
+            alpha_hybrid=alpha_hybrid,
+            context_window=context_window,
+            project_root=self.project_root,
+            fusion=fusion
+        )
+
+
+def create_vector_store(backend: str, project_root: str, get_client=None, quantization: str = None) -> VectorStore:
+    """
+    Creates the VectorStore for a backend name.
+
+    Args:
+        backend (str): "weaviate" (the Docker service) or "local" (in-process index under Courses/).
+        project_root (str): Project root containing Courses/.
+        get_client (callable): Returns the current Weaviate client; required for the "weaviate" backend.
+        quantization (str, optional): "none", "int8", "binary" or "pq" (Weaviate only); defaults to the
+                                      VECTOR_QUANTIZATION environment variable.
+    """
+    if backend == "weaviate":
+        return WeaviateVectorStore(get_client, project_root, quantization)
+    if backend == "local":
+        from .local_vector_store import LocalVectorStore
+        return LocalVectorStore(project_root, quantization=quantization)
+    raise ValueError(f"Unknown vector backend '{backend}', expected one of {VECTOR_BACKENDS}")
@@ -1,18 +1,45 @@
 import subprocess
+import threading
 import time
 import os
+from . import hybrid_fusion
 from . import weaviate_utils as wu
+from .vector_store import create_vector_store
 
 def print_manager_status(msg): print(f"[WM_STATUS] {msg}")
 def print_manager_warning(msg): print(f"[WM_WARNING] {msg}")
 def print_manager_error(msg): print(f"[WM_ERROR] {msg}")
 
 class WeaviateManager:
-    def __init__(self, project_root: str, docker_compose_file: str = "docker-compose.yml"):
+    """
+    Owns the chunk index of the app. With backend "weaviate" (default) that is the Weaviate Docker
+    service; with backend "local" it is an in-process LocalVectorStore and no service is started.
+    The backend defaults to the VECTOR_BACKEND environment variable and the vector quantization
+    ("none", "int8", "binary", "pq") to VECTOR_QUANTIZATION.
+    """
+
+    def __init__(self, project_root: str, docker_compose_file: str = "docker-compose.yml", weaviate_url: str = "http://localhost:8080",
+                 backend: str = None, quantization: str = None):
         self.project_root = project_root
+        self.backend = (backend or os.getenv("VECTOR_BACKEND") or "weaviate").lower()
         self.docker_compose_path = os.path.join(project_root, docker_compose_file)
+        self.weaviate_url = weaviate_url.rstrip("/")
         self.client = None
         self.service_started_by_manager = False
+        # How the last start_service() went: {"mode": "warm"|"cold", "seconds": float, "probes": int}
+        self.startup_stats = None
+        self._http_session = None # One keep-alive session for all readiness probes
+        # Guards connecting, replacing and closing self.client across worker threads
+        self.client_lock = threading.RLock()
+        # Serializes batch writes (ingest/delete) so concurrent jobs never share a batch
+        self._write_lock = threading.Lock()
+        self.vector_store = create_vector_store(self.backend, project_root, get_client=self.get_client, quantization=quantization)
+
+
+    def get_client(self):
+        """Returns the current client (or None) without racing a concurrent connect or close."""
+        with self.client_lock:
+            return self.client
 
 
     def _run_docker_compose(self, args: list) -> bool:
@@ -46,8 +73,66 @@ class WeaviateManager:
             return False
 
 
-    def start_service(self, retries=3, delay=10) -> bool:
-        """Starts the Weaviate Docker service if not already running."""
+    def is_service_ready(self, timeout: float = 1.0) -> bool:
+        """Probes Weaviate's /v1/.well-known/ready endpoint; True if it answers 200."""
+        import requests
+
+        if self._http_session is None:
+            self._http_session = requests.Session()
+        try:
+            response = self._http_session.get(f"{self.weaviate_url}/v1/.well-known/ready", timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+
+    def wait_until_ready(self, timeout: float = 90.0, initial_delay: float = 0.05, max_delay: float = 2.0):
+        """
+        Polls the readiness endpoint with exponential backoff (initial_delay doubling up to max_delay).
+
+        Returns:
+            int: The number of probes it took, or None if Weaviate was not ready within timeout seconds.
+        """
+        deadline = time.perf_counter() + timeout
+        delay = initial_delay
+        probes = 0
+        while True:
+            probes += 1
+            if self.is_service_ready():
+                return probes
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+
+    def start_service(self, timeout: float = 90.0, initial_delay: float = 0.05, max_delay: float = 2.0) -> bool:
+        """
+        Makes sure the Weaviate service is up, starting it with docker-compose only if needed.
+
+        Args:
+            timeout (float): Seconds to wait for Weaviate to become ready after docker-compose up.
+            initial_delay (float): First wait between readiness probes, in seconds.
+            max_delay (float): Longest wait between readiness probes, in seconds.
+
+        Returns:
+            bool: True once Weaviate reports ready.
+
+        A service that is already running ("warm" start) is used as is and not stopped on exit.
+        Otherwise ("cold" start) docker-compose up -d is issued and readiness is polled. The
+        elapsed time of either path is stored in self.startup_stats.
+        """
+        start_time = time.perf_counter()
+        if not self.vector_store.requires_service:
+            self.startup_stats = {"mode": self.backend, "seconds": 0.0, "probes": 0}
+            print_manager_status(f"Using the {self.backend} vector backend; no Weaviate service needed.")
+            return True
+        if self.is_service_ready():
+            self.startup_stats = {"mode": "warm", "seconds": time.perf_counter() - start_time, "probes": 1}
+            print_manager_status(f"Weaviate is already running; skipping docker-compose ({self.startup_stats['seconds'] * 1000:.0f} ms).")
+            return True
+
         print_manager_status("Attempting to start Weaviate service via docker-compose...")
         if not os.path.exists(self.docker_compose_path):
             print_manager_error(f"docker-compose.yml not found at {self.docker_compose_path}")
@@ -56,19 +141,13 @@ class WeaviateManager:
         if self._run_docker_compose(["up", "-d"]): # Detached mode
             self.service_started_by_manager = True
             print_manager_status("Docker-compose up -d command issued. Waiting for Weaviate to be ready...")
-            
-            # Wait and check readiness
-            for i in range(retries):
-                time.sleep(delay)
-                temp_client = wu.create_client()
-                if temp_client and temp_client.is_ready():
-                    print_manager_status("Weaviate service is up and ready.")
-                    temp_client.close()
-                    return True
-                elif temp_client:
-                    temp_client.close() # Close if connected but not ready
-                print_manager_warning(f"Weaviate not ready yet (attempt {i+1}/{retries}). Retrying in {delay}s...")
-            print_manager_error("Weaviate service did not become ready after multiple attempts.")
+
+            probes = self.wait_until_ready(timeout, initial_delay, max_delay)
+            if probes is not None:
+                self.startup_stats = {"mode": "cold", "seconds": time.perf_counter() - start_time, "probes": probes}
+                print_manager_status(f"Weaviate service is up and ready after {self.startup_stats['seconds']:.2f}s ({probes} readiness probes).")
+                return True
+            print_manager_error(f"Weaviate service did not become ready within {timeout:.1f}s.")
             return False
         return False
 
@@ -86,24 +165,40 @@ class WeaviateManager:
             return True 
 
 
+    def is_connected(self, probe: bool = False) -> bool:
+        """
+        True if the vector backend has an open connection.
+
+        Args:
+            probe (bool): If True, also ask Weaviate whether it is ready (an HTTP round trip), e.g.
+                          before deciding to reconnect.
+        """
+        if probe:
+            return self.vector_store.connect()
+        return self.vector_store.is_connected()
+
+
     def connect_client(self) -> bool:
-        if self.client and self.client.is_ready():
-            print_manager_status("Already connected to Weaviate.")
-            return True
-        
-        self.client = wu.create_client()
-        if self.client:
-            return True
+        if not self.vector_store.requires_service:
+            return self.vector_store.connect()
+        with self.client_lock:
+            if self.client and self.client.is_ready():
+                print_manager_status("Already connected to Weaviate.")
+                return True
+            
+            self.client = wu.create_client()
+            if self.client:
+                return True
         print_manager_error("Failed to connect Weaviate client.")
         return False
 
 
     def ensure_schema(self) -> bool:
-        if not self.client:
+        if not self.is_connected():
             print_manager_warning("Cannot ensure schema: Weaviate client not connected.")
             return False
         try:
-            wu.create_schema(self.client)
+            self.vector_store.ensure_schema()
             return True
         except Exception as e:
             print_manager_error(f"Error creating/verifying Weaviate schema: {e}")
@@ -111,7 +206,7 @@ class WeaviateManager:
 
 
     def ingest_all_courses_metadata(self, class_list_json_path: str) -> bool:
-        if not self.client:
+        if not self.is_connected():
             print_manager_warning("Cannot ingest courses: Weaviate client not connected.")
             return False
         
@@ -119,57 +214,109 @@ class WeaviateManager:
         courses_data = wu.prepare_courses_for_weaviate(class_list_json_path)
         if courses_data:
             print_manager_status(f"Ingesting {len(courses_data)} courses into Weaviate...")
-            wu.insert_courses_into_weaviate(self.client, courses_data)
+            with self._write_lock:
+                self.vector_store.insert_courses(courses_data)
             return True
         else:
             print_manager_warning("No course data prepared for ingestion.")
             return False
 
 
-    def ingest_course_files_and_chunks(self, course_id: int) -> bool:
-        if not self.client:
+    def ingest_course_files_and_chunks(self, course_id: int, files_metadata: list = None) -> set:
+        """
+        Ingests the files of a course and their chunks.
+
+        Args:
+            course_id (int): The Canvas course ID.
+            files_metadata (list): Optional list of Canvas file dicts to ingest (e.g. one page of
+                                   the file list). Defaults to everything in the course's files.json.
+
+        Returns:
+            set: IDs of the files that are fully indexed afterwards; empty if nothing could be ingested.
+        """
+        if not self.is_connected():
             print_manager_warning(f"Cannot ingest files for course {course_id}: Weaviate client not connected.")
-            return False
+            return set()
 
-        files_json_path = os.path.join(self.project_root, "Courses", str(course_id), "files.json")
-        if not os.path.exists(files_json_path):
-            print_manager_error(f"Files JSON for course {course_id} not found at {files_json_path}")
-            return False
+        if files_metadata is not None:
+            print_manager_status(f"Preparing {len(files_metadata)} listed files for course {course_id}")
+            files_data = wu.prepare_file_list_for_weaviate(files_metadata, course_id, self.project_root)
+        else:
+            files_json_path = os.path.join(self.project_root, "Courses", str(course_id), "files.json")
+            if not os.path.exists(files_json_path):
+                print_manager_error(f"Files JSON for course {course_id} not found at {files_json_path}")
+                return set()
 
-        print_manager_status(f"Preparing files for course {course_id} from: {files_json_path}")
-        
-        files_data = wu.prepare_files_for_weaviate(files_json_path, course_id, self.project_root)
+            print_manager_status(f"Preparing files for course {course_id} from: {files_json_path}")
+            
+            files_data = wu.prepare_files_for_weaviate(files_json_path, course_id, self.project_root)
         
         if files_data:
             print_manager_status(f"Ingesting {len(files_data)} files and their chunks for course {course_id}...")
-            wu.insert_files_into_weaviate(self.client, files_data, course_id)
-            return True
+            with self._write_lock:
+                return self.vector_store.insert_files(files_data, course_id)
         else:
             print_manager_warning(f"No file data prepared for ingestion for course {course_id}.")
-            return False
+            return set()
             
             
-    def search_chunks(self, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = 0.5, context_window: int = 1): # Add context_window here
+    def delete_file_chunks(self, course_id: int, file_ids: list) -> bool:
+        """Removes the chunks of the given files so they are re-chunked on the next ingest."""
+        if not self.is_connected():
+            print_manager_warning(f"Cannot delete chunks for course {course_id}: Weaviate client not connected.")
+            return False
+        with self._write_lock:
+            self.vector_store.delete_file_chunks(course_id, file_ids)
+        return True
+
+
+    def remove_course_files(self, course_id: int, file_ids: list) -> bool:
+        """Removes files that no longer exist on Canvas, together with their chunks."""
+        if not self.is_connected():
+            print_manager_warning(f"Cannot remove files for course {course_id}: Weaviate client not connected.")
+            return False
+        with self._write_lock:
+            self.vector_store.remove_files(course_id, file_ids)
+        return True
+
+
+    def search_chunks(self, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = None, context_window: int = 1,
+                      fusion: str = None):
         """
-        Performs a search for chunks in Weaviate.
+        Performs a search for chunks in the vector backend.
+        alpha_hybrid and fusion default to the course's search settings.
         """
-        if not self.client:
+        if not self.is_connected():
             print_manager_warning("Weaviate client not available for search.")
             return []
         
-        # Pass context_window to the underlying weaviate_utils function
-        return wu.search_weaviate(
-            self.client, 
+        return self.vector_store.search(
             query_text, 
             course_id=course_id, 
             limit=limit, 
             alpha_hybrid=alpha_hybrid, 
-            context_window=context_window 
+            context_window=context_window,
+            fusion=fusion
         )
 
 
+    def set_course_search_settings(self, course_id: int, alpha: float = None, fusion: str = None) -> dict:
+        """
+        Stores the hybrid search alpha and/or fusion method ("relative_score" or "rrf") used for a course.
+
+        Returns:
+            dict: The course's full search settings.
+        """
+        return hybrid_fusion.save_search_settings(wu.get_course_dir(course_id, self.project_root), alpha=alpha, fusion=fusion)
+
+
     def close_connection(self):
-        if self.client:
-            self.client.close()
-            self.client = None
-            print_manager_status("Weaviate client connection closed.")
\ No newline at end of file
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+        self.vector_store.close()
+        with self.client_lock:
+            if self.client:
+                self.client.close()
+                self.client = None
+                print_manager_status("Weaviate client connection closed.")
\ No newline at end of file
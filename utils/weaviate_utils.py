@@ -1,29 +1,39 @@
-import weaviate
-import weaviate.classes.config as wvcc
-from weaviate.classes.config import Property, DataType
-from weaviate.classes.query import Filter
-import weaviate.classes.query as wq
-from weaviate.util import generate_uuid5
+import contextlib
+import inspect
 import json
 import os
-from .general_utils import extractTextFromPdf, extractTextFromPPTX, extractTextFromDocx, extractTextFromTxt, semantic_chunking, encode_text
-import nltk
+import queue
+import threading
+import time
+import numpy as np
+from .general_utils import semantic_chunking, encode_query, encode_texts_batched, iter_extract_text_parallel
+from .ingest_cache import IngestCache, compute_file_hash
+from .chunk_store import get_chunk_store
+from . import hybrid_fusion
+from . import vector_quantization as vq
+from .lazy_imports import LazyModule
+
+# The weaviate client takes most of a second to import, so it loads on first use
+weaviate = LazyModule("weaviate")
+wvcc = LazyModule("weaviate.classes.config")
+wq = LazyModule("weaviate.classes.query")
+wva = LazyModule("weaviate.classes.aggregate")
+wvutil = LazyModule("weaviate.util")
 
 def print_header(msg): print(f"\n--- {msg} ---")
 def print_status(msg): print(f"[STATUS] {msg}")
 def print_warning(msg, detail=""): print(f"[WARNING] {msg} {detail}")
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except nltk.downloader.DownloadError:
-    print_status("NLTK 'punkt' tokenizer not found. Downloading...")
-    nltk.download('punkt')
-    
 # Determine project root from weaviate_utils.py's location for standalone use
 WEAVIATE_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT_FROM_WEAVIATE_UTILS = os.path.dirname(WEAVIATE_UTILS_DIR)
 
 
+def get_course_dir(course_id: int, project_root: str = None) -> str:
+    """Returns Courses/<course_id> under the project root."""
+    return os.path.join(project_root or PROJECT_ROOT_FROM_WEAVIATE_UTILS, "Courses", str(course_id))
+
+
 # Initialize and return a weaviate client.
 def create_client(url="http://localhost:8080", grpc_port=50051):
     try:
@@ -43,8 +53,50 @@ def create_client(url="http://localhost:8080", grpc_port=50051):
         return None
 
 
+async def create_async_client(host: str = "localhost", port: int = 8080, grpc_port: int = 50051):
+    """Returns a connected WeaviateAsyncClient, or None if Weaviate is not reachable."""
+    client = weaviate.use_async_with_local(host=host, port=port, grpc_port=grpc_port)
+    try:
+        await client.connect()
+        is_ready = client.is_ready()
+        if inspect.isawaitable(is_ready): # Failed checks return a plain False
+            is_ready = await is_ready
+        if is_ready:
+            print_status(f"Async client connected to Weaviate at http://{host}:{port}")
+            return client
+        raise Exception("Weaviate is not ready after connection attempt.")
+    except Exception as e:
+        print_warning(f"Async Weaviate connection error to http://{host}:{port} (gRPC port {grpc_port}):", str(e))
+        try:
+            await client.close()
+        except Exception:
+            pass
+        return None
+
+
 # Creates the weaviate schema
-def create_schema(client):
+def chunk_vector_index_config(quantization: str = None, rescore_limit: int = 200, training_limit: int = 100000):
+    """
+    Returns the HNSW vector index config of the Chunk collection for a quantization mode.
+
+    "int8" maps to Weaviate's scalar quantization (SQ), "binary" to binary quantization (BQ) and "pq"
+    to product quantization. SQ and BQ rescore the top rescore_limit candidates with the full vectors;
+    SQ and PQ train on the first training_limit vectors. "none" keeps the default uncompressed index (None).
+    """
+    quantization = vq.resolve_quantization(quantization)
+    quantizers = wvcc.Configure.VectorIndex.Quantizer
+    if quantization == vq.QUANTIZATION_INT8:
+        quantizer = quantizers.sq(rescore_limit=rescore_limit, training_limit=training_limit)
+    elif quantization == vq.QUANTIZATION_BINARY:
+        quantizer = quantizers.bq(rescore_limit=rescore_limit)
+    elif quantization == vq.QUANTIZATION_PQ:
+        quantizer = quantizers.pq(training_limit=training_limit)
+    else:
+        return None
+    return wvcc.Configure.VectorIndex.hnsw(quantizer=quantizer)
+
+
+def create_schema(client, quantization: str = None):
     """
     Creates the schema for Weaviate database.
     The schema consists of three collections: Course, File, and Chunk.
@@ -52,6 +104,9 @@ def create_schema(client):
 
     Args:
         client (weaviate.Client): The Weaviate client instance.
+        quantization (str, optional): Vector compression of the Chunk collection: "none", "int8", "binary" or "pq"
+                                      (see chunk_vector_index_config). Defaults to the VECTOR_QUANTIZATION environment
+                                      variable. Only applied when the collection is created.
 
     Returns:
         None
@@ -79,12 +134,12 @@ def create_schema(client):
         schema.create(
             name="Course",
             properties=[
-                Property(name="name", data_type=DataType.TEXT),
-                Property(name="course_id", data_type=DataType.INT),
-                Property(name="course_code", data_type=DataType.TEXT),
-                Property(name="start_date", data_type=DataType.DATE, skip_vectorization=True),
-                Property(name="end_date", data_type=DataType.DATE, skip_vectorization=True),
-                Property(name="uuid", data_type=DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="name", data_type=wvcc.DataType.TEXT),
+                wvcc.Property(name="course_id", data_type=wvcc.DataType.INT),
+                wvcc.Property(name="course_code", data_type=wvcc.DataType.TEXT),
+                wvcc.Property(name="start_date", data_type=wvcc.DataType.DATE, skip_vectorization=True),
+                wvcc.Property(name="end_date", data_type=wvcc.DataType.DATE, skip_vectorization=True),
+                wvcc.Property(name="uuid", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
                 
             ],
             description="A Canvas course with relevant metadata",
@@ -98,17 +153,17 @@ def create_schema(client):
         schema.create(
             name="File",
             properties=[
-                Property(name="file_id", data_type=DataType.INT),
-                Property(name="uuid", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="display_name", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="file_type", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="local_file_path", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="url", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="size_bytes", data_type=DataType.INT, skip_vectorization=True),
-                Property(name="created_at", data_type=DataType.DATE, skip_vectorization=True),
-                Property(name="modified_at", data_type=DataType.DATE, skip_vectorization=True),
-                Property(name="filename", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="course_id", data_type=DataType.INT, skip_vectorization=True),
+                wvcc.Property(name="file_id", data_type=wvcc.DataType.INT),
+                wvcc.Property(name="uuid", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="display_name", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="file_type", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="local_file_path", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="url", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="size_bytes", data_type=wvcc.DataType.INT, skip_vectorization=True),
+                wvcc.Property(name="created_at", data_type=wvcc.DataType.DATE, skip_vectorization=True),
+                wvcc.Property(name="modified_at", data_type=wvcc.DataType.DATE, skip_vectorization=True),
+                wvcc.Property(name="filename", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="course_id", data_type=wvcc.DataType.INT, skip_vectorization=True),
             ],
             description="A file belonging to a course",
             vectorizer_config=wvcc.Configure.Vectorizer.none(),
@@ -121,17 +176,18 @@ def create_schema(client):
         schema.create(
             name="Chunk",
             properties=[
-                Property(name="chunk_text", data_type=DataType.TEXT),
-                Property(name="chunk_index", data_type=DataType.INT, skip_vectorization=True), # Overall index within the file
-                Property(name="file_id", data_type=DataType.INT, skip_vectorization=True),
-                Property(name="course_id", data_type=DataType.INT, skip_vectorization=True),
-                Property(name="file_name", data_type=DataType.TEXT, skip_vectorization=True),
-                Property(name="source_location", data_type=DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="chunk_text", data_type=wvcc.DataType.TEXT),
+                wvcc.Property(name="chunk_index", data_type=wvcc.DataType.INT, skip_vectorization=True), # Overall index within the file
+                wvcc.Property(name="file_id", data_type=wvcc.DataType.INT, skip_vectorization=True),
+                wvcc.Property(name="course_id", data_type=wvcc.DataType.INT, skip_vectorization=True),
+                wvcc.Property(name="file_name", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
+                wvcc.Property(name="source_location", data_type=wvcc.DataType.TEXT, skip_vectorization=True),
             ],
             description="A chunk of text from a file used for vector search",
             vectorizer_config=wvcc.Configure.Vectorizer.none(),
+            vector_index_config=chunk_vector_index_config(quantization),
         )
-        print_status("Created 'Chunk' collection.")
+        print_status(f"Created 'Chunk' collection (vector quantization: {vq.resolve_quantization(quantization)}).")
 
     print_status("Schema created successfully!")
 
@@ -219,32 +275,7 @@ def prepare_files_for_weaviate(files_json_path: str, course_id: int, project_roo
             print_warning(f"Expected a list in {files_json_path}, but found {type(files_raw)}. Content: {files_raw}")
             return []
 
-        # Extract relevant fields
-        prepared_data = []
-        for file_info in files_raw:
-            if isinstance(file_info, dict) and all(key in file_info for key in ["id", "uuid", "display_name", "mime_class", "url", "size", "created_at", "modified_at", "filename"]):
-                local_file_path = os.path.join(project_root, "Courses", str(course_id), file_info["filename"])
-                
-                # Check if the local file actually exists
-                if not os.path.exists(local_file_path):
-                    print_warning(f"File {file_info['filename']} not found locally at {local_file_path}. Skipping Weaviate prep for this file.")
-                    continue
-
-                prepared_data.append({
-                    "file_id": file_info["id"], # Canvas file ID
-                    "canvas_file_uuid": file_info["uuid"], # Canvas's own UUID for the file
-                    "display_name": file_info["display_name"],
-                    "file_type": file_info.get("mime_class", "unknown"), # e.g., pdf, pptx (Canvas uses 'pdf', 'pptx' etc.)
-                    "local_file_path": local_file_path, # Actual path
-                    "url": file_info["url"], # Original download URL
-                    "size_bytes": file_info["size"],
-                    "created_at": file_info["created_at"],
-                    "modified_at": file_info["modified_at"],
-                    "filename": file_info["filename"],
-                    "course_id": course_id # Canvas course ID
-                })
-        print_status(f"Prepared {len(prepared_data)} files for Weaviate from course {course_id}.")
-        return prepared_data
+        return prepare_file_list_for_weaviate(files_raw, course_id, project_root)
 
     except FileNotFoundError:
         print_warning(f"Files JSON not found at {files_json_path}")
@@ -257,6 +288,47 @@ def prepare_files_for_weaviate(files_json_path: str, course_id: int, project_roo
         return []
 
 
+def prepare_file_list_for_weaviate(files_raw: list, course_id: int, project_root: str):
+    """
+    Prepares a list of Canvas file dicts (e.g. one page of the Canvas file list) for Weaviate.
+    Files that are not downloaded yet are skipped.
+
+    Args:
+        files_raw (list): Canvas file metadata dicts.
+        course_id (int): ID of the course to which the files belong.
+        project_root (str): Project root containing the Courses/ directory.
+
+    Returns:
+        list: A list of dictionaries containing extracted file data.
+    """
+    # Extract relevant fields
+    prepared_data = []
+    for file_info in files_raw:
+        if isinstance(file_info, dict) and all(key in file_info for key in ["id", "uuid", "display_name", "mime_class", "url", "size", "created_at", "modified_at", "filename"]):
+            local_file_path = os.path.join(project_root, "Courses", str(course_id), file_info["filename"])
+            
+            # Check if the local file actually exists
+            if not os.path.exists(local_file_path):
+                print_warning(f"File {file_info['filename']} not found locally at {local_file_path}. Skipping Weaviate prep for this file.")
+                continue
+
+            prepared_data.append({
+                "file_id": file_info["id"], # Canvas file ID
+                "canvas_file_uuid": file_info["uuid"], # Canvas's own UUID for the file
+                "display_name": file_info["display_name"],
+                "file_type": file_info.get("mime_class", "unknown"), # e.g., pdf, pptx (Canvas uses 'pdf', 'pptx' etc.)
+                "local_file_path": local_file_path, # Actual path
+                "url": file_info["url"], # Original download URL
+                "size_bytes": file_info["size"],
+                "created_at": file_info["created_at"],
+                "modified_at": file_info["modified_at"],
+                "filename": file_info["filename"],
+                "course_id": course_id # Canvas course ID
+            })
+    print_status(f"Prepared {len(prepared_data)} files for Weaviate from course {course_id}.")
+    return prepared_data
+
+
 def prepare_chunks_for_weaviate(chunks: list[str]):
     """
     Prepares chunk data for insertion into a Weaviate database.
@@ -295,7 +367,7 @@ def insert_courses_into_weaviate(client, courses_prepared_data: list):
     with courses_collection.batch.dynamic() as batch:
         for course_props in courses_prepared_data:
             # Generate a Weaviate-specific UUID based on Canvas course_id to ensure idempotency
-            weaviate_uuid = generate_uuid5(str(course_props["course_id"]), "Course")
+            weaviate_uuid = wvutil.generate_uuid5(str(course_props["course_id"]), "Course")
             batch.add_object(
                 properties=course_props,
                 uuid=weaviate_uuid
@@ -315,9 +387,9 @@ def check_if_chunks_exist_for_file(client, file_id: int, course_id: int) -> bool
     try:
         chunks_collection = client.collections.get("Chunk")
         response = chunks_collection.query.fetch_objects(
-            filters=Filter.all_of([
-                Filter.by_property("file_id").equal(file_id),
-                Filter.by_property("course_id").equal(course_id)
+            filters=wq.Filter.all_of([
+                wq.Filter.by_property("file_id").equal(file_id),
+                wq.Filter.by_property("course_id").equal(course_id)
             ]),
             limit=1
         )
@@ -327,128 +399,470 @@ def check_if_chunks_exist_for_file(client, file_id: int, course_id: int) -> bool
         return False 
 
 
-def insert_files_into_weaviate(client, files_prepared_data: list, course_id: int):
+def get_chunk_counts_by_file(client, course_id: int, max_files: int = 10000):
     """
-    Reads file data from a JSON file, prepares it, and inserts it into the Weaviate database.
+    Returns how many chunks each file of a course already has, using a single group-by aggregate.
 
     Args:
         client (weaviate.Client): The Weaviate client instance.
-        json_file_path (str): Path to the JSON file containing file data.
+        course_id (int): ID of the course to inspect.
+        max_files (int): Maximum number of file groups returned by the aggregate.
+
+    Returns:
+        dict: {file_id: chunk_count} for every file with at least one chunk, or None if the
+              aggregate query failed (callers should then fall back to check_if_chunks_exist_for_file).
+    """
+    try:
+        chunks_collection = client.collections.get("Chunk")
+        response = chunks_collection.aggregate.over_all(
+            filters=wq.Filter.by_property("course_id").equal(course_id),
+            group_by=wva.GroupByAggregate(prop="file_id", limit=max_files),
+            total_count=True
+        )
+        chunk_counts = {}
+        for group in response.groups:
+            if group.grouped_by.value is None or not group.total_count:
+                continue
+            chunk_counts[int(group.grouped_by.value)] = group.total_count
+        print_status(f"Found existing chunks for {len(chunk_counts)} files in course {course_id}.")
+        return chunk_counts
+    except Exception as e:
+        print_warning(f"Error aggregating chunk counts for course {course_id}: {e}")
+        return None
+
+
+def delete_chunks_for_files(client, course_id: int, file_ids: list, project_root: str = None) -> int:
+    """
+    Deletes every chunk belonging to the given files of a course, in Weaviate and in the local chunk store.
+
+    Args:
+        client (weaviate.Client): The Weaviate client instance.
+        course_id (int): ID of the course to which the files belong.
+        file_ids (list): Canvas file IDs whose chunks should be removed.
+        project_root (str): Project root containing Courses/, used to locate the chunk store.
+
+    Returns:
+        int: The number of chunk objects deleted.
+    """
+    if not file_ids:
+        return 0
+    try:
+        chunk_store = get_chunk_store(get_course_dir(course_id, project_root), create=False)
+        if chunk_store:
+            chunk_store.remove_files(file_ids)
+    except Exception as e:
+        print_warning(f"Error removing files {list(file_ids)} from the chunk store of course {course_id}: {e}")
+    try:
+        chunks_collection = client.collections.get("Chunk")
+        result = chunks_collection.data.delete_many(
+            where=wq.Filter.all_of([
+                wq.Filter.by_property("course_id").equal(course_id),
+                wq.Filter.by_property("file_id").contains_any(list(file_ids))
+            ])
+        )
+        print_status(f"Deleted {result.successful} chunks for {len(file_ids)} files in course {course_id}.")
+        return result.successful
+    except Exception as e:
+        print_warning(f"Error deleting chunks for files {list(file_ids)} in course {course_id}: {e}")
+        return 0
+
+
+def delete_files_from_weaviate(client, course_id: int, file_ids: list, project_root: str = None) -> int:
+    """
+    Deletes the given files of a course (File objects and all their chunks) from Weaviate.
+
+    Returns:
+        int: The number of chunk objects deleted.
+    """
+    if not file_ids:
+        return 0
+    deleted_chunks = delete_chunks_for_files(client, course_id, file_ids, project_root)
+    try:
+        files_collection = client.collections.get("File")
+        files_collection.data.delete_many(
+            where=wq.Filter.all_of([
+                wq.Filter.by_property("course_id").equal(course_id),
+                wq.Filter.by_property("file_id").contains_any(list(file_ids))
+            ])
+        )
+        print_status(f"Deleted {len(file_ids)} file objects from course {course_id}.")
+    except Exception as e:
+        print_warning(f"Error deleting file objects {list(file_ids)} in course {course_id}: {e}")
+    return deleted_chunks
+
+
+class WeaviateIngestSink:
+    """
+    Destination of run_ingest_pipeline that writes to the Weaviate File and Chunk collections.
+
+    A sink provides upsert_files(files_prepared_data, course_id), get_chunk_counts(course_id, file_ids)
+    and chunk_writer(failed_file_ids), a context manager yielding write(file_props, items, vectors) ->
+    number of failed chunks. Files whose chunks are only rejected once the writer closes are added to
+    failed_file_ids. Chunks of successfully written files are mirrored into the course's ChunkStore.
+    """
+
+    def __init__(self, client, chunk_store=None):
+        self.client = client
+        self.chunk_store = chunk_store
+
+    def upsert_files(self, files_prepared_data: list, course_id: int):
+        files_collection = self.client.collections.get("File")
+        with files_collection.batch.dynamic() as file_batch:
+            for file_props in files_prepared_data:
+                # Generate a Weaviate-specific UUID for the file object
+                file_batch.add_object(
+                    properties=file_props,
+                    uuid=wvutil.generate_uuid5(str(file_props["file_id"]), "File")
+                )
+        if len(files_collection.batch.failed_objects) > 0:
+            print_warning(f"Failed to import {len(files_collection.batch.failed_objects)} file objects for course {course_id}.")
+        else:
+            print_status(f"Successfully inserted/updated file metadata for course {course_id}.")
+
+    def get_chunk_counts(self, course_id: int, file_ids: list) -> dict:
+        # One aggregate query instead of a chunk probe per file
+        chunk_counts = get_chunk_counts_by_file(self.client, course_id)
+        if chunk_counts is None:
+            chunk_counts = {file_id: int(check_if_chunks_exist_for_file(self.client, file_id, course_id)) for file_id in file_ids}
+        return chunk_counts
+
+    @contextlib.contextmanager
+    def chunk_writer(self, failed_file_ids: set = None):
+        chunks_collection = self.client.collections.get("Chunk")
+        written_file_ids = set()
+        with chunks_collection.batch.dynamic() as chunk_batch:
+            def write(file_props: dict, file_items: list, file_vectors) -> int:
+                # batch.failed_objects is only filled in when the batch closes; number_errors is live
+                errors_before = chunk_batch.number_errors
+                for item, chunk_vector in zip(file_items, file_vectors):
+                    chunk_batch.add_object(
+                        properties=item["properties"],
+                        vector=chunk_vector,
+                        uuid=item["uuid"]
+                    )
+                # Send this file's chunks now so a later failure never loses them
+                chunk_batch.flush()
+                file_failed = chunk_batch.number_errors - errors_before
+                if not file_failed:
+                    written_file_ids.add(file_props["file_id"])
+                    if self.chunk_store is not None:
+                        try:
+                            self.chunk_store.put_file(file_props["file_id"], [item["properties"] for item in file_items])
+                        except Exception as e:
+                            print_warning(f"Could not write '{file_props['filename']}' to the chunk store: {e}")
+                return file_failed
+
+            yield write
+
+        # Objects rejected by the final flush when the batch closes
+        failed_objects = chunks_collection.batch.failed_objects
+        late_failed_ids = {failed.object_.properties.get("file_id") for failed in failed_objects} & written_file_ids
+        if late_failed_ids:
+            if self.chunk_store is not None:
+                self.chunk_store.remove_files(late_failed_ids)
+            if failed_file_ids is not None:
+                failed_file_ids.update(late_failed_ids)
+
+
+def insert_files_into_weaviate(client, files_prepared_data: list, course_id: int, **pipeline_options):
+    """
+    Inserts prepared files and their chunks into Weaviate.
+
+    Args:
+        client (weaviate.Client): The Weaviate client instance.
+        files_prepared_data (list): Prepared file dicts (see prepare_files_for_weaviate).
         course_id (int): ID of the course to which the files belong.
+        **pipeline_options: Passed to run_ingest_pipeline (embed_batch_size, use_cache, ...).
+
+    Returns:
+        set: IDs of the files that are fully indexed afterwards (see run_ingest_pipeline).
+
+    Each inserted file is also written to the course's local ChunkStore for context lookups.
     """
     if not files_prepared_data:
         print_status(f"No prepared file data to insert for course {course_id}.")
-        return
+        return set()
+    course_dir = os.path.dirname(files_prepared_data[0]["local_file_path"])
+    sink = WeaviateIngestSink(client, get_chunk_store(course_dir))
+    return run_ingest_pipeline(sink, files_prepared_data, course_id, **pipeline_options)
+
+
+def run_ingest_pipeline(sink, files_prepared_data: list, course_id: int, embed_batch_size: int = 64, embed_per_course: bool = False, reuse_sentence_vectors: bool = False,
+                        extraction_workers: int = None, extraction_timeout: float = 180.0, use_cache: bool = True,
+                        max_buffered_files: int = 4):
+    """
+    Extracts, chunks and embeds prepared files and writes them to a sink (see WeaviateIngestSink).
+
+    Args:
+        sink: Destination of the file metadata and chunks.
+        files_prepared_data (list): Prepared file dicts (see prepare_files_for_weaviate).
+        course_id (int): ID of the course to which the files belong.
+        embed_batch_size (int): Number of chunks encoded per model forward pass.
+        embed_per_course (bool): If True, chunks of every file are encoded together in one pass
+                                 after all files are chunked. Otherwise chunks are encoded per file.
+        reuse_sentence_vectors (bool): If True, use the pooled sentence embeddings produced by
+                                       semantic_chunking as chunk vectors and skip the second embedding pass.
+        extraction_workers (int): Worker processes used for text extraction (see iter_extract_text_parallel).
+                                  0 extracts on the calling thread.
+        extraction_timeout (float): Seconds a single file's text extraction may take before it is skipped.
+        use_cache (bool): If True, reuse and populate the course's on-disk IngestCache so unchanged
+                          files are never re-parsed or re-embedded.
+        max_buffered_files (int): How many embedded files may wait for insertion before chunking pauses.
+
+    Returns:
+        set: IDs of the files that are fully indexed afterwards: files written without a failed chunk,
+             files that already had chunks, and files of unsupported types or without any text (metadata
+             only). Files whose extraction failed or whose chunks failed to write are left out.
 
-    # Get the File collection
-    files_collection = client.collections.get("File")
+    Chunks are written file by file as soon as they are embedded, so memory stays bounded by
+    max_buffered_files and files that finished before a failure remain in the sink. Files that
+    already have chunks in the sink are skipped.
+    """
+    if not files_prepared_data:
+        print_status(f"No prepared file data to insert for course {course_id}.")
+        return set()
+
+    course_dir = os.path.dirname(files_prepared_data[0]["local_file_path"])
+    ingest_cache = None
+    if use_cache:
+        ingest_cache = IngestCache(course_dir, vector_mode="pooled" if reuse_sentence_vectors else "encoded")
+    file_hashes = {} # file_id -> content hash of files that need their chunk cache written
     
-    # Collect all chunks from all files first, then batch insert them
-    all_chunks_to_insert_with_vectors = []
-
-    # Go through each file and add it to the collection
-    with files_collection.batch.dynamic() as file_batch:
-        for file_props in files_prepared_data:
-            # Check if the file type is supported
-            file_extension = file_props.get("filename", "").split('.')[-1].lower()
-            supported_for_chunking = file_extension in ["pdf", "pptx", "docx", "txt"]
-            canvas_file_id = file_props["file_id"] # Get the Canvas file ID
-
-            if not supported_for_chunking:
-                print_status(f"File type '{file_extension}' for '{file_props['filename']}' is not supported for text chunking. Inserting metadata only.")
-
-            # Generate a Weaviate-specific UUID for the file object
-            weaviate_file_uuid = generate_uuid5(str(canvas_file_id), "File")
-            
-            file_batch.add_object(
-                properties=file_props, 
-                uuid=weaviate_file_uuid
+    # Chunk properties/uuids waiting to be embedded.
+    # Pending chunks that already carry a "vector" (pooled or cached) are not re-encoded.
+    pending_chunks = []
+
+    def embed_pending_chunks() -> list:
+        """Encodes the pending chunks and returns them grouped per file as (file_props, items, vectors)."""
+        if not pending_chunks:
+            return []
+        vectors = [item.pop("vector", None) for item in pending_chunks]
+        to_encode = [i for i, vector in enumerate(vectors) if vector is None]
+        if to_encode:
+            encoded = encode_texts_batched(
+                [pending_chunks[i]["properties"]["chunk_text"] for i in to_encode],
+                batch_size=embed_batch_size
             )
+            for row, i in enumerate(to_encode):
+                vectors[i] = encoded[row]
+        vectors = np.stack(vectors).astype(np.float32, copy=False)
+
+        # Chunks of one file are always contiguous in pending_chunks
+        rows_by_file = {}
+        for row, item in enumerate(pending_chunks):
+            rows_by_file.setdefault(item["properties"]["file_id"], []).append(row)
+
+        file_payloads = []
+        for file_id, rows in rows_by_file.items():
+            file_items = [pending_chunks[row] for row in rows]
+            file_vectors = vectors[rows[0]:rows[-1] + 1]
+            if ingest_cache and file_id in file_hashes:
+                ingest_cache.store_chunks(
+                    file_hashes.pop(file_id),
+                    [(item["properties"]["chunk_text"], item["properties"]["source_location"]) for item in file_items],
+                    file_vectors
+                )
+            file_payloads.append((file_items[0]["file_props"], file_items, file_vectors))
+        pending_chunks.clear()
+        return file_payloads
+
+    def add_pending_chunk(file_props: dict, chunk_index: int, chunk_text: str, location_str: str, vector=None):
+        canvas_file_id = file_props["file_id"]
+        chunk_full_props = {
+            "chunk_text": chunk_text,
+            "chunk_index": chunk_index, # Overall index within the file
+            "file_id": canvas_file_id, 
+            "course_id": course_id,
+            "file_name": file_props["filename"],
+            "source_location": location_str # Store the page/slide/para info
+        }
+        # Weaviate UUID for the chunk, ensuring uniqueness within the file
+        chunk_uuid = wvutil.generate_uuid5(f'{canvas_file_id}_{chunk_index}', "Chunk")
+        pending_chunk = {"properties": chunk_full_props, "uuid": chunk_uuid, "file_props": file_props}
+        if vector is not None:
+            pending_chunk["vector"] = vector
+        pending_chunks.append(pending_chunk)
+
+    sink.upsert_files(files_prepared_data, course_id)
+    existing_chunk_counts = sink.get_chunk_counts(course_id, [file_props["file_id"] for file_props in files_prepared_data])
+    ingested_file_ids = set()
+
+    # Files whose text still needs to be extracted, files whose cached segments only need chunking,
+    # and files whose cached chunks and vectors can be inserted as they are
+    files_to_extract = []
+    files_with_cached_segments = []
+    files_with_cached_chunks = []
+
+    # Go through each file and decide how its chunks are produced
+    for file_props in files_prepared_data:
+        # Check if the file type is supported
+        file_extension = file_props.get("filename", "").split('.')[-1].lower()
+        supported_for_chunking = file_extension in ["pdf", "pptx", "docx", "txt"]
+        canvas_file_id = file_props["file_id"] # Get the Canvas file ID
+
+        if not supported_for_chunking:
+            print_status(f"File type '{file_extension}' for '{file_props['filename']}' is not supported for text chunking. Only metadata inserted/updated.")
+            ingested_file_ids.add(canvas_file_id)
+            continue
+
+        if existing_chunk_counts.get(canvas_file_id, 0) > 0:
+            print_status(f"SKIPPING chunking: Chunks for file '{file_props['filename']}' (ID: {canvas_file_id}) already exist.")
+            ingested_file_ids.add(canvas_file_id)
+            continue
+
+        if ingest_cache:
+            try:
+                file_hash = compute_file_hash(file_props["local_file_path"])
+            except IOError as e:
+                print_warning(f"Could not hash {file_props['local_file_path']} for the ingest cache: {e}")
+                files_to_extract.append(file_props)
+                continue
+
+            cached_chunks = ingest_cache.load_chunks(file_hash)
+            if cached_chunks is not None:
+                print_status(f"CACHE HIT: Reusing {len(cached_chunks[0])} cached chunks and vectors for '{file_props['filename']}'.")
+                files_with_cached_chunks.append((file_props, cached_chunks))
+                continue
+
+            file_hashes[canvas_file_id] = file_hash
+            cached_segments = ingest_cache.load_segments(file_hash)
+            if cached_segments is not None:
+                print_status(f"CACHE HIT: Reusing cached text segments for '{file_props['filename']}'.")
+                files_with_cached_segments.append((file_props, cached_segments))
+                continue
+
+        files_to_extract.append(file_props)
+
+    def iter_segments_to_chunk():
+        yield from files_with_cached_segments
+
+        # Extract text in worker processes; files are chunked in the order they finish
+        print_status(f"Extracting text from {len(files_to_extract)} files for course {course_id}...")
+        extraction_results = iter_extract_text_parallel(
+            ((idx, file_props["local_file_path"]) for idx, file_props in enumerate(files_to_extract)),
+            max_workers=extraction_workers,
+            timeout_per_file=extraction_timeout
+        )
+        for file_idx, text_segments_with_locations in extraction_results:
+            file_props = files_to_extract[file_idx]
+            # Files without text are cached too, so they are not extracted again on every sync
+            if ingest_cache and text_segments_with_locations is not None and file_props["file_id"] in file_hashes:
+                ingest_cache.store_segments(file_hashes[file_props["file_id"]], text_segments_with_locations)
+            yield file_props, text_segments_with_locations
+
+    # Producer: extract, chunk and embed file by file. Consumer (this thread): stream each file's
+    # chunks into the sink's chunk writer. The bounded queue caps how many embedded files wait in memory.
+    file_queue = queue.Queue(maxsize=max_buffered_files)
+    stop_event = threading.Event()
+    producer_errors = []
+
+    def put_until_stopped(payload):
+        # Never block forever once the consumer has given up
+        while not stop_event.is_set():
+            try:
+                file_queue.put(payload, timeout=0.5)
+                return
+            except queue.Full:
+                continue
 
-            if supported_for_chunking:
-                if check_if_chunks_exist_for_file(client, canvas_file_id, course_id):
-                    print_status(f"SKIPPING chunking: Chunks for file '{file_props['filename']}' (ID: {canvas_file_id}) already exist in Weaviate.")
-                    continue
-                
-                print_status(f"Processing file for chunking: {file_props['local_file_path']}")
-                
-                # Extract text and create chunks
-                text_segments_with_locations: list[tuple[str, str]] = []
-                try:
-                    if file_extension == 'pdf':
-                        text_segments_with_locations = extractTextFromPdf(file_props["local_file_path"])
-                    elif file_extension == 'pptx':
-                        text_segments_with_locations = extractTextFromPPTX(file_props["local_file_path"])
-                    elif file_extension == 'docx':
-                        text_segments_with_locations = extractTextFromDocx(file_props["local_file_path"])
-                    elif file_extension == 'txt':
-                        text_segments_with_locations = extractTextFromTxt(file_props["local_file_path"])
-                except Exception as e:
-                    print_warning(f"Failed to extract text segments from {file_props['local_file_path']}: {e}")
-                    continue
+    def put_file_payloads(file_payloads: list):
+        for payload in file_payloads:
+            put_until_stopped(payload)
 
-                if not text_segments_with_locations:
-                    print_status(f"No text segments extracted from {file_props['filename']}. Skipping chunk insertion.")
+    def produce_chunks():
+        try:
+            for file_props, (cached_chunks, cached_vectors) in files_with_cached_chunks:
+                for chunk_index, (chunk_text, location_str) in enumerate(cached_chunks):
+                    add_pending_chunk(file_props, chunk_index, chunk_text, location_str, cached_vectors[chunk_index])
+                put_file_payloads(embed_pending_chunks())
+
+            for file_props, text_segments_with_locations in iter_segments_to_chunk():
+                if stop_event.is_set():
+                    return
+                if text_segments_with_locations is None:
+                    print_warning(f"Text extraction failed for {file_props['filename']}. Skipping chunk insertion.")
                     continue
-                
+
+                print_status(f"Chunking extracted text from: {file_props['local_file_path']}")
+
                 current_file_chunk_idx = 0 
                 for text_segment, location_str in text_segments_with_locations:
                     if not text_segment.strip():
                         continue
 
                     # Chunk the current text_segment
-                    segment_chunks_text = semantic_chunking(text_segment) 
-                    
-                    if not segment_chunks_text:
+                    if reuse_sentence_vectors:
+                        segment_chunks = semantic_chunking(text_segment, return_vectors=True)
+                    else:
+                        segment_chunks = [(chunk_text, None) for chunk_text in semantic_chunking(text_segment)]
+
+                    if not segment_chunks:
                         continue
-                    
-                    for chunk_text_from_segment in segment_chunks_text:
+
+                    for chunk_text_from_segment, pooled_vector in segment_chunks:
                         if not chunk_text_from_segment.strip(): # Ensure chunk itself is not empty
                             continue
-                        chunk_vector = encode_text(chunk_text_from_segment)
-                        if chunk_vector is None:
-                            print_warning(f"Could not encode chunk from {file_props['filename']} ({location_str}). Skipping.")
-                            continue
-                        
-                        chunk_full_props = {
-                            "chunk_text": chunk_text_from_segment,
-                            "chunk_index": current_file_chunk_idx, # Overall index within the file
-                            "file_id": canvas_file_id, 
-                            "course_id": course_id,
-                            "file_name": file_props["filename"],
-                            "source_location": location_str # Store the page/slide/para info
-                        }
-                        
-                        # Weaviate UUID for the chunk, ensuring uniqueness within the file
-                        chunk_uuid = generate_uuid5(f'{canvas_file_id}_{current_file_chunk_idx}', "Chunk")
-                        all_chunks_to_insert_with_vectors.append(
-                            {"properties": chunk_full_props, "vector": chunk_vector.tolist(), "uuid": chunk_uuid}
-                        )
+                        add_pending_chunk(file_props, current_file_chunk_idx, chunk_text_from_segment, location_str, pooled_vector)
                         current_file_chunk_idx += 1
-            else:
-                 print_status(f"File type '{file_extension}' for '{file_props['filename']}' is not supported for text chunking. Only metadata inserted/updated.")
-                    
-    if len(files_collection.batch.failed_objects) > 0:
-        print_warning(f"Failed to import {len(files_collection.batch.failed_objects)} file objects for course {course_id}.")
-    else:
-        print_status(f"Successfully inserted/updated file metadata for course {course_id}.")
 
-    # Batch insert all collected chunks
-    if all_chunks_to_insert_with_vectors:
-        chunks_collection = client.collections.get("Chunk")
-        with chunks_collection.batch.dynamic() as chunk_batch:
-            for item in all_chunks_to_insert_with_vectors:
-                chunk_batch.add_object(
-                    properties=item["properties"],
-                    vector=item["vector"],
-                    uuid=item["uuid"]
-                )
-        if len(chunks_collection.batch.failed_objects) > 0:
-            print_warning(f"Failed to import {len(chunks_collection.batch.failed_objects)} chunk objects for course {course_id}.")
-        else:
-            print_status(f"Successfully inserted {len(all_chunks_to_insert_with_vectors)} chunk objects for course {course_id}.")
-    else:
+                if current_file_chunk_idx == 0:
+                    # Nothing to index (e.g. a scanned PDF); the file metadata alone makes it complete
+                    print_status(f"No text chunks produced from {file_props['filename']}. Only metadata inserted/updated.")
+                    ingested_file_ids.add(file_props["file_id"])
+                    continue
+
+                if not embed_per_course:
+                    put_file_payloads(embed_pending_chunks())
+
+            # Encode whatever is still pending (everything, when embedding per course)
+            put_file_payloads(embed_pending_chunks())
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            put_until_stopped(None)
+
+    producer = threading.Thread(target=produce_chunks, daemon=True)
+    producer.start()
+
+    files_inserted = 0
+    chunks_inserted = 0
+    chunks_failed = 0
+    late_failed_file_ids = set()
+    try:
+        with sink.chunk_writer(late_failed_file_ids) as write_file_chunks:
+            while True:
+                payload = file_queue.get()
+                if payload is None:
+                    break
+                file_props, file_items, file_vectors = payload
+                file_failed = write_file_chunks(file_props, file_items, file_vectors)
+
+                files_inserted += 1
+                chunks_inserted += len(file_items) - file_failed
+                chunks_failed += file_failed
+                if file_failed:
+                    print_warning(f"Failed to import {file_failed} of {len(file_items)} chunks for '{file_props['filename']}'.")
+                else:
+                    ingested_file_ids.add(file_props["file_id"])
+                    print_status(f"Inserted {len(file_items)} chunks for '{file_props['filename']}' ({files_inserted} files, {chunks_inserted} chunks so far).")
+    finally:
+        stop_event.set()
+        producer.join()
+
+    if producer_errors:
+        raise producer_errors[0]
+
+    if late_failed_file_ids:
+        print_warning(f"Chunks of {len(late_failed_file_ids)} files were rejected when the batch closed; they are not counted as indexed.")
+        ingested_file_ids -= late_failed_file_ids
+
+    if chunks_failed > 0:
+        print_warning(f"Failed to import {chunks_failed} chunk objects for course {course_id}.")
+    if chunks_inserted > 0:
+        print_status(f"Successfully inserted {chunks_inserted} chunk objects from {files_inserted} files for course {course_id}.")
+    elif chunks_failed == 0:
         print_status(f"No chunks were prepared for insertion for course {course_id}.")
+    return ingested_file_ids
 
 
 def pull_files_from_weaviate(client, course_id: int):
@@ -465,7 +879,7 @@ def pull_files_from_weaviate(client, course_id: int):
     # Get the course object
     try:
         response = collection.query.fetch_objects(
-            filters=wq.Filter.by_property("course_id").equal(course_id) # Use wq.Filter
+            filters=wq.Filter.by_property("course_id").equal(course_id)
         )
         return response.objects
     except Exception as e:
@@ -491,7 +905,111 @@ def verify_objects_in_collection(client, collection_name: str):
         print_warning(f"Error querying collection '{collection_name}': {e}")
 
 
-def search_weaviate(client, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = 0.5, context_window: int = 1):
+def neighbor_chunk_uuids(matched_chunks: list, context_window: int) -> list:
+    """
+    Returns the deterministic UUIDs of the chunks within context_window of each match.
+
+    Args:
+        matched_chunks (list): Weaviate result objects with file_id and chunk_index properties.
+        context_window (int): Number of chunks before and after each match.
+
+    Returns:
+        list: Neighbor chunk UUIDs, without duplicates and without the matches themselves.
+    """
+    matched_uuids = {str(matched_chunk.uuid) for matched_chunk in matched_chunks}
+    neighbor_uuids = {}
+    for matched_chunk in matched_chunks:
+        original_file_id = matched_chunk.properties.get('file_id')
+        original_chunk_index = matched_chunk.properties.get('chunk_index')
+        if original_file_id is None or original_chunk_index is None:
+            print_warning(f"Skipping context for chunk {matched_chunk.uuid} due to missing file_id or chunk_index.")
+            continue
+
+        # Overlapping windows of nearby matches collapse onto the same UUIDs
+        first_index = max(0, original_chunk_index - context_window)
+        for chunk_index in range(first_index, original_chunk_index + context_window + 1):
+            chunk_uuid = wvutil.generate_uuid5(f'{original_file_id}_{chunk_index}', "Chunk")
+            if chunk_uuid not in matched_uuids:
+                neighbor_uuids.setdefault(chunk_uuid, None)
+    return list(neighbor_uuids)
+
+
+def fetch_neighbor_chunks(chunks_collection, matched_chunks: list, context_window: int, course_id: int = None) -> list:
+    """
+    Fetches the context chunks around the matches with a single fetch_objects query.
+
+    Chunk UUIDs are generate_uuid5(f'{file_id}_{chunk_index}', "Chunk"), so neighbor UUIDs are
+    computed client-side and looked up with one contains_any filter on the object ID. UUIDs past
+    the end of a file simply match nothing.
+
+    Returns:
+        list: The neighbor chunk objects that exist.
+    """
+    neighbor_query = build_neighbor_query(matched_chunks, context_window, course_id)
+    if neighbor_query is None:
+        return []
+    response = chunks_collection.query.fetch_objects(**neighbor_query)
+    return response.objects
+
+
+def build_neighbor_query(matched_chunks: list, context_window: int, course_id: int = None):
+    """Returns the fetch_objects keyword arguments (filters, limit) for the neighbors of the matches, or None."""
+    if context_window <= 0:
+        return None
+    neighbor_uuids = neighbor_chunk_uuids(matched_chunks, context_window)
+    if not neighbor_uuids:
+        return None
+
+    neighbor_filters = wq.Filter.by_id().contains_any(neighbor_uuids)
+    if course_id is not None:
+        neighbor_filters = neighbor_filters & wq.Filter.by_property("course_id").equal(course_id)
+    return {"filters": neighbor_filters, "limit": len(neighbor_uuids)}
+
+
+def collect_local_context(matched_chunks: list, chunk_store, context_window: int, chunks_by_uuid: dict) -> list:
+    """
+    Adds the context windows that the course's ChunkStore can resolve to chunks_by_uuid.
+
+    Returns:
+        list: The matches whose context still has to be fetched from Weaviate.
+    """
+    remote_matches = []
+    for matched_chunk in matched_chunks:
+        file_id = matched_chunk.properties.get('file_id')
+        chunk_index = matched_chunk.properties.get('chunk_index')
+        if chunk_store is None or chunk_index is None or not chunk_store.has_file(file_id):
+            remote_matches.append(matched_chunk)
+            continue
+        for neighbor_chunk in chunk_store.get_window(file_id, chunk_index, context_window):
+            chunks_by_uuid.setdefault(str(neighbor_chunk.uuid), neighbor_chunk)
+    return remote_matches
+
+
+def sort_chunks_by_position(chunks) -> list:
+    """Sorts chunks by file_id and then chunk_index."""
+    return sorted(
+        chunks,
+        key=lambda c: (c.properties.get('file_id', float('inf')), c.properties.get('chunk_index', float('inf')))
+    )
+
+
+def weaviate_fusion_type(fusion: str):
+    """Maps a hybrid_fusion method name to Weaviate's HybridFusion enum."""
+    if fusion == hybrid_fusion.FUSION_RRF:
+        return wq.HybridFusion.RANKED
+    if fusion == hybrid_fusion.FUSION_RELATIVE_SCORE:
+        return wq.HybridFusion.RELATIVE_SCORE
+    raise ValueError(f"Unknown fusion method '{fusion}', expected one of {hybrid_fusion.FUSION_METHODS}")
+
+
+def resolve_hybrid_settings(course_id: int, project_root: str, alpha_hybrid: float = None, fusion: str = None):
+    """Returns (alpha, fusion) for a search, falling back to the course's search settings."""
+    course_dir = get_course_dir(course_id, project_root) if course_id is not None else None
+    return hybrid_fusion.resolve_search_settings(course_dir, alpha_hybrid, fusion)
+
+
+def search_weaviate(client, query_text: str, course_id: int = None, limit: int = 10, alpha_hybrid: float = None, context_window: int = 1,
+                    project_root: str = None, fusion: str = None):
     """
     Performs a search in the Weaviate "Chunk" collection.
     Can perform a hybrid search or a pure vector search based on alpha_hybrid.
@@ -503,8 +1021,12 @@ def search_weaviate(client, query_text: str, course_id: int = None, limit: int =
         course_id: Optional course ID to filter by.
         limit: The number of primary results to return from the initial search.
         alpha_hybrid: The alpha value for hybrid search (0 for keyword, 1 for vector, 0.5 for balanced).
+                      None uses the course's search settings.
         context_window: Number of chunks before and after each primary match to retrieve as context.
                        Set to 0 to disable context retrieval.
+        project_root: Project root containing Courses/. Context chunks of files in the course's local
+                      ChunkStore are read from disk; only the remaining ones are fetched from Weaviate.
+        fusion: "relative_score" or "rrf" (see hybrid_fusion); None uses the course's search settings.
 
     Returns:
         A list of Weaviate result objects (hydrated with properties), sorted by file_id and chunk_index.
@@ -518,24 +1040,29 @@ def search_weaviate(client, query_text: str, course_id: int = None, limit: int =
         
         filters = None
         if course_id is not None:
-            filters = Filter.by_property("course_id").equal(course_id)
+            filters = wq.Filter.by_property("course_id").equal(course_id)
 
-        print_status(f"Searching for '{query_text}' with limit {limit}, course_id {course_id}, context_window {context_window}")
+        alpha_hybrid, fusion = resolve_hybrid_settings(course_id, project_root, alpha_hybrid, fusion)
+        print_status(f"Searching for '{query_text}' with limit {limit}, course_id {course_id}, context_window {context_window}, alpha {alpha_hybrid}, fusion {fusion}")
 
         # Generate query vector since the collection has no built-in vectorizer
-        query_vector = encode_text(query_text)
+        query_vector = encode_query(query_text)
         if query_vector is None:
             print_warning(f"Could not generate vector for query: {query_text}")
             return []
 
-        # Perform initial search (hybrid or vector)
+        # Perform initial search (hybrid or vector); Weaviate fuses the keyword and vector results server-side
+        start_time = time.perf_counter()
         initial_response = chunks_collection.query.hybrid(
             query=query_text,
             vector=query_vector.tolist(),
             alpha=alpha_hybrid, # 0 (keyword) to 1 (vector)
+            fusion_type=weaviate_fusion_type(fusion),
             limit=limit,
             filters=filters,
+            return_metadata=wq.MetadataQuery(score=True), # Kept so prompts can be packed by relevance
         )
+        print_status(f"Hybrid retrieval and fusion took {(time.perf_counter() - start_time) * 1000:.1f} ms.")
         
         initial_matches = initial_response.objects
         if not initial_matches:
@@ -546,70 +1073,27 @@ def search_weaviate(client, query_text: str, course_id: int = None, limit: int =
             print_status(f"Context window is 0, returning {len(initial_matches)} primary matches.")
             return initial_matches 
 
-        all_relevant_chunks_map = {} # Use UUID as key to remove duplicates
+        start_time = time.perf_counter()
+        all_relevant_chunks_map = {str(matched_chunk.uuid): matched_chunk for matched_chunk in initial_matches} # Use UUID as key to remove duplicates
 
-        # Add primary matches and fetch context
-        for matched_chunk in initial_matches:
-            if matched_chunk.uuid not in all_relevant_chunks_map:
-                all_relevant_chunks_map[matched_chunk.uuid] = matched_chunk
-            
-            # Fetch context for this matched_chunk
-            try:
-                original_file_id = matched_chunk.properties.get('file_id')
-                original_chunk_index = matched_chunk.properties.get('chunk_index')
+        chunk_store = None
+        if course_id is not None:
+            chunk_store = get_chunk_store(get_course_dir(course_id, project_root), create=False)
 
-                if original_file_id is None or original_chunk_index is None:
-                    print_warning(f"Skipping context for chunk {matched_chunk.uuid} due to missing file_id or chunk_index.")
-                    continue
+        # Resolve context windows from the local chunk store where possible
+        remote_matches = collect_local_context(initial_matches, chunk_store, context_window, all_relevant_chunks_map)
 
-                for i in range(1, context_window + 1):
-                    # Previous chunks
-                    prev_chunk_idx_to_find = original_chunk_index - i
-                    if prev_chunk_idx_to_find >= 0:
-                        neighbor_filters_prev = Filter.all_of([
-                            Filter.by_property("file_id").equal(original_file_id),
-                            Filter.by_property("chunk_index").equal(prev_chunk_idx_to_find)
-                        ])
-                        if course_id is not None: # Add course_id filter if specified for main query
-                            if neighbor_filters_prev.filters is None: # Should not happen with Filter.all_of
-                                neighbor_filters_prev.filters = []
-                            neighbor_filters_prev.filters.append(Filter.by_property("course_id").equal(course_id))
-                            
-                        neighbor_response_prev = chunks_collection.query.fetch_objects(
-                            filters=neighbor_filters_prev,
-                            limit=1
-                        )
-                        if neighbor_response_prev.objects:
-                            prev_neighbor = neighbor_response_prev.objects[0]
-                            if prev_neighbor.uuid not in all_relevant_chunks_map:
-                                all_relevant_chunks_map[prev_neighbor.uuid] = prev_neighbor
-                    
-                    # Next chunks
-                    next_chunk_idx_to_find = original_chunk_index + i
-                    neighbor_filters_next = Filter.all_of([
-                        Filter.by_property("file_id").equal(original_file_id),
-                        Filter.by_property("chunk_index").equal(next_chunk_idx_to_find)
-                    ])
-                    if course_id is not None: # Add course_id filter
-                        neighbor_filters_next.filters.append(Filter.by_property("course_id").equal(course_id))
-
-                    neighbor_response_next = chunks_collection.query.fetch_objects(
-                        filters=neighbor_filters_next,
-                        limit=1
-                    )
-                    if neighbor_response_next.objects:
-                        next_neighbor = neighbor_response_next.objects[0]
-                        if next_neighbor.uuid not in all_relevant_chunks_map:
-                             all_relevant_chunks_map[next_neighbor.uuid] = next_neighbor
+        # Fetch every remaining neighbor in one query
+        if remote_matches:
+            try:
+                for neighbor_chunk in fetch_neighbor_chunks(chunks_collection, remote_matches, context_window, course_id):
+                    all_relevant_chunks_map.setdefault(str(neighbor_chunk.uuid), neighbor_chunk)
             except Exception as e_context:
-                print_warning(f"Error fetching context for chunk {matched_chunk.uuid}: {e_context}")
-
+                print_warning(f"Error fetching context chunks: {e_context}")
 
         # Sort all collected chunks (primary + context) by file_id and then chunk_index
-        final_sorted_chunks = sorted(
-            list(all_relevant_chunks_map.values()),
-            key=lambda c: (c.properties.get('file_id', float('inf')), c.properties.get('chunk_index', float('inf')))
-        )
+        final_sorted_chunks = sort_chunks_by_position(all_relevant_chunks_map.values())
+        print_status(f"Context lookup took {(time.perf_counter() - start_time) * 1000:.1f} ms.")
         
         print_status(f"Returning {len(final_sorted_chunks)} chunks (primary matches + context), sorted.")
         return final_sorted_chunks
@@ -617,9 +1101,191 @@ def search_weaviate(client, query_text: str, course_id: int = None, limit: int =
     except Exception as e:
         print_warning(f"Error during search in Weaviate: {e}")
         return []
+
+
+async def search_weaviate_async(async_client, query_text: str, query_vector, course_id: int = None, limit: int = 10, alpha_hybrid: float = None,
+                                context_window: int = 1, project_root: str = None, fusion: str = None):
+    """
+    Async version of search_weaviate for a connected WeaviateAsyncClient.
+
+    Args:
+        async_client: The connected weaviate.WeaviateAsyncClient.
+        query_text: The text to search for.
+        query_vector: The query embedding (see encode_query).
+        course_id, limit, alpha_hybrid, context_window, project_root, fusion: As in search_weaviate.
+
+    Returns:
+        A list of result objects, sorted by file_id and chunk_index.
+
+    Context windows are read from the local ChunkStore on a worker thread while the
+    neighbors of the remaining matches are fetched from Weaviate.
+    """
+    import asyncio
+
+    chunks_collection = async_client.collections.get("Chunk")
+    filters = wq.Filter.by_property("course_id").equal(course_id) if course_id is not None else None
+
+    alpha_hybrid, fusion = resolve_hybrid_settings(course_id, project_root, alpha_hybrid, fusion)
+    print_status(f"Searching (async) for '{query_text}' with limit {limit}, course_id {course_id}, context_window {context_window}, alpha {alpha_hybrid}, fusion {fusion}")
+    start_time = time.perf_counter()
+    initial_response = await chunks_collection.query.hybrid(
+        query=query_text,
+        vector=query_vector.tolist(),
+        alpha=alpha_hybrid,
+        fusion_type=weaviate_fusion_type(fusion),
+        limit=limit,
+        filters=filters,
+        return_metadata=wq.MetadataQuery(score=True),
+    )
+    print_status(f"Hybrid retrieval and fusion took {(time.perf_counter() - start_time) * 1000:.1f} ms.")
+    initial_matches = initial_response.objects
+    if not initial_matches or context_window == 0:
+        return initial_matches
+
+    start_time = time.perf_counter()
+    all_relevant_chunks_map = {str(matched_chunk.uuid): matched_chunk for matched_chunk in initial_matches}
+    chunk_store = get_chunk_store(get_course_dir(course_id, project_root), create=False) if course_id is not None else None
+
+    # Matches of files in the chunk store never need a network round trip
+    local_matches, remote_matches = [], []
+    for matched_chunk in initial_matches:
+        is_local = (chunk_store is not None and matched_chunk.properties.get('chunk_index') is not None
+                    and chunk_store.has_file(matched_chunk.properties.get('file_id')))
+        (local_matches if is_local else remote_matches).append(matched_chunk)
+
+    async def fetch_remote_neighbors():
+        neighbor_query = build_neighbor_query(remote_matches, context_window, course_id)
+        if neighbor_query is None:
+            return []
+        try:
+            response = await chunks_collection.query.fetch_objects(**neighbor_query)
+            return response.objects
+        except Exception as e_context:
+            print_warning(f"Error fetching context chunks: {e_context}")
+            return []
+
+    local_chunks = {}
+    _, remote_neighbors = await asyncio.gather(
+        asyncio.to_thread(collect_local_context, local_matches, chunk_store, context_window, local_chunks),
+        fetch_remote_neighbors()
+    )
+    for neighbor_chunk in list(local_chunks.values()) + list(remote_neighbors):
+        all_relevant_chunks_map.setdefault(str(neighbor_chunk.uuid), neighbor_chunk)
+
+    final_sorted_chunks = sort_chunks_by_position(all_relevant_chunks_map.values())
+    print_status(f"Context lookup took {(time.perf_counter() - start_time) * 1000:.1f} ms.")
+    print_status(f"Returning {len(final_sorted_chunks)} chunks (primary matches + context), sorted.")
+    return final_sorted_chunks
     
     
-def generate_prompt_for_llm(query_text: str, search_results: list, max_context_chunks: int = 5):
+def estimate_token_count(text: str) -> int:
+    """Rough LLM token estimate (about 4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def _trim_overlap(previous_text: str, next_text: str, max_overlap: int = 300) -> str:
+    """Drops the start of next_text that repeats the end of previous_text."""
+    for overlap in range(min(len(previous_text), len(next_text), max_overlap), 20, -1):
+        if previous_text.endswith(next_text[:overlap]):
+            return next_text[overlap:].lstrip()
+    return next_text
+
+
+def pack_context_spans(search_results: list, max_context_tokens: int = 3000, max_context_chunks: int = None) -> list:
+    """
+    Packs search results into a token budget, most relevant first.
+
+    Consecutive chunks of the same file (a primary match and its context window, or overlapping
+    windows of nearby matches) are merged into one span. A span's score is the best relevance
+    score among its chunks (context chunks carry none). Repeated text between neighbors and
+    spans whose text is already packed are dropped. Spans are then added greedily by score
+    while they fit the budget; a span that does not fit is reduced to its best chunk.
+
+    Args:
+        search_results (list): Result objects from search_weaviate (uuid, properties, metadata.score).
+        max_context_tokens (int): Token budget for the packed context (see estimate_token_count).
+        max_context_chunks (int): Optional cap on the total number of chunks packed.
+
+    Returns:
+        list[dict]: Spans with "file_id", "file_name", "locations", "text", "score", "chunk_count",
+                    "token_count", ordered by descending score.
+    """
+    def chunk_score(result):
+        metadata = getattr(result, "metadata", None)
+        score = getattr(metadata, "score", None) if metadata is not None else None
+        return score if score is not None else float("-inf")
+
+    ordered_results = sorted(
+        search_results,
+        key=lambda r: (r.properties.get('file_id', float('inf')), r.properties.get('chunk_index', float('inf')))
+    )
+
+    # Group runs of consecutive chunks of the same file
+    runs = []
+    for result in ordered_results:
+        file_id = result.properties.get('file_id')
+        chunk_index = result.properties.get('chunk_index')
+        previous = runs[-1][-1] if runs else None
+        if (previous is not None and file_id is not None and chunk_index is not None
+                and previous.properties.get('file_id') == file_id
+                and previous.properties.get('chunk_index') is not None
+                and chunk_index - previous.properties.get('chunk_index') <= 1):
+            if chunk_index != previous.properties.get('chunk_index'):
+                runs[-1].append(result)
+        else:
+            runs.append([result])
+
+    def make_span(chunks):
+        text = ""
+        locations = []
+        for chunk in chunks:
+            chunk_text = chunk.properties.get('chunk_text', '').strip()
+            text = f"{text}\n{_trim_overlap(text, chunk_text)}" if text else chunk_text
+            location = chunk.properties.get('source_location', 'Location N/A')
+            if location not in locations:
+                locations.append(location)
+        best_score = max(chunk_score(chunk) for chunk in chunks)
+        return {
+            "file_id": chunks[0].properties.get('file_id'),
+            "file_name": chunks[0].properties.get('file_name', 'Unknown File'),
+            "locations": locations,
+            "text": text,
+            "score": None if best_score == float("-inf") else best_score,
+            "chunk_count": len(chunks),
+            "token_count": estimate_token_count(text),
+            "_sort_score": best_score,
+            "_best_chunk": max(chunks, key=chunk_score),
+        }
+
+    # Unscored runs keep their relative order thanks to the stable sort
+    candidate_spans = sorted((make_span(run) for run in runs), key=lambda span: span["_sort_score"], reverse=True)
+
+    packed_spans = []
+    packed_texts = []
+    used_tokens = 0
+    used_chunks = 0
+    for span in candidate_spans:
+        if span["token_count"] > max_context_tokens - used_tokens or (
+                max_context_chunks is not None and used_chunks + span["chunk_count"] > max_context_chunks):
+            span = make_span([span["_best_chunk"]])
+            if span["token_count"] > max_context_tokens - used_tokens or (
+                    max_context_chunks is not None and used_chunks + 1 > max_context_chunks):
+                continue
+        normalized_text = " ".join(span["text"].split())
+        if not normalized_text or any(normalized_text in packed_text for packed_text in packed_texts):
+            continue
+        packed_texts.append(normalized_text)
+        packed_spans.append(span)
+        used_tokens += span["token_count"]
+        used_chunks += span["chunk_count"]
+
+    for span in packed_spans:
+        del span["_sort_score"], span["_best_chunk"]
+    print_status(f"Packed {len(packed_spans)} spans ({used_chunks} chunks, ~{used_tokens} tokens) from {len(search_results)} search results.")
+    return packed_spans
+
+
+def generate_prompt_for_llm(query_text: str, search_results: list, max_context_chunks: int = 5, max_context_tokens: int = 3000):
     """
     Generates a prompt string for a large language model (LLM) like Gemini,
     including the user's query and context from search results.
@@ -628,6 +1294,7 @@ def generate_prompt_for_llm(query_text: str, search_results: list, max_context_c
         query_text (str): The original user query.
         search_results (list): A list of Weaviate result objects (chunks).
         max_context_chunks (int): The maximum number of search result chunks to include in the context.
+        max_context_tokens (int): Token budget for the context (see pack_context_spans).
 
     Returns:
         str: The generated prompt string.
@@ -644,20 +1311,12 @@ def generate_prompt_for_llm(query_text: str, search_results: list, max_context_c
         return prompt
 
     context_str_parts = ["Context from relevant documents:"]
-    for i, res_obj in enumerate(search_results[:max_context_chunks]):
-        try:
-            chunk_text = res_obj.properties.get('chunk_text', 'N/A')
-            file_name = res_obj.properties.get('file_name', 'Unknown File')
-            source_loc = res_obj.properties.get('source_location', 'Location N/A') 
-            
-            context_str_parts.append("---")
-            context_str_parts.append(f"Source Document: {file_name} ({source_loc})") 
-            context_str_parts.append("Content:")
-            context_str_parts.append(chunk_text)
-        except Exception as e:
-            print_warning(f"Error processing search result for prompt generation: {e}")
-            context_str_parts.append("---")
-            context_str_parts.append("[Error processing one of the context chunks]")
+    for span in pack_context_spans(search_results, max_context_tokens=max_context_tokens, max_context_chunks=max_context_chunks):
+        source_loc = span["locations"][0] if len(span["locations"]) == 1 else f"{span['locations'][0]} - {span['locations'][-1]}"
+        context_str_parts.append("---")
+        context_str_parts.append(f"Source Document: {span['file_name']} ({source_loc})") 
+        context_str_parts.append("Content:")
+        context_str_parts.append(span["text"])
 
     context_str = "\n".join(context_str_parts)
 